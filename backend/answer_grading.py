@@ -0,0 +1,271 @@
+import asyncio
+import html
+import logging
+import os
+import re
+import unicodedata
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from chunking import split_into_chunks, estimate_tokens
+from metrics import answer_grading
+from tokens import CJK_PATTERN, tokenize
+from ulits import llm_generate, extract_html_fragment
+
+logger = logging.getLogger(__name__)
+
+# 加载环境变量
+load_dotenv()
+ANSWER_FUZZY_MIN_WORD = int(os.getenv("ANSWER_FUZZY_MIN_WORD", "6"))  # 英文单词不短于该长度才容忍拼写错误
+ANSWER_OBJECTIVE_MAX_CHARS = int(os.getenv("ANSWER_OBJECTIVE_MAX_CHARS", "30"))  # 标准答案（归一化后）不超过该长度才按客观题模糊匹配
+ANSWER_CONTEXT_TOKENS = int(os.getenv("ANSWER_CONTEXT_TOKENS", "400"))  # 每道题附带的笔记摘录 token 上限
+EXCERPT_TOKENS = 200  # 摘录候选段落的 token 上限
+
+_ANSWER_PREFIX = re.compile(r"^\s*(?:正确答案|标准答案|答案|答|选)\s*[:：]?\s*")
+_CHOICE_ANSWER = re.compile(r"^([A-H](?:\s*[,，、/和及与]?\s*[A-H])*)\s*(?:[.．、:：)）\s]|$)")
+_CHOICE_OPTIONS = re.compile(r"(?:^|[\s(（])[A-D]\s*[.．、:：)）]")
+_LIST_SEPARATORS = re.compile(r"[、,，;；]")  # 只有标准答案中写明了这些分隔符才按列举项比较
+_TRAILING_PUNCTUATION = re.compile(r"[.,;!?。，、；！？…]+$")
+_NEGATION = re.compile(r"不|没|非|未|无|否|\bnot\b|\bno\b")
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?")
+_WORD = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+
+
+def _prepare(text) -> str:
+    text = unicodedata.normalize("NFKC", str(text or "")).lower().replace("\u2212", "-")
+    return _ANSWER_PREFIX.sub("", text)
+
+
+def normalize_answer(text) -> str:
+    """
+    全角转半角、忽略大小写与空白，去掉句末标点及“答案：”前缀，用于精确比较
+    其余符号全部保留：1/2 与 12、C# 与 C、50% 与 50、-5 与 5 都不相同
+    """
+    return _TRAILING_PUNCTUATION.sub("", re.sub(r"\s+", "", _prepare(text)))
+
+
+def _numbers(text: str) -> list:
+    """按出现顺序取出数字（带符号与小数），1.50 与 1.5 视为相同"""
+    numbers = []
+    for number in _NUMBER.findall(_prepare(text)):
+        number = number.lstrip("+")
+        if "." in number:
+            number = number.rstrip("0").rstrip(".")
+        numbers.append(number)
+    return numbers
+
+
+def _is_typo(a: str, b: str) -> bool:
+    """
+    两个较长的英文单词是否只差一处常见笔误：相邻字母对调（recieve），或少写 / 多写一个重复字母（occured）
+    替换字母不算笔误，principal / principle、complement / compliment 这类词是不同的词
+    """
+    if a == b:
+        return True
+    if min(len(a), len(b)) < ANSWER_FUZZY_MIN_WORD or not (a.isalpha() and b.isalpha()):
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if abs(len(a) - len(b)) != 1:
+        return False
+    short, long = sorted((a, b), key=len)
+    i = next((i for i in range(len(short)) if short[i] != long[i]), len(short))
+    if long[:i] + long[i + 1:] != short:
+        return False
+    # 多出的字母必须与相邻字母相同
+    return (i > 0 and long[i] == long[i - 1]) or (i + 1 < len(long) and long[i] == long[i + 1])
+
+
+def _fuzzy_match(user_answer: str, correct_answer: str) -> bool:
+    """
+    只对英文答案容忍拼写错误：单词个数与顺序必须一致，逐词比较只允许较长单词有笔误
+    中日韩答案一字之差往往意思不同（公元前 / 公元），增删整词也会改变含义（O(log n) / O(n log n)），都交给模型判断
+    """
+    if CJK_PATTERN.search(correct_answer) or CJK_PATTERN.search(user_answer):
+        return False
+    # 符号与数字必须完全一致（O(n^2) / O(n2)、C# / C），只容忍字母上的笔误
+    if re.sub(r"[a-z]", "", normalize_answer(user_answer)) != re.sub(r"[a-z]", "", normalize_answer(correct_answer)):
+        return False
+    user_words, correct_words = _WORD.findall(_prepare(user_answer)), _WORD.findall(_prepare(correct_answer))
+    if not correct_words or len(user_words) != len(correct_words):
+        return False
+    return all(_is_typo(u, c) for u, c in zip(user_words, correct_words))
+
+
+def _choice_letters(text: str) -> Optional[frozenset]:
+    match = _CHOICE_ANSWER.match(_ANSWER_PREFIX.sub("", unicodedata.normalize("NFKC", text)).strip().upper())
+    return frozenset(re.findall(r"[A-H]", match.group(1))) if match else None
+
+
+def _option_texts(question: str, letters: frozenset) -> set:
+    """从题干中取出各正确选项的内容（如“B. 叶子节点”中的“叶子节点”）"""
+    texts = set()
+    for letter in letters:
+        match = re.search(rf"(?:^|[\s(（]){letter}\s*[.．、:：)）]\s*(.+?)(?=[\s(（][A-H]\s*[.．、:：)）]|$)",
+                          unicodedata.normalize("NFKC", question), re.DOTALL)
+        if match and normalize_answer(match.group(1)):
+            texts.add(normalize_answer(match.group(1)))
+    return texts
+
+
+def _list_items(text: str) -> frozenset:
+    items = (normalize_answer(part) for part in _LIST_SEPARATORS.split(unicodedata.normalize("NFKC", text)))
+    return frozenset(item for item in items if item)
+
+
+def grade_answer(question: str, user_answer: str, correct_answer: str) -> Optional[str]:
+    """
+    本地判定客观题：回答正确时返回判定方式（exact/choice/set/fuzzy），无法判定或回答错误时返回 None
+    选择题按选项字母比较；填空等短答案比较归一化文本、列举项集合与英文拼写错误；长答案只认归一化后完全一致
+    宁可交给模型分析，也不能把错误的回答判为正确
+    """
+    user, correct = normalize_answer(user_answer), normalize_answer(correct_answer)
+    if not user or not correct:
+        return None
+    if user == correct:
+        return "exact"
+    if _CHOICE_OPTIONS.search(question or ""):
+        expected = _choice_letters(correct_answer)
+        if expected is not None:
+            # 回答选项字母，或单选题只写了正确选项的内容
+            if _choice_letters(user_answer) == expected:
+                return "choice"
+            option_texts = _option_texts(question, expected)
+            option_texts.add(normalize_answer(_CHOICE_ANSWER.sub("", unicodedata.normalize("NFKC", correct_answer).strip())))
+            return "choice" if len(expected) == 1 and user in option_texts - {""} else None
+    if len(correct) > ANSWER_OBJECTIVE_MAX_CHARS:
+        return None
+    # 数字（按顺序，含符号与小数）不同或否定词不同时，字面再相近也不算对
+    if _numbers(user_answer) != _numbers(correct_answer):
+        return None
+    if len(_NEGATION.findall(user)) != len(_NEGATION.findall(correct)):
+        return None
+    expected_items = _list_items(correct_answer)
+    if len(expected_items) > 1 and _list_items(user_answer) == expected_items:
+        return "set"
+    if _fuzzy_match(user_answer, correct_answer):
+        return "fuzzy"
+    return None
+
+
+def is_gradable(user_answers) -> bool:
+    """答题数据为逐题的对象列表（插件提交的格式）时才能逐题判定"""
+    return isinstance(user_answers, list) and bool(user_answers) and all(
+        isinstance(item, dict) and "question" in item for item in user_answers)
+
+
+def grade_answers(user_answers: list) -> list:
+    """逐题本地判定，返回 [{index, question, user_answer, correct_answer, explanation, method}]，method=llm 表示需要模型分析"""
+    graded = []
+    for index, item in enumerate(user_answers, start=1):
+        entry = {
+            "index": index,
+            "question": str(item.get("question") or ""),
+            "user_answer": str(item.get("user_answer") or ""),
+            "correct_answer": str(item.get("correct_answer") or item.get("answer") or ""),
+            "explanation": str(item.get("explanation") or ""),
+        }
+        entry["method"] = grade_answer(entry["question"], entry["user_answer"], entry["correct_answer"]) or "llm"
+        answer_grading.inc(result=entry["method"])
+        graded.append(entry)
+    return graded
+
+
+class _Excerpts:
+    """把页面切成小段，按与题目的词项重合度为每道题挑选相关摘录（保持原文顺序）"""
+
+    def __init__(self, page_content: str, budget: int = ANSWER_CONTEXT_TOKENS):
+        self.budget = budget
+        self.page_content = page_content
+        self.passages = []
+        if estimate_tokens(page_content) > budget:
+            self.passages = [(p, set(tokenize(p))) for p in split_into_chunks(page_content, EXCERPT_TOKENS)]
+
+    def select(self, query: str) -> str:
+        if not self.passages:
+            return self.page_content
+        terms = set(tokenize(query))
+        ranked = sorted(range(len(self.passages)), key=lambda i: -len(terms & self.passages[i][1]))
+        chosen, used = [], 0
+        for i in ranked:
+            cost = estimate_tokens(self.passages[i][0])
+            if used + cost > self.budget:
+                continue
+            chosen.append(i)
+            used += cost
+        return "\n\n".join(self.passages[i][0] for i in sorted(chosen))
+
+
+def render_item(entry: dict, analysis: Optional[str] = None) -> str:
+    """单题分析的 HTML；本地判定正确或模型分析失败时直接使用标准答案与解析"""
+    if analysis:
+        return analysis
+    verdict = "回答正确。" if entry["method"] != "llm" else "暂时无法生成详细分析，请对照标准答案与解析复习。"
+    return (
+        '<div class="question-item">\n'
+        f'<h4>题目 {entry["index"]}：{html.escape(entry["question"])}</h4>\n'
+        f'<p><strong>用户回答：</strong> {html.escape(entry["user_answer"])}</p>\n'
+        f'<p><strong>标准答案：</strong> {html.escape(entry["correct_answer"])}</p>\n'
+        f'<p><strong>解析与建议：</strong> {verdict}{html.escape(entry["explanation"])}</p>\n'
+        '</div>'
+    )
+
+
+async def _analyze_item(entry: dict, excerpts: _Excerpts) -> str:
+    try:
+        analysis = await llm_generate(
+            "answer_item_analysis", index=entry["index"], question=entry["question"],
+            correct_answer=entry["correct_answer"], explanation=entry["explanation"] or "无",
+            user_answer=entry["user_answer"],
+            page_content=excerpts.select(f"{entry['question']}\n{entry['correct_answer']}"),
+        )
+    except HTTPException as e:
+        logger.warning(f"第 {entry['index']} 题分析失败: {e.detail}")
+        return render_item(entry)
+    return render_item(entry, extract_html_fragment(analysis))
+
+
+def _local_summary(graded: list) -> str:
+    return (f"<h3>整体学习建议</h3>\n<ul>\n<li>本次 {len(graded)} 道题全部回答正确，掌握情况良好。</li>\n"
+            "<li>可以过一段时间再做一次复习，或尝试出更多题目巩固。</li>\n</ul>")
+
+
+async def _summarize(graded: list) -> str:
+    """整体建议只需要答错 / 待分析的题目，不附带页面内容"""
+    pending = [e for e in graded if e["method"] == "llm"]
+    if not pending:
+        return _local_summary(graded)
+    items = "\n".join(f"{e['index']}. 题目：{e['question']}\n   标准答案：{e['correct_answer']}\n   用户回答：{e['user_answer']}"
+                      for e in pending)
+    try:
+        summary = await llm_generate("answer_summary", total=len(graded), correct=len(graded) - len(pending), items=items)
+    except HTTPException as e:
+        logger.warning(f"生成整体学习建议失败: {e.detail}")
+        return ""
+    return extract_html_fragment(summary)
+
+
+def start_analysis(graded: list, page_content: str) -> tuple[list, asyncio.Task]:
+    """
+    并发启动逐题分析与整体建议：本地判定正确的题目直接生成结果，其余每题单独调用模型（只附带相关摘录）
+    返回 (按题目顺序的任务列表, 整体建议任务)
+    """
+    excerpts = _Excerpts(page_content or "")
+
+    async def local(entry: dict) -> str:
+        return render_item(entry)
+
+    items = [asyncio.create_task(_analyze_item(e, excerpts) if e["method"] == "llm" else local(e)) for e in graded]
+    return items, asyncio.create_task(_summarize(graded))
+
+
+def render_report(items: list, summary: str) -> str:
+    return '<div class="question-analysis">\n<h3>逐题分析</h3>\n' + "\n".join(items) + f"\n{summary}\n</div>"
+
+
+def grading_results(graded: list) -> list:
+    """返回给前端的逐题判定结果：correct 为 True 表示本地判定正确，None 表示交由模型分析"""
+    return [{"index": e["index"], "correct": True if e["method"] != "llm" else None, "method": e["method"]} for e in graded]
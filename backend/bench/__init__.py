@@ -0,0 +1,3 @@
+"""
+基准测试套件：本地 Microsoft Graph / OpenAI 兼容接口替身与压测脚本
+"""
@@ -0,0 +1,106 @@
+"""
+HTML 清洗微基准：校验 lxml 与 BeautifulSoup 两种引擎输出一致，并比较大页面上的耗时
+
+用法（在 backend 目录下）：
+    python -m bench.bench_clean
+    python -m bench.bench_clean --size-kb 1024 --repeat 5 --min-speedup 5
+
+等价性语料为 bench/corpus 下的 OneNote 页面 HTML，外加 fake_graph 生成的不同大小的页面；
+FALLBACK_CASES 中 lxml 无法正确处理的结构校验 clean_onenote_content 回退后与 bs4 一致；
+输出不一致或加速比低于 --min-speedup 时以非零状态码退出。
+"""
+import argparse
+import pathlib
+import re
+import sys
+import time
+
+import ulits
+from bench.fake_graph import onenote_page_html
+
+CORPUS_DIR = pathlib.Path(__file__).parent / "corpus"
+# lxml 引擎处理不了、clean_onenote_content 必须回退到 bs4 的结构
+FALLBACK_CASES = {
+    "cdata": "<html><body><p>x</p><![CDATA[ raw ]]><p>y</p></body></html>",
+    "textarea": "<html><body><textarea>  a\n  b  </textarea><p>y</p></body></html>",
+    "after_html": "<html><body><p>x</p></body></html>\n<p>y</p>",
+    "after_html_text": "<html><body><p>x</p></body></html> tail",
+    "after_html_upper": "<html><head><title>t</title></head><body>x</body></HTML >\n<div>y</div>",
+}
+
+
+def load_corpus() -> dict:
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(CORPUS_DIR.glob("*.html"))}
+
+
+def large_page(corpus: dict, size_kb: int) -> str:
+    """把语料页面的 body 反复拼接成一个约 size_kb 大小的页面"""
+    bodies = [re.search(r"<body[^>]*>(.*)</body>", html, re.DOTALL).group(1) for html in corpus.values()]
+    head = "<html lang=\"zh-CN\">\n\t<head>\n\t\t<title>大页面</title>\n\t</head>\n\t<body>\n"
+    parts, size, index = [head], len(head), 0
+    while size < size_kb * 1024:
+        body = bodies[index % len(bodies)]
+        parts.append(body)
+        size += len(body.encode("utf-8"))
+        index += 1
+    parts.append("\t</body>\n</html>\n")
+    return "".join(parts)
+
+
+def best_time(fn, html: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML 清洗引擎等价性校验与微基准")
+    parser.add_argument("--size-kb", type=int, default=1024, help="基准页面大小（KB）")
+    parser.add_argument("--repeat", type=int, default=5, help="每个引擎重复次数，取最快一次")
+    parser.add_argument("--min-speedup", type=float, default=5.0, help="要求的最低加速比")
+    args = parser.parse_args()
+
+    if ulits.etree is None:
+        sys.exit("未安装 lxml，无法比较")
+
+    corpus = load_corpus()
+    for kb in (1, 20, 200):
+        corpus[f"fake_graph_{kb}kb"] = onenote_page_html(f"页面 {kb}", kb, seed=kb)
+    mismatches = [name for name, html in corpus.items()
+                  if ulits._clean_with_bs4(html) != ulits._clean_with_lxml(html)]
+    for name, html in FALLBACK_CASES.items():
+        name = f"fallback_{name}"
+        if ulits._clean_with_bs4(html) != ulits.clean_onenote_content(html):
+            mismatches.append(name)
+        corpus[name] = html
+    for name in corpus:
+        print(f"{name:<28}{'MISMATCH' if name in mismatches else 'ok'}")
+
+    pages = {
+        "corpus": large_page(load_corpus(), args.size_kb),
+        "fake_graph": onenote_page_html("大页面", args.size_kb, seed=0),
+    }
+    slow = []
+    print(f"\n{'page':<14}{'size_kb':>9}{'bs4_ms':>10}{'lxml_ms':>10}{'speedup':>9}")
+    for name, html in pages.items():
+        if ulits._clean_with_bs4(html) != ulits._clean_with_lxml(html):
+            mismatches.append(name)
+        bs4_time = best_time(ulits._clean_with_bs4, html, args.repeat)
+        lxml_time = best_time(ulits._clean_with_lxml, html, args.repeat)
+        speedup = bs4_time / lxml_time
+        if speedup < args.min_speedup:
+            slow.append(name)
+        print(f"{name:<14}{len(html.encode('utf-8')) // 1024:>9}{bs4_time * 1000:>10.1f}"
+              f"{lxml_time * 1000:>10.1f}{speedup:>8.1f}x")
+
+    if mismatches:
+        sys.exit(f"输出不一致: {', '.join(mismatches)}")
+    if slow:
+        sys.exit(f"加速比低于 {args.min_speedup}x: {', '.join(slow)}")
+
+
+if __name__ == "__main__":
+    main()
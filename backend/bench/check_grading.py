@@ -0,0 +1,87 @@
+"""
+本地判题回归校验：逐条检查 answer_grading.grade_answer 的判定结果
+
+用法（在 backend 目录下）：
+    python -m bench.check_grading
+
+CASES 中每条为 (题目, 用户回答, 标准答案, 期望结果)，期望结果为判定方式或 None（交给模型分析）；
+把错误回答判为正确比多调用一次模型更糟，曾经误判的回答都应加入 CASES。
+有任意一条与期望不一致时以非零状态码退出。
+"""
+import sys
+
+from answer_grading import grade_answer
+
+CHOICE_QUESTION = "B+ 树的数据存放在哪里？ A. 根节点 B. 叶子节点 C. 内部节点 D. 任意节点"
+
+CASES = [
+    # 应判为正确
+    ("事务的四个特性是什么？", "原子性、一致性、隔离性、持久性", "原子性、一致性、隔离性、持久性", "exact"),
+    ("水的沸点是多少摄氏度？", "答案：100。", "100", "exact"),
+    ("温度为多少？", "-5", "-5", "exact"),
+    ("圆周率保留两位小数？", "3.14", "3.14", "exact"),
+    (CHOICE_QUESTION, "b", "B. 叶子节点", "choice"),
+    (CHOICE_QUESTION, "叶子节点", "B", "choice"),
+    ("列举事务的特性", "一致性，原子性，持久性，隔离性", "原子性、一致性、隔离性、持久性", "set"),
+    ("Which keyword defines a function in Python?", "Def", "def", "exact"),
+    ("拼写：接收", "recieve", "receive", "fuzzy"),
+    ("拼写：发生", "occured", "occurred", "fuzzy"),
+    # 不确定是否只是笔误，交给模型
+    ("What guarantees isolation?", "serialisable transactons", "serialisable transactions", None),
+    ("秦统一六国是哪一年？", "公元前 221 年。", "前221年", None),
+    # 曾被误判为正确的错误回答
+    ("温度为多少？", "5", "-5", None),
+    ("温度为多少？", "-5", "5", None),
+    ("数值是多少？", "15", "1.5", None),
+    ("数值是多少？", "1.5", "15", None),
+    ("二分查找的时间复杂度？", "O(n log n)", "O(log n)", None),
+    ("归并排序的时间复杂度？", "O(log n)", "O(n log n)", None),
+    ("秦统一六国是哪一年？", "公元221年", "公元前221年", None),
+    ("秦统一六国是哪一年？", "公元前221年", "公元221年", None),
+    ("Which word means 'main'?", "principle", "principal", None),
+    ("Which word means 'a rule'?", "principal", "principle", None),
+    ("Which word means 'to complete'?", "compliment", "complement", None),
+    ("Which word means 'not moving'?", "stationery", "stationary", None),
+    ("Which word is the verb?", "effect", "affect", None),
+    ("哪个协议是无连接的？", "TCP", "UDP", None),
+    ("端口号是多少？", "8080", "80", None),
+    ("是否线程安全？", "不是", "是", None),
+    ("HTTP 默认端口与 HTTPS 默认端口", "443 80", "80 443", None),
+    ("分数是多少？", "12", "1/2", None),
+    ("分数是多少？", "1/2", "12", None),
+    ("比例是多少？", "31", "3:1", None),
+    ("比例是多少？", "3:1", "31", None),
+    ("几点开始？", "1230", "12:30", None),
+    ("几点开始？", "12:30", "1230", None),
+    ("用哪种语言？", "C", "C#", None),
+    ("用哪种语言？", "C#", "C", None),
+    ("导数记作？", "f(x)", "f'(x)", None),
+    ("导数记作？", "f'(x)", "f(x)", None),
+    ("乘积怎么写？", "ab", "a*b", None),
+    ("乘积怎么写？", "a*b", "ab", None),
+    ("占比是多少？", "50", "50%", None),
+    ("占比是多少？", "50%", "50", None),
+    ("构造方法叫什么？", "init", "__init__", None),
+    ("构造方法叫什么？", "__init__", "init", None),
+    ("冒泡排序的时间复杂度？", "O(n2)", "O(n^2)", None),
+    ("冒泡排序的时间复杂度？", "O(n^2)", "O(n2)", None),
+    ("Which city?", "York New", "New York", None),
+    ("Which city?", "New York", "York New", None),
+]
+
+
+def main():
+    failures = []
+    for question, user_answer, correct_answer, expected in CASES:
+        result = grade_answer(question, user_answer, correct_answer)
+        if result != expected:
+            failures.append((question, user_answer, correct_answer, expected, result))
+    for question, user_answer, correct_answer, expected, result in failures:
+        print(f"FAIL {question!r}: {user_answer!r} vs {correct_answer!r} -> {result!r}, expected {expected!r}")
+    print(f"{len(CASES) - len(failures)}/{len(CASES)} cases passed")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
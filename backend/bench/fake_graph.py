@@ -0,0 +1,193 @@
+"""
+本地 Microsoft Graph（OneNote）替身，供基准测试使用
+
+只实现后端用到的接口；延迟、每个分区的页面数、页面大小均可配置。
+"""
+import asyncio
+import base64
+import random
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse
+
+
+@dataclass
+class FakeGraphSettings:
+    latency: float = 0.05  # 每个请求的固定延迟（秒）
+    jitter: float = 0.02  # 额外随机延迟上限（秒）
+    notebooks: int = 3
+    sections_per_notebook: int = 4
+    pages_per_section: int = 30
+    page_size_kb: int = 20  # 页面 HTML 大小
+    list_page_size: int = 20  # 列表接口每页条数，超过时返回 @odata.nextLink
+
+
+settings = FakeGraphSettings()
+app = FastAPI(title="Fake Microsoft Graph")
+_in_batch: ContextVar[bool] = ContextVar("in_batch", default=False)  # 批处理内的子请求不再单独计延迟
+
+_PARAGRAPHS = [
+    "事务的四个特性是原子性、一致性、隔离性和持久性（ACID）。",
+    "B+ 树的所有数据都存放在叶子节点，叶子节点之间通过指针相连，适合范围查询。",
+    "Python 的 GIL 使同一时刻只有一个线程执行字节码，I/O 密集型任务仍可从多线程中获益。",
+    "The event loop runs one coroutine at a time and switches only at await points.",
+    "HTTP keep-alive reuses TCP connections and avoids repeated TLS handshakes.",
+    "缓存失效的常见策略包括 TTL 过期、LRU 淘汰以及写入时主动失效。",
+]
+
+
+def onenote_page_html(title: str, size_kb: int, seed: int = 0) -> str:
+    """生成结构接近 OneNote 导出格式的页面 HTML"""
+    rng = random.Random(seed)
+    head = (
+        "<!DOCTYPE html>\n<html lang=\"zh-CN\">\n<head>\n"
+        f"<title>{title}</title>\n"
+        "<meta http-equiv=\"Content-Type\" content=\"text/html; charset=utf-8\" />\n"
+        "<meta name=\"created\" content=\"2024-03-01T08:00:00.0000000\" />\n"
+        "<style>p { margin: 0 }</style>\n"
+        "</head>\n"
+        "<body data-absolute-enabled=\"true\" style=\"font-family:Calibri;font-size:11pt\">\n"
+        "<div id=\"div:{1}\" data-id=\"_default\" style=\"position:absolute;left:48px;top:115px;width:624px\">\n"
+    )
+    parts = [head]
+    size = len(head)
+    index = 0
+    while size < size_kb * 1024:
+        index += 1
+        text = rng.choice(_PARAGRAPHS)
+        if index % 7 == 0:
+            block = (f"<h2 style=\"font-size:16pt;color:#1e4e79\">第 {index // 7} 节</h2>\n"
+                     f"<ul>\n<li>{text}</li>\n<li>要点 &amp; 补充 {index}</li>\n</ul>\n")
+        elif index % 11 == 0:
+            block = (f"<table style=\"border:1px solid\"><tr><td>术语 {index}</td>"
+                     f"<td>{text}</td></tr></table>\n")
+        else:
+            block = f"<p id=\"p:{{{index}}}\" style=\"margin-top:0pt;margin-bottom:0pt\">{text}  </p>\n"
+        parts.append(block)
+        size += len(block.encode("utf-8"))
+    parts.append("</div>\n</body>\n</html>\n")
+    return "".join(parts)
+
+
+async def _delay():
+    if _in_batch.get():
+        return
+    await asyncio.sleep(settings.latency + random.random() * settings.jitter)
+
+
+def _paged(request: Request, items: list) -> dict:
+    """模拟 Graph 分页：$top 与服务端页大小取较小值，剩余部分通过 @odata.nextLink 返回"""
+    top = int(request.query_params.get("$top", settings.list_page_size))
+    top = min(top, settings.list_page_size)
+    skip = int(request.query_params.get("$skip", 0))
+    body = {"value": items[skip:skip + top]}
+    if skip + top < len(items):
+        params = dict(request.query_params)
+        params["$skip"] = str(skip + top)
+        query = "&".join(f"{k}={v}" for k, v in params.items())
+        body["@odata.nextLink"] = f"{str(request.base_url).rstrip('/')}{request.url.path}?{query}"
+    return body
+
+
+@app.post("/oauth2/v2.0/token")
+async def token():
+    await _delay()
+    return {"access_token": uuid.uuid4().hex, "refresh_token": uuid.uuid4().hex, "expires_in": 3600}
+
+
+@app.post("/v1.0/$batch")
+async def batch(request: Request):
+    """JSON 批处理：在本服务内依次分发子请求，整个批次只计一次延迟；非 JSON 响应体按 base64 返回"""
+    await _delay()
+    body = await request.json()
+    base_url = str(request.base_url).rstrip("/") + "/v1.0"
+    responses = []
+    reset = _in_batch.set(True)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url=base_url) as client:
+            for item in body.get("requests", []):
+                r = await client.request(item["method"], base_url + item["url"], headers=item.get("headers"),
+                                         json=item.get("body"))
+                content_type = r.headers.get("content-type", "")
+                if "json" in content_type:
+                    payload = r.json()
+                else:
+                    payload = base64.b64encode(r.content).decode("ascii")
+                responses.append({"id": item["id"], "status": r.status_code,
+                                  "headers": {"Content-Type": content_type}, "body": payload})
+    finally:
+        _in_batch.reset(reset)
+    return {"responses": responses}
+
+
+@app.get("/v1.0/me")
+async def me():
+    await _delay()
+    return {"id": "bench-user", "displayName": "Bench User", "userPrincipalName": "bench@example.com"}
+
+
+@app.get("/v1.0/me/onenote/notebooks")
+async def notebooks(request: Request):
+    await _delay()
+    items = [{"id": f"nb-{i}", "displayName": f"笔记本 {i}"} for i in range(settings.notebooks)]
+    return _paged(request, items)
+
+
+@app.get("/v1.0/me/onenote/notebooks/{notebook_id}/sections")
+async def sections(notebook_id: str, request: Request):
+    await _delay()
+    items = [{"id": f"{notebook_id}-sec-{i}", "displayName": f"分区 {i}"}
+             for i in range(settings.sections_per_notebook)]
+    return _paged(request, items)
+
+
+@app.post("/v1.0/me/onenote/notebooks/{notebook_id}/sections")
+async def create_section(notebook_id: str, request: Request):
+    await _delay()
+    body = await request.json()
+    return JSONResponse({"id": f"{notebook_id}-sec-{uuid.uuid4().hex[:8]}", **body}, status_code=201)
+
+
+@app.get("/v1.0/me/onenote/sections/{section_id}/pages")
+async def pages(section_id: str, request: Request):
+    await _delay()
+    items = [{
+        "id": f"{section_id}-page-{i}",
+        "title": f"页面 {i}",
+        "contentUrl": f"{str(request.base_url).rstrip('/')}/v1.0/me/onenote/pages/{section_id}-page-{i}/content",
+        "lastModifiedDateTime": "2024-03-01T08:00:00Z",
+    } for i in range(settings.pages_per_section)]
+    return _paged(request, items)
+
+
+@app.post("/v1.0/me/onenote/sections/{section_id}/pages")
+async def create_page(section_id: str, request: Request):
+    await _delay()
+    await request.body()
+    page_id = f"{section_id}-page-{uuid.uuid4().hex[:8]}"
+    return JSONResponse({"id": page_id, "title": "新页面",
+                         "links": {"oneNoteWebUrl": {"href": f"https://onenote.example/{page_id}"}}},
+                        status_code=201)
+
+
+@app.get("/v1.0/me/onenote/pages/{page_id}")
+async def page_metadata(page_id: str):
+    await _delay()
+    return {"id": page_id, "title": page_id, "lastModifiedDateTime": "2024-03-01T08:00:00Z"}
+
+
+@app.get("/v1.0/me/onenote/pages/{page_id}/content")
+async def page_content(page_id: str):
+    await _delay()
+    return HTMLResponse(onenote_page_html(page_id, settings.page_size_kb, seed=hash(page_id) & 0xFFFF))
+
+
+@app.patch("/v1.0/me/onenote/pages/{page_id}/content")
+async def update_page(page_id: str, request: Request):
+    await _delay()
+    await request.body()
+    return Response(status_code=204)
@@ -0,0 +1,146 @@
+"""
+本地 OpenAI 兼容接口替身（/v1/chat/completions），供基准测试使用
+
+通过把后端的 BASE_URL 指向本服务启用；支持普通与流式（SSE）响应，
+首 token 延迟与生成速度可配置，并返回 usage 字段（按服务端前缀缓存的规则计算 cached_tokens）；
+请求 json_schema 结构化输出时按 schema 返回 JSON。
+"""
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+@dataclass
+class FakeLLMSettings:
+    ttft: float = 0.3  # 首 token 延迟（秒）
+    tokens_per_second: float = 200.0  # 生成速度
+    completion_tokens: int = 200  # 每次回复的 token 数
+
+
+settings = FakeLLMSettings()
+app = FastAPI(title="Fake OpenAI-compatible LLM")
+
+_QUESTIONS = [
+    {"question": "事务的四个特性是什么？", "answer": "原子性、一致性、隔离性、持久性", "explanation": "即 ACID。"},
+    {"question": "B+ 树的数据存放在哪里？", "answer": "叶子节点", "explanation": "叶子节点通过指针相连。"},
+    {"question": "GIL 对 I/O 密集型任务影响大吗？", "answer": "不大", "explanation": "等待 I/O 时会释放 GIL。"},
+]
+
+
+def _prompt_text(body: dict) -> str:
+    return "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+
+
+def _structured_reply(body: dict):
+    """请求带 json_schema 的 response_format 时按 schema 返回不带代码块的 JSON"""
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") != "json_schema":
+        return None
+    schema = response_format.get("json_schema", {}).get("schema", {})
+    if "questions" in schema.get("properties", {}):
+        return json.dumps({"questions": _QUESTIONS}, ensure_ascii=False)
+    return json.dumps(_QUESTIONS[0], ensure_ascii=False)
+
+
+def _reply_for(prompt: str) -> str:
+    """按提示词类型返回形状合理的内容，保证后端的解析逻辑能正常走通"""
+    if "JSON" in prompt or "json" in prompt:
+        return "```json\n" + json.dumps(_QUESTIONS, ensure_ascii=False) + "\n```"
+    if "<html>" in prompt or "OneNote" in prompt:
+        return ("<!DOCTYPE html><html><head><title>笔记</title></head><body>"
+                + "<p>整理后的笔记内容。</p>" * max(1, settings.completion_tokens // 10)
+                + "</body></html>")
+    return "<p>" + "这是模型生成的回复。" * max(1, settings.completion_tokens // 10) + "</p>"
+
+
+CACHE_MIN_TOKENS = 1024  # 前缀缓存生效的最小长度
+CACHE_BLOCK_TOKENS = 128  # 超出最小长度的部分按块命中
+CACHE_MAX_PROMPTS = 256  # 参与前缀比较的最近提示词数
+_seen_prompts: "OrderedDict[str, None]" = OrderedDict()  # 模拟服务端前缀缓存：最近出现过的完整提示词
+
+
+def _common_prefix_len(a: str, b: str) -> int:
+    """二分查找最长公共前缀，切片比较在 C 层完成，长提示词也很快"""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _cached_tokens(prompt: str) -> int:
+    """
+    与最近请求的整个提示词（system + user）比较最长公共前缀：
+    不足 CACHE_MIN_TOKENS 时不命中，超出部分按 CACHE_BLOCK_TOKENS 向下取整，与 OpenAI 的前缀缓存规则一致
+    """
+    shared = max((_common_prefix_len(seen, prompt) for seen in _seen_prompts), default=0)
+    _seen_prompts[prompt] = None
+    _seen_prompts.move_to_end(prompt)
+    if len(_seen_prompts) > CACHE_MAX_PROMPTS:
+        _seen_prompts.popitem(last=False)
+    tokens = shared // 2  # 与 _usage 相同的 token 估算
+    if tokens < CACHE_MIN_TOKENS:
+        return 0
+    return CACHE_MIN_TOKENS + (tokens - CACHE_MIN_TOKENS) // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+
+
+def _usage(prompt: str, completion: str, cached_tokens: int = 0) -> dict:
+    prompt_tokens = max(1, len(prompt) // 2)
+    completion_tokens = max(1, len(completion) // 2)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = _prompt_text(body)
+    content = _structured_reply(body) or _reply_for(prompt)
+    cached_tokens = _cached_tokens(prompt)
+    model = body.get("model") or "fake-model"
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    generation_time = settings.completion_tokens / settings.tokens_per_second
+
+    if not body.get("stream"):
+        await asyncio.sleep(settings.ttft + generation_time)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": _usage(prompt, content, cached_tokens),
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+    async def events():
+        await asyncio.sleep(settings.ttft)
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+        interval = generation_time / max(1, len(pieces))
+        for piece in pieces:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(interval)
+        final = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(final)}\n\n"
+        if include_usage:
+            usage = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [], "usage": _usage(prompt, content, cached_tokens)}
+            yield f"data: {json.dumps(usage)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
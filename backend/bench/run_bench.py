@@ -0,0 +1,188 @@
+"""
+后端基准测试：在本地 Graph / LLM 替身之上运行 main.app，统计各接口在不同并发下的延迟与吞吐
+
+用法（在 backend 目录下）：
+    python -m bench.run_bench --concurrency 1,10,50 --requests 100
+    python -m bench.run_bench --endpoints dialogue,pages --llm-ttft 1.0 --page-kb 200 --json result.json
+
+三个服务（fake Graph、fake LLM、main.app）都在本进程内由 uvicorn 各自的线程启动；
+main 通过 GRAPH_BASE_URL 与 BASE_URL 环境变量指向替身，因此必须在导入 main 之前设置。
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from bench import fake_graph, fake_llm
+
+SESSION_ID = "bench-session"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    """在后台线程中启动 uvicorn，等待其开始监听"""
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_endpoints(args) -> dict:
+    """接口名 -> (方法, 路径, 请求体生成函数)；请求在分区内轮换页面，模拟真实的缓存命中率"""
+    section = "nb-0-sec-0"
+
+    def page(i: int) -> str:
+        return f"{section}-page-{i % args.pages}"
+
+    answers = json.dumps([{"question": "事务的四个特性是什么？", "user_answer": "ACID",
+                           "correct_answer": "原子性、一致性、隔离性、持久性", "explanation": "即 ACID。"}],
+                         ensure_ascii=False)
+    return {
+        "notebooks": ("GET", "/api/notebooks", None),
+        "sections": ("GET", "/api/sections/nb-0", None),
+        "pages": ("GET", f"/api/pages/{section}", None),
+        "page-summary": ("POST", "/api/page-summary", lambda i: {"page_id": page(i)}),
+        "review-questions": ("POST", "/api/review-questions", lambda i: {"page_id": page(i), "question_num": 3}),
+        "section-review-questions": ("POST", "/api/section-review-questions",
+                                     lambda i: {"section_id": section, "question_num": 3}),
+        "analyze-answers": ("POST", "/api/analyze-answers",
+                            lambda i: {"page_id": page(i), "question_a_answer": answers}),
+        "dialogue": ("POST", "/api/dialogue", lambda i: {"page_id": page(i), "user_print": f"解释一下要点 {i}"}),
+        "dialogue-stream": ("POST", "/api/dialogue/stream",
+                            lambda i: {"page_id": page(i), "user_print": f"解释一下要点 {i}"}),
+        "append-page": ("POST", "/api/append-page", lambda i: {"page_id": page(i), "pageContent": "新增的学习内容"}),
+        "create-page": ("POST", "/api/create-page",
+                        lambda i: {"section_id": section, "title": f"基准页面 {i}", "content": "网页正文内容"}),
+    }
+
+
+async def run_endpoint(client: httpx.AsyncClient, method: str, path: str, body_fn,
+                       concurrency: int, total: int) -> dict:
+    """以固定并发发送 total 个请求，返回延迟分位数与吞吐"""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                r = await client.request(method, path, json=body_fn(i) if body_fn else None)
+                await r.aread()
+                if r.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": total,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "throughput_rps": round(total / elapsed, 2),
+    }
+
+
+async def run_bench(args, base_url: str) -> list:
+    endpoints = build_endpoints(args)
+    selected = args.endpoints.split(",") if args.endpoints else list(endpoints)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, cookies={"auth_session": SESSION_ID},
+                                 timeout=args.timeout, limits=limits) as client:
+        for name in selected:
+            method, path, body_fn = endpoints[name]
+            for concurrency in levels:
+                total = max(args.requests, concurrency)
+                stats = await run_endpoint(client, method, path, body_fn, concurrency, total)
+                stats.update({"endpoint": name, "concurrency": concurrency})
+                results.append(stats)
+                print(f"{name:<18}{concurrency:>6}{stats['requests']:>8}{stats['errors']:>7}"
+                      f"{stats['p50_ms']:>10}{stats['p99_ms']:>10}{stats['throughput_rps']:>10}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ReadNote 后端基准测试（本地 Graph / LLM 替身）")
+    parser.add_argument("--endpoints", default="", help="逗号分隔的接口名，默认全部")
+    parser.add_argument("--concurrency", default="1,10,50", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=100, help="每个并发级别的请求数")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--pages", type=int, default=30, help="轮换使用的页面数（影响缓存命中率）")
+    parser.add_argument("--graph-latency", type=float, default=0.05, help="Graph 替身每个请求的延迟（秒）")
+    parser.add_argument("--page-kb", type=int, default=20, help="页面 HTML 大小（KB）")
+    parser.add_argument("--list-page-size", type=int, default=20, help="Graph 列表每页条数")
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="LLM 替身首 token 延迟（秒）")
+    parser.add_argument("--llm-tps", type=float, default=200, help="LLM 替身生成速度（token/秒）")
+    parser.add_argument("--llm-tokens", type=int, default=200, help="LLM 替身每次回复的 token 数")
+    parser.add_argument("--no-llm-cache", action="store_true", help="关闭 LLM 响应缓存")
+    parser.add_argument("--json", default="", help="把结果写入 JSON 文件，便于对比回归")
+    args = parser.parse_args()
+
+    fake_graph.settings.latency = args.graph_latency
+    fake_graph.settings.page_size_kb = args.page_kb
+    fake_graph.settings.pages_per_section = args.pages
+    fake_graph.settings.list_page_size = args.list_page_size
+    fake_llm.settings.ttft = args.llm_ttft
+    fake_llm.settings.tokens_per_second = args.llm_tps
+    fake_llm.settings.completion_tokens = args.llm_tokens
+
+    graph_port, llm_port, app_port = free_port(), free_port(), free_port()
+    start_server(fake_graph.app, graph_port)
+    start_server(fake_llm.app, llm_port)
+
+    # 必须在导入 main 之前把后端指向替身
+    os.environ["GRAPH_BASE_URL"] = f"http://127.0.0.1:{graph_port}/v1.0"
+    os.environ["BASE_URL"] = f"http://127.0.0.1:{llm_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("MODEL", "fake-model")
+    os.environ["SESSION_BACKEND"] = "memory"
+    # 题库与检索索引不复用之前运行留下的数据，各次结果才可比较
+    os.environ["QUESTION_BANK_DB_PATH"] = ""
+    os.environ["RETRIEVAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="readnote-bench-"), "retrieval.db")
+    # 压测只用一个会话，代表的却是大量用户，关闭用户级 Graph 限流
+    os.environ.setdefault("GRAPH_USER_RATE", "0")
+    if args.no_llm_cache:
+        os.environ["LLM_CACHE_TASKS"] = ""
+    import main as backend
+
+    asyncio.run(backend.user_sessions.set(SESSION_ID, {"user_id": "bench", "access_token": "bench-token"}))
+    start_server(backend.app, app_port)
+
+    print(f"{'endpoint':<18}{'conc':>6}{'reqs':>8}{'errs':>7}{'p50_ms':>10}{'p99_ms':>10}{'rps':>10}")
+    results = asyncio.run(run_bench(args, f"http://127.0.0.1:{app_port}"))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "512"))  # 最多缓存的页面数
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "600"))  # 缓存有效期（秒）
+HIERARCHY_CACHE_SIZE = int(os.getenv("HIERARCHY_CACHE_SIZE", "2048"))  # 笔记本/分区/页面列表缓存条目数
+HIERARCHY_CACHE_TTL = float(os.getenv("HIERARCHY_CACHE_TTL", "60"))  # 列表缓存有效期（秒）
+
+
+class TTLCache:
+    """
+    带过期时间的 LRU 缓存
+
+    超过 maxsize 时淘汰最久未使用的条目；条目超过 ttl 秒后视为失效
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class PageContentCache:
+    """
+    按用户缓存清洗后的页面纯文本
+
+    条目记录抓取时页面的 lastModifiedDateTime；页面列表（get_pages）返回的最新版本号
+    通过 observe() 登记，版本不一致时缓存自动失效；写回页面时调用 invalidate()。
+    写回后一段时间内，缓存的页面列表（或尚未同步的 Graph）仍会给出写之前的版本，observe() 不再接受该版本。
+    """
+
+    def __init__(self, maxsize: int = PAGE_CACHE_SIZE, ttl: float = PAGE_CACHE_TTL):
+        self._entries = TTLCache(maxsize, ttl)  # (user_key, page_id) -> (version, text)
+        self._versions = TTLCache(maxsize * 4, ttl)  # (user_key, page_id) -> 最新已知版本
+        self._superseded = TTLCache(maxsize * 4, ttl)  # (user_key, page_id) -> 本地写回前的版本
+
+    def get(self, user_key: str, page_id: str) -> Optional[str]:
+        key = (user_key, page_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        version, text = entry
+        latest = self._versions.get(key)
+        if latest is not None and latest != version:
+            self._entries.pop(key)
+            return None
+        return text
+
+    def set(self, user_key: str, page_id: str, text: str, version: Optional[str] = None):
+        key = (user_key, page_id)
+        if version is None:
+            version = self._versions.get(key)
+        self._entries.set(key, (version, text))
+
+    def observe(self, user_key: str, page_id: str, version: Optional[str]):
+        """登记页面列表中看到的 lastModifiedDateTime"""
+        if not version:
+            return
+        key = (user_key, page_id)
+        if self._superseded.get(key) == version:
+            return
+        self._versions.set(key, version)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] != version:
+            self._entries.pop(key)
+
+    def version(self, user_key: str, page_id: str) -> Optional[str]:
+        return self._versions.get((user_key, page_id))
+
+    def invalidate(self, user_key: str, page_id: str):
+        key = (user_key, page_id)
+        self._entries.pop(key)
+        version = self._versions.pop(key)
+        if version is not None:
+            self._superseded.set(key, version)
+
+
+page_cache = PageContentCache()
+# (user_key, "notebooks" / "sections" / "pages", parent_id) -> 列表
+hierarchy_cache = TTLCache(HIERARCHY_CACHE_SIZE, HIERARCHY_CACHE_TTL)
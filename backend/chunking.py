@@ -0,0 +1,100 @@
+import asyncio
+import os
+import re
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from tokens import estimate_tokens, CJK_PATTERN
+from ulits import llm_generate
+
+# 加载环境变量
+load_dotenv()
+PAGE_TOKEN_BUDGET = int(os.getenv("PAGE_TOKEN_BUDGET", "6000"))  # 直接放入提示词的页面内容 token 上限
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "2500"))  # 每个分块的 token 上限
+LLM_MAP_CONCURRENCY = int(os.getenv("LLM_MAP_CONCURRENCY", "4"))  # map 阶段的并发上限
+MAX_REDUCE_ROUNDS = 3  # 合并后仍超预算时最多再压缩几轮
+
+
+def _hard_split(text: str, max_tokens: int) -> list[str]:
+    """单段超长且没有换行时，按估算的 token 数硬切分"""
+    pieces = []
+    start, cost = 0, 0.0
+    for i, char in enumerate(text):
+        cost += 1 if CJK_PATTERN.match(char) else 0.25
+        if cost > max_tokens:
+            pieces.append(text[start:i])
+            start, cost = i, (1 if CJK_PATTERN.match(char) else 0.25)
+    pieces.append(text[start:])
+    return pieces
+
+
+def split_into_chunks(text: str, max_tokens: int = CHUNK_TOKENS) -> list[str]:
+    """
+    按 token 预算把文本切成若干块，优先在段落、其次在行边界处切分
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    units = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        if estimate_tokens(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            if estimate_tokens(line) <= max_tokens:
+                units.append(line)
+            else:
+                units.extend(_hard_split(line, max_tokens))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in units:
+        unit_tokens = estimate_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+async def map_chunks(chunks: list[str], focus: Optional[str] = None,
+                     concurrency: int = LLM_MAP_CONCURRENCY) -> list[str]:
+    """
+    map 阶段：并发（有上限）压缩每个分块
+    有 focus（如对话需求）时只摘录相关内容，否则提炼全部知识点
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    total = len(chunks)
+
+    async def map_one(index: int, chunk: str) -> str:
+        async with semaphore:
+            if focus:
+                return await llm_generate("chunk_extract", chunk_index=index + 1, chunk_total=total,
+                                          focus=focus, chunk=chunk)
+            return await llm_generate("chunk_summary", chunk_index=index + 1, chunk_total=total, chunk=chunk)
+
+    return await asyncio.gather(*(map_one(i, chunk) for i, chunk in enumerate(chunks)))
+
+
+async def condense_page_content(page_content: str, focus: Optional[str] = None,
+                                budget: int = PAGE_TOKEN_BUDGET) -> str:
+    """
+    长页面的 map-reduce 预处理：页面未超出预算时原样返回；
+    否则分块并发压缩后合并，合并结果仍超预算则继续压缩，最终交给原任务提示词完成 reduce
+    """
+    content = page_content
+    for _ in range(MAX_REDUCE_ROUNDS):
+        if estimate_tokens(content) <= budget:
+            return content
+        chunks = split_into_chunks(content, min(CHUNK_TOKENS, budget))
+        partials = await map_chunks(chunks, focus)
+        if focus:
+            partials = [p for p in partials if p.strip() and p.strip() != "无相关内容"]
+        content = "\n\n".join(
+            f"[片段 {i + 1}]\n{p.strip()}" for i, p in enumerate(partials)
+        ) or "无相关内容"
+    return content
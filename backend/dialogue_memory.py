@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from cache import TTLCache
+from chunking import estimate_tokens
+from llm_scheduler import llm_priority, BATCH
+from session_store import MemorySessionStore, SQLiteSessionStore
+from ulits import llm_generate
+
+logger = logging.getLogger(__name__)
+
+# 加载环境变量
+load_dotenv()
+DIALOGUE_DB_PATH = os.getenv("DIALOGUE_DB_PATH", "")  # 为空时保存在内存；多 worker 部署时设置为共享的 SQLite 文件
+DIALOGUE_TTL = float(os.getenv("DIALOGUE_TTL", "7200"))  # 对话闲置多久后丢弃（秒）
+DIALOGUE_MAX_ENTRIES = int(os.getenv("DIALOGUE_MAX_ENTRIES", "2000"))  # 内存中保存的对话数上限
+DIALOGUE_HISTORY_TOKENS = int(os.getenv("DIALOGUE_HISTORY_TOKENS", "1500"))  # 原文保留的历史轮次 token 上限，超出后压缩为摘要
+DIALOGUE_KEEP_TURNS = int(os.getenv("DIALOGUE_KEEP_TURNS", "2"))  # 压缩时至少原文保留最近几轮
+DIALOGUE_SUMMARY_CHARS = int(os.getenv("DIALOGUE_SUMMARY_CHARS", "600"))  # 滚动摘要的长度上限（字）
+DIALOGUE_CONTEXT_TTL = float(os.getenv("DIALOGUE_CONTEXT_TTL", "600"))  # 对话复用页面上下文的最长时间（秒）
+DIALOGUE_MAX_TURNS = 20  # 摘要失败时的兜底：最多保留的轮次数
+
+
+def _plain_text(text: str) -> str:
+    # 回复可能是 HTML，只保留文本部分放入历史
+    return re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", text or "")).strip()
+
+
+class DialogueMemory:
+    """
+    服务端多轮对话状态，按 (会话, 页面 / 检索范围) 保存
+
+    - 最近几轮原文保留；原文超过 DIALOGUE_HISTORY_TOKENS 时，较早的轮次在后台合并进滚动摘要，
+      每轮提示词中的历史部分大小基本恒定；
+    - 对话使用的页面上下文保存在对话中，页面版本不变时后续轮次直接复用。
+    """
+
+    def __init__(self, db_path: str = DIALOGUE_DB_PATH, ttl: float = DIALOGUE_TTL,
+                 maxsize: int = DIALOGUE_MAX_ENTRIES, history_tokens: int = DIALOGUE_HISTORY_TOKENS,
+                 keep_turns: int = DIALOGUE_KEEP_TURNS):
+        self.history_tokens = history_tokens
+        self.keep_turns = keep_turns
+        if db_path:
+            self._store = SQLiteSessionStore(db_path, ttl, table="dialogues")
+        else:
+            self._store = MemorySessionStore(maxsize=maxsize, ttl=ttl)
+        self._locks = TTLCache(maxsize=4096, ttl=3600)
+        self._summarizing: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()  # 后台摘要任务的强引用，避免运行中被事件循环回收
+
+    @staticmethod
+    def key(user_key: str, page_id: Optional[str], scope: str = "page") -> str:
+        return f"{user_key}:{'all' if scope == 'all' else page_id}"
+
+    def _lock(self, key: str) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks.set(key, lock)
+        return lock
+
+    @staticmethod
+    def _empty() -> dict:
+        return {"summary": "", "turns": []}
+
+    async def load(self, key: str) -> dict:
+        return await self._store.get(key) or self._empty()
+
+    async def reset(self, key: str):
+        await self._store.delete(key)
+
+    @staticmethod
+    def cached_context(conversation: dict, version: Optional[str]) -> Optional[str]:
+        """页面版本未变且未超过 DIALOGUE_CONTEXT_TTL 时返回上一轮保存的页面上下文"""
+        context = conversation.get("context")
+        if context is None or conversation.get("context_version") != version:
+            return None
+        if time.time() - conversation.get("context_at", 0) > DIALOGUE_CONTEXT_TTL:
+            return None
+        return context
+
+    async def set_context(self, key: str, context: str, version: Optional[str]):
+        async with self._lock(key):
+            conversation = await self.load(key)
+            conversation.update({"context": context, "context_version": version, "context_at": time.time()})
+            await self._store.set(key, conversation)
+
+    @staticmethod
+    def format_history(conversation: dict) -> str:
+        parts = []
+        if conversation.get("summary"):
+            parts.append(f"（更早对话的摘要）\n{conversation['summary']}")
+        for turn in conversation.get("turns", []):
+            parts.append(f"用户：{turn['user']}\n助手：{turn['assistant']}")
+        return "\n\n".join(parts) or "无"
+
+    async def append(self, key: str, user_print: str, reply: str):
+        """记录一轮对话；历史超出预算时在后台压缩"""
+        async with self._lock(key):
+            conversation = await self.load(key)
+            conversation["turns"].append({"user": user_print, "assistant": _plain_text(reply)})
+            # 兜底：摘要持续失败时也不让历史无限增长
+            conversation["turns"] = conversation["turns"][-DIALOGUE_MAX_TURNS:]
+            await self._store.set(key, conversation)
+        if self._history_tokens(conversation) > self.history_tokens and key not in self._summarizing:
+            self._summarizing.add(key)
+            task = asyncio.create_task(self._summarize(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: self._summarizing.discard(key))
+
+    @staticmethod
+    def _history_tokens(conversation: dict) -> int:
+        return sum(estimate_tokens(t["user"]) + estimate_tokens(t["assistant"]) for t in conversation["turns"])
+
+    async def _summarize(self, key: str):
+        """把较早的轮次合并进滚动摘要（LLM 调用期间不持锁，写回前确认这些轮次仍在）"""
+        llm_priority.set(BATCH)
+        conversation = await self.load(key)
+        folded = conversation["turns"][:max(0, len(conversation["turns"]) - self.keep_turns)]
+        if not folded:
+            return
+        try:
+            summary = await llm_generate(
+                "dialogue_summary", max_chars=DIALOGUE_SUMMARY_CHARS, summary=conversation["summary"] or "无",
+                turns=self.format_history({"turns": folded}),
+            )
+        except Exception as e:
+            logger.error(f"对话摘要失败: {str(e)}")
+            return
+        async with self._lock(key):
+            conversation = await self._store.get(key)
+            if conversation is None or conversation["turns"][:len(folded)] != folded:
+                return  # 对话已被重置
+            conversation["summary"] = _plain_text(summary)
+            conversation["turns"] = conversation["turns"][len(folded):]
+            await self._store.set(key, conversation)
+
+    async def stats(self, key: str) -> dict:
+        conversation = await self.load(key)
+        return {
+            "turn_count": len(conversation["turns"]),
+            "history_tokens": self._history_tokens(conversation),
+            "summary_tokens": estimate_tokens(conversation["summary"]),
+            "summarizing": key in self._summarizing,
+        }
+
+
+dialogue_memory = DialogueMemory()
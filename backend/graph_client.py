@@ -0,0 +1,353 @@
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional, Protocol, Union
+
+import httpx
+from dotenv import load_dotenv
+
+from cache import TTLCache
+from metrics import span, stage_duration, graph_throttled, graph_rate_limited, graph_retries
+
+# 加载环境变量
+load_dotenv()
+GRAPH_BASE_URL = os.getenv("GRAPH_BASE_URL", "https://graph.microsoft.com/v1.0")
+GRAPH_MAX_CONNECTIONS = int(os.getenv("GRAPH_MAX_CONNECTIONS", "100"))  # 连接池总上限
+GRAPH_MAX_KEEPALIVE = int(os.getenv("GRAPH_MAX_KEEPALIVE", "20"))  # 保持复用的空闲连接数
+GRAPH_KEEPALIVE_EXPIRY = float(os.getenv("GRAPH_KEEPALIVE_EXPIRY", "60"))  # 空闲连接保留秒数
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", "10"))
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "5"))
+# 单个用户同时发往 Graph 的请求数上限（OneNote 按用户 + 应用限流，批量读取页面时生效）
+GRAPH_USER_CONCURRENCY = int(os.getenv("GRAPH_USER_CONCURRENCY", "4"))
+# 令牌桶限流：全局与每个用户的平均速率（请求/秒）与突发容量，设为 0 关闭对应限流
+GRAPH_RATE = float(os.getenv("GRAPH_RATE", "50"))
+GRAPH_BURST = float(os.getenv("GRAPH_BURST", "100"))
+GRAPH_USER_RATE = float(os.getenv("GRAPH_USER_RATE", "10"))
+GRAPH_USER_BURST = float(os.getenv("GRAPH_USER_BURST", "20"))
+# 429 / 503 的重试：优先遵循 Retry-After，否则指数退避，均带随机抖动
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "3"))
+GRAPH_RETRY_BASE = float(os.getenv("GRAPH_RETRY_BASE", "0.5"))  # 指数退避的初始等待（秒）
+GRAPH_RETRY_MAX_DELAY = float(os.getenv("GRAPH_RETRY_MAX_DELAY", "30"))  # 单次等待上限（秒）
+RETRY_STATUSES = (429, 503)
+GRAPH_BATCH_SIZE = 20  # Graph JSON 批处理单次最多 20 个请求
+
+
+class TokenProvider(Protocol):
+    """可刷新的访问令牌（见 token_manager.SessionToken）"""
+
+    access_token: str
+
+    async def refresh(self) -> str: ...
+
+
+GraphToken = Union[str, TokenProvider, None]
+
+
+class TokenBucket:
+    """
+    异步令牌桶：按 rate 匀速补充、最多积累 capacity 个令牌，取不到令牌时等待
+    Graph 返回 Retry-After 时通过 pause() 让整个桶暂停，后续请求一并等待
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, amount: float = 1) -> float:
+        """取 amount 个令牌（批处理按内部请求数计），返回为此等待的秒数"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                delay = self._paused_until - now
+            else:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期）"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class GraphClient:
+    """
+    共享的 Microsoft Graph HTTP 客户端
+
+    整个进程复用同一个 httpx.AsyncClient，开启连接池与 HTTP keep-alive，
+    避免每次调用都重新进行 TCP + TLS 握手；认证头也只在这里统一生成。
+    """
+
+    def __init__(
+        self,
+        base_url: str = GRAPH_BASE_URL,
+        max_connections: int = GRAPH_MAX_CONNECTIONS,
+        max_keepalive_connections: int = GRAPH_MAX_KEEPALIVE,
+        keepalive_expiry: float = GRAPH_KEEPALIVE_EXPIRY,
+        timeout: float = GRAPH_TIMEOUT,
+        connect_timeout: float = GRAPH_CONNECT_TIMEOUT,
+        user_concurrency: int = GRAPH_USER_CONCURRENCY,
+        rate: float = GRAPH_RATE,
+        burst: float = GRAPH_BURST,
+        user_rate: float = GRAPH_USER_RATE,
+        user_burst: float = GRAPH_USER_BURST,
+        max_retries: int = GRAPH_MAX_RETRIES,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.user_concurrency = user_concurrency
+        self._user_limits = TTLCache(maxsize=4096, ttl=3600)
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._user_buckets = TTLCache(maxsize=4096, ttl=3600)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """懒加载底层连接池（需在事件循环内首次创建）"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        return self._client
+
+    def user_limit(self, user_key: str) -> asyncio.Semaphore:
+        """同一用户共享的并发信号量，批量请求 Graph 时用 async with 包裹每个请求"""
+        semaphore = self._user_limits.get(user_key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.user_concurrency)
+        # 每次访问都重新写入以顺延过期时间，避免使用中的信号量被淘汰
+        self._user_limits.set(user_key, semaphore)
+        return semaphore
+
+    def url(self, path: str) -> str:
+        """相对路径拼接到 Graph 根地址；完整 URL（如 token 端点、nextLink）原样返回"""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    @staticmethod
+    def auth_headers(token: Optional[str], headers: Optional[dict] = None) -> dict:
+        """统一生成认证头"""
+        merged = dict(headers or {})
+        if token:
+            merged["Authorization"] = f"Bearer {token}"
+        return merged
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        token: GraphToken = None,
+        headers: Optional[dict] = None,
+        cost: int = 1,
+        **kwargs,
+    ) -> httpx.Response:
+        """
+        发送请求；网络错误以 httpx.HTTPError 抛出，由调用方转换为 HTTPException
+        token 为可刷新令牌时，遇到 401 会刷新令牌并重试一次
+        发送前经过用户级与全局令牌桶；遇到 429 / 503 按 Retry-After（带抖动）重试，最多 max_retries 次
+        """
+        access_token = token if token is None or isinstance(token, str) else token.access_token
+        url = self.url(path)
+        # 只对 Graph 接口限流（token 端点等其他地址不受影响）
+        limited = url.startswith(self.base_url)
+        user_bucket = self._user_bucket(token) if limited else None
+        with span(f"graph_{method.lower()}"):
+            attempt = 0
+            refreshed = False  # 令牌只刷新一次，与 429 / 503 的重试次数无关
+            while True:
+                if limited:
+                    await self._throttle(user_bucket, cost)
+                response = await self.client.request(
+                    method.upper(),
+                    url,
+                    headers=self.auth_headers(access_token, headers),
+                    **kwargs,
+                )
+                if response.status_code == 401 and hasattr(token, "refresh") and not refreshed:
+                    refreshed = True
+                    access_token = await token.refresh()
+                    response = await self.client.request(
+                        method.upper(),
+                        url,
+                        headers=self.auth_headers(access_token, headers),
+                        **kwargs,
+                    )
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                graph_throttled.inc(status=response.status_code, method=method.upper())
+                if attempt >= self.max_retries:
+                    return response
+                retry_after = retry_after_seconds(response)
+                delay = self._retry_delay(retry_after, attempt)
+                if retry_after is not None and limited:
+                    # Graph 明确要求等待：429 针对当前用户，503 说明服务整体过载
+                    bucket = self._global_bucket if response.status_code == 503 else user_bucket
+                    if bucket is not None:
+                        bucket.pause(delay)
+                graph_retries.inc(status=response.status_code)
+                await response.aclose()
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    @staticmethod
+    def _retry_delay(retry_after: Optional[float], attempt: int) -> float:
+        """有 Retry-After 时在其基础上加少量抖动，否则指数退避（full jitter）"""
+        if retry_after is not None:
+            return min(GRAPH_RETRY_MAX_DELAY, retry_after + random.uniform(0, 0.1 * retry_after + 0.1))
+        return random.uniform(0, min(GRAPH_RETRY_MAX_DELAY, GRAPH_RETRY_BASE * 2 ** attempt))
+
+    def _user_bucket(self, token: GraphToken) -> Optional[TokenBucket]:
+        """按会话（可刷新令牌）或访问令牌区分用户"""
+        if self.user_rate <= 0 or token is None:
+            return None
+        user_key = getattr(token, "session_id", None) or (token if isinstance(token, str) else None)
+        if user_key is None:
+            return None
+        bucket = self._user_buckets.get(user_key)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+        self._user_buckets.set(user_key, bucket)
+        return bucket
+
+    async def _throttle(self, user_bucket: Optional[TokenBucket], cost: int = 1):
+        """先过用户桶再过全局桶，记录被本地限流延迟的请求"""
+        for scope, bucket in (("user", user_bucket), ("global", self._global_bucket)):
+            if bucket is None:
+                continue
+            waited = await bucket.acquire(cost)
+            if waited > 0:
+                graph_rate_limited.inc(scope=scope)
+                stage_duration.observe(waited, stage="graph_rate_wait", scope=scope)
+
+    async def get(self, path: str, token: GraphToken = None, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, token, **kwargs)
+
+    async def post(self, path: str, token: GraphToken = None, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, token, **kwargs)
+
+    async def patch(self, path: str, token: GraphToken = None, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", path, token, **kwargs)
+
+    def _batch_path(self, path: str) -> str:
+        """$batch 中的 url 需相对于版本根路径"""
+        if path.startswith(self.base_url):
+            path = path[len(self.base_url):]
+        return "/" + path.lstrip("/")
+
+    @staticmethod
+    def _batch_item_response(method: str, url: str, item: dict) -> httpx.Response:
+        """把 $batch 中的单个结果还原为 httpx.Response，调用方可照常使用 .text / .json()"""
+        headers = item.get("headers") or {}
+        body = item.get("body")
+        if body is None:
+            content = b""
+        elif isinstance(body, (dict, list)):
+            content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        elif "json" in headers.get("Content-Type", "").lower():
+            content = body.encode("utf-8")
+        else:
+            # 非 JSON 响应（如页面 HTML）以 base64 字符串返回
+            try:
+                content = base64.b64decode(body, validate=True)
+            except ValueError:
+                content = body.encode("utf-8")
+        return httpx.Response(item.get("status", 500), headers=headers, content=content,
+                              request=httpx.Request(method, url))
+
+    async def _batch_chunk(self, items: list[tuple[str, str, Optional[dict]]], token: GraphToken) -> list:
+        """发送一个 $batch（最多 20 个请求）；其中被限流的请求按 Retry-After 单独重试"""
+        results: list[Optional[httpx.Response]] = [None] * len(items)
+        pending = list(range(len(items)))
+        attempt = 0
+        while pending:
+            body = {"requests": [
+                {"id": str(i), "method": items[i][0], "url": self._batch_path(items[i][1]),
+                 **({"headers": items[i][2]} if items[i][2] else {})}
+                for i in pending
+            ]}
+            response = await self.request("POST", "/$batch", token, cost=len(pending), json=body)
+            if response.status_code != 200:
+                # 整个批处理失败，所有未完成的请求都返回同一个错误
+                for i in pending:
+                    results[i] = response
+                break
+            retry, retry_after = [], 0.0
+            for item in response.json().get("responses", []):
+                i = int(item["id"])
+                results[i] = self._batch_item_response(items[i][0], self.url(items[i][1]), item)
+                if results[i].status_code in RETRY_STATUSES:
+                    graph_throttled.inc(status=results[i].status_code, method="BATCH")
+                    retry.append(i)
+                    retry_after = max(retry_after, retry_after_seconds(results[i]) or 0.0)
+            if not retry or attempt >= self.max_retries:
+                break
+            graph_retries.inc(status="batch")
+            await asyncio.sleep(self._retry_delay(retry_after or None, attempt))
+            pending, attempt = retry, attempt + 1
+        return results
+
+    async def _limited_batch_chunk(self, items: list[tuple[str, str, Optional[dict]]], token: GraphToken,
+                                   user_key: Optional[str]) -> list:
+        if user_key is None:
+            return await self._batch_chunk(items, token)
+        async with self.user_limit(user_key):
+            return await self._batch_chunk(items, token)
+
+    async def batch(self, items: list[tuple[str, str, Optional[dict]]], token: GraphToken = None,
+                    user_key: Optional[str] = None) -> list:
+        """
+        通过 Graph JSON 批处理（/$batch）发送多个请求，每 20 个合并为一次往返，多个批次并发发送
+        items 为 (method, path, headers)，返回与 items 顺序一致的 httpx.Response 列表
+        传入 user_key 时每个批次占用该用户的一个并发名额（user_limit），与单个请求共享同一上限
+        """
+        chunks = [items[i:i + GRAPH_BATCH_SIZE] for i in range(0, len(items), GRAPH_BATCH_SIZE)]
+        results = await asyncio.gather(*(self._limited_batch_chunk(chunk, token, user_key) for chunk in chunks))
+        responses = [response for chunk in results for response in chunk]
+        # 批处理结果中缺失的请求按网关错误处理
+        return [
+            response or httpx.Response(502, request=httpx.Request(method, self.url(path)))
+            for response, (method, path, _) in zip(responses, items)
+        ]
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+# 全局共享实例
+graph_client = GraphClient()
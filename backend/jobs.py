@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import math
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from cache import TTLCache
+from metrics import stage_duration, jobs_total
+from session_store import create_session_store
+
+logger = logging.getLogger(__name__)
+
+# 加载环境变量
+load_dotenv()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # 同时执行的后台任务数
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))  # 排队任务上限，超过时拒绝新任务（503）
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))  # 单个任务的最长执行时间（秒）
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))  # 任务状态与结果保留时间（秒）
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # 订阅其他 worker 上的任务时查询共享存储的间隔（秒）
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    owner: str
+    func: Callable[[], Awaitable[Any]]
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # 每次状态变化时触发并替换，供 SSE 等待
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    进程内后台任务队列
+
+    固定数量的 worker 从有界队列中取任务执行，队列满时 submit 直接抛出 503（带 Retry-After），
+    突发流量不会无限堆积；任务状态按 JOB_RESULT_TTL 保留，供轮询或 SSE 查询。
+    任务在提交它的进程中执行，状态与结果同时写入 SESSION_BACKEND 指定的共享存储，
+    多 worker 部署时任意 worker 都能查询。
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, maxsize: int = JOB_QUEUE_SIZE,
+                 timeout: float = JOB_TIMEOUT, result_ttl: float = JOB_RESULT_TTL, store=None):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._jobs = TTLCache(maxsize=max(1024, maxsize * 10), ttl=result_ttl)
+        self._store = store if store is not None else create_session_store(ttl=result_ttl, name="jobs")
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._avg_duration = 10.0  # 任务平均耗时的滑动估计，用于计算 Retry-After
+
+    def start(self):
+        """在事件循环内启动 worker（应用 lifespan 中调用）"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def retry_after(self) -> int:
+        """按当前排队数与平均耗时估算客户端应等待的秒数"""
+        pending = self._queue.qsize() if self._queue is not None else 0
+        return max(1, math.ceil(self._avg_duration * pending / max(1, self.workers)))
+
+    async def submit(self, kind: str, owner: str, func: Callable[[], Awaitable[Any]]) -> Job:
+        if self._queue is None:
+            self.start()
+        job = Job(id=uuid.uuid4().hex, kind=kind, owner=owner, func=func)
+        if self._queue.full():
+            jobs_total.inc(kind=kind, status="rejected")
+            raise HTTPException(status_code=503, detail="Job queue is full, please retry later",
+                                headers={"Retry-After": str(self.retry_after())})
+        self._jobs.set(job.id, job)
+        # 先写入共享存储再入队，其他 worker 立即可以查到
+        await self._save(job)
+        self._queue.put_nowait(job)
+        jobs_total.inc(kind=kind, status=QUEUED)
+        return job
+
+    async def _save(self, job: Job):
+        try:
+            await self._store.set(job.id, {**job.to_dict(), "owner": job.owner})
+        except Exception as e:
+            logger.error(f"保存任务 {job.id} 状态失败: {str(e)}")
+
+    async def get(self, job_id: str, owner: str) -> dict:
+        """只能查询自己提交的任务，其他情况一律 404；本进程的任务直接读内存，否则读共享存储"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            data = job.to_dict() if job.owner == owner else None
+        else:
+            data = await self._store.get(job_id)
+            if data is not None and data.pop("owner", None) != owner:
+                data = None
+        if data is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return data
+
+    async def watch(self, job_id: str, owner: str, heartbeat: float = 15):
+        """
+        订阅任务状态：每次状态变化产出一次状态字典，任务结束后停止；超过 heartbeat 秒无变化时产出 None（用于 SSE 心跳）
+        本进程的任务等待状态变化事件，其他 worker 上的任务按 JOB_POLL_INTERVAL 轮询共享存储
+        """
+        job = self._jobs.get(job_id)
+        if job is not None and job.owner == owner:
+            while True:
+                # 先取得事件再产出状态，避免产出期间发生的变化被漏掉
+                changed = job.changed
+                yield job.to_dict()
+                if job.done:
+                    return
+                while not await self._wait_change(changed, heartbeat):
+                    yield None
+        last, idle = None, 0.0
+        while True:
+            data = await self.get(job_id, owner)
+            if data != last:
+                last, idle = data, 0.0
+                yield data
+                if data["status"] in (SUCCEEDED, FAILED):
+                    return
+            elif idle >= heartbeat:
+                idle = 0.0
+                yield None
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            idle += JOB_POLL_INTERVAL
+
+    @staticmethod
+    async def _wait_change(changed: asyncio.Event, timeout: float) -> bool:
+        """等待先前取得的 job.changed 被触发，超时返回 False"""
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _update(self, job: Job, status: str):
+        job.status = status
+        await self._save(job)
+        event, job.changed = job.changed, asyncio.Event()
+        event.set()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.started_at = time.time()
+        stage_duration.observe(job.started_at - job.created_at, stage="job_wait", kind=job.kind)
+        await self._update(job, RUNNING)
+        try:
+            job.result = await asyncio.wait_for(job.func(), self.timeout)
+            status = SUCCEEDED
+        except HTTPException as e:
+            job.error = str(e.detail)
+            status = FAILED
+        except asyncio.TimeoutError:
+            job.error = f"Job timed out after {self.timeout:.0f}s"
+            status = FAILED
+        except Exception as e:
+            logger.error(f"后台任务 {job.kind} 失败: {str(e)}", exc_info=True)
+            job.error = str(e)
+            status = FAILED
+        job.finished_at = time.time()
+        duration = job.finished_at - job.started_at
+        self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        stage_duration.observe(duration, stage="job_run", kind=job.kind)
+        jobs_total.inc(kind=job.kind, status=status)
+        job.func = None  # 释放闭包中的令牌与页面内容
+        await self._update(job, status)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.maxsize,
+            "avg_duration": round(self._avg_duration, 2),
+        }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import re
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from cache import TTLCache
+from metrics import llm_cache_requests
+from session_store import SQLiteSessionStore
+
+# 加载环境变量
+load_dotenv()
+# 输出足够稳定、可以复用的任务
+LLM_CACHE_TASKS = {t.strip() for t in os.getenv("LLM_CACHE_TASKS", "page_abstract,question_generate,chunk_summary").split(",") if t.strip()}
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))  # 内存中缓存的响应条数
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))  # 响应缓存有效期（秒）
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", "")  # 设置后启用磁盘缓存（SQLite），重启后仍有效
+
+
+def normalize_prompt(prompt: str) -> str:
+    """归一化提示词：合并空白字符，避免无意义的格式差异导致缓存不命中"""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def cache_key(task: str, model: Optional[str], prompt: str) -> str:
+    raw = f"{task}\x00{model or ''}\x00{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    按 (任务, 模型, 归一化提示词) 内容寻址的 LLM 响应缓存
+
+    内存层为 LRU + TTL；配置 LLM_CACHE_DB_PATH 时再加一层 SQLite 磁盘缓存，
+    内存未命中时回查磁盘并回填内存。
+    """
+
+    def __init__(self, tasks: set = LLM_CACHE_TASKS, maxsize: int = LLM_CACHE_SIZE,
+                 ttl: float = LLM_CACHE_TTL, db_path: str = LLM_CACHE_DB_PATH):
+        self.tasks = tasks
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize, ttl)
+        self._disk = SQLiteSessionStore(db_path, ttl, table="llm_cache") if db_path else None
+        self.hits = 0
+        self.misses = 0
+
+    def enabled(self, task: str) -> bool:
+        return task in self.tasks
+
+    async def get(self, task: str, model: Optional[str], prompt: str) -> Optional[str]:
+        key = cache_key(task, model, prompt)
+        content = self._memory.get(key)
+        if content is None and self._disk is not None:
+            entry = await self._disk.get(key)
+            if entry is not None:
+                content = entry["content"]
+                self._memory.set(key, content)
+        if content is None:
+            self.misses += 1
+            llm_cache_requests.inc(result="miss", task=task)
+        else:
+            self.hits += 1
+            llm_cache_requests.inc(result="hit", task=task)
+        return content
+
+    async def set(self, task: str, model: Optional[str], prompt: str, content: str):
+        if not content:
+            return
+        key = cache_key(task, model, prompt)
+        self._memory.set(key, content)
+        if self._disk is not None:
+            await self._disk.set(key, {"task": task, "content": content})
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._memory),
+            "disk": self._disk is not None,
+        }
+
+
+llm_cache = LLMResponseCache()
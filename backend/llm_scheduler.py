@@ -0,0 +1,105 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+
+from dotenv import load_dotenv
+
+from metrics import span, llm_coalesced
+
+logger = logging.getLogger(__name__)
+
+# 加载环境变量
+load_dotenv()
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "16"))  # 同时进行的 LLM 调用上限，0 表示不限制
+
+# 优先级：数值越小越先获得调用名额
+INTERACTIVE, BATCH = 0, 1
+# 当前上下文的 LLM 调用优先级；后台任务、分区出题、题库补题设为 BATCH，让位于对话等交互请求
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+class LLMScheduler:
+    """
+    LLM 调用调度器
+
+    - 同时进行的调用不超过 max_inflight，超出的调用按 (优先级, 到达顺序) 排队，
+      上游限流时交互请求不会被批量任务挤在后面；
+    - 相同 key（任务 + 模型 + 提示词）的调用在进行中时合并为一次，其他调用方等待同一个结果。
+    """
+
+    def __init__(self, max_inflight: int = LLM_MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        self._inflight = 0
+        self._waiters: list = []  # (优先级, 序号, future) 的小顶堆
+        self._seq = itertools.count()
+        self._calls: dict[str, asyncio.Task] = {}
+
+    async def _acquire(self, priority: int):
+        if self.max_inflight <= 0:
+            return
+        if self._inflight < self.max_inflight and not self._waiters:
+            self._inflight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # 名额已转交给本调用但调用方被取消，继续转交给下一个
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        if self.max_inflight <= 0:
+            return
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                # 名额直接转交，进行中的调用数不变
+                waiter.set_result(None)
+                return
+        self._inflight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = None):
+        """占用一个调用名额（流式调用在整个输出期间占用）"""
+        priority = llm_priority.get() if priority is None else priority
+        with span("llm_queue"):
+            await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _call(self, call: Callable[[], Awaitable[Any]]):
+        async with self.slot():
+            return await call()
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]):
+        """在名额内执行 call；相同 key 的调用进行中时直接等待其结果"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(self._call(call))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            llm_coalesced.inc()
+        # 调用方被取消（如客户端断开）不影响其他等待同一结果的调用方
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "max_inflight": self.max_inflight,
+            "inflight": self._inflight,
+            "queued": sum(1 for _, _, waiter in self._waiters if not waiter.done()),
+            "coalescing": len(self._calls),
+        }
+
+
+llm_scheduler = LLMScheduler()
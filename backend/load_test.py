@@ -0,0 +1,77 @@
+"""
+并发压测脚本：验证异步路由在慢 LLM / Graph 调用下是否并发执行，而不是逐个排队
+
+用法：
+    python load_test.py --concurrency 50 --llm-delay 2
+
+Graph 与 LLM 使用 bench 中的本地替身（fake_graph / fake_llm），各自在独立线程中由 uvicorn 监听端口，
+main 通过 GRAPH_BASE_URL 与 BASE_URL 指向它们，请求经过真实的 GraphClient 与 AsyncOpenAI 网络路径。
+若这些路径中有同步阻塞调用，总耗时约为 concurrency * delay；并发正常时总耗时接近单次耗时。
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from bench import fake_graph, fake_llm
+from bench.run_bench import free_port, start_server
+
+
+async def run_load_test(backend, concurrency: int) -> float:
+    await backend.user_sessions.set("load-test", {"user_id": "load-test", "access_token": "fake-token"})
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=120,
+                                 cookies={"auth_session": "load-test"}) as client:
+        async def one_request(i: int):
+            # 每个请求使用不同的页面，页面内容与 LLM 回复都无法命中缓存或合并
+            r = await client.post("/api/dialogue", json={"user_print": f"问题 {i}", "page_id": f"nb-0-sec-0-page-{i}"})
+            r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request(i) for i in range(concurrency)))
+        return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="异步路由并发压测")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--llm-delay", type=float, default=2.0)
+    parser.add_argument("--graph-delay", type=float, default=0.2)
+    ARGS = parser.parse_args()
+
+    fake_graph.settings.latency = ARGS.graph_delay
+    fake_graph.settings.jitter = 0
+    fake_graph.settings.pages_per_section = max(fake_graph.settings.pages_per_section, ARGS.concurrency)
+    fake_llm.settings.ttft = ARGS.llm_delay
+    fake_llm.settings.completion_tokens = 20
+    fake_llm.settings.tokens_per_second = 1000
+    graph_port, llm_port = free_port(), free_port()
+    start_server(fake_graph.app, graph_port)
+    start_server(fake_llm.app, llm_port)
+
+    # 必须在导入 main 之前把后端指向替身
+    os.environ["GRAPH_BASE_URL"] = f"http://127.0.0.1:{graph_port}/v1.0"
+    os.environ["BASE_URL"] = f"http://127.0.0.1:{llm_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "load-test")
+    os.environ.setdefault("MODEL", "fake-model")
+    os.environ["SESSION_BACKEND"] = "memory"
+    os.environ["DIALOGUE_DB_PATH"] = ""
+    os.environ["RETRIEVAL_AUTO_INDEX"] = "0"
+    # 只验证事件循环是否被阻塞，关闭按用户限流与 LLM 并发上限
+    os.environ["GRAPH_USER_RATE"] = "0"
+    os.environ["LLM_MAX_INFLIGHT"] = "0"
+    import main
+
+    elapsed = asyncio.run(run_load_test(main, ARGS.concurrency))
+    single = ARGS.llm_delay + ARGS.graph_delay
+    serial = single * ARGS.concurrency
+    print(f"并发请求数: {ARGS.concurrency}")
+    print(f"单次请求耗时: {single:.2f}s，串行预期总耗时: {serial:.2f}s")
+    print(f"实际总耗时: {elapsed:.2f}s")
+    # 允许一倍的调度开销；超过说明请求被串行化（事件循环被阻塞）
+    if elapsed > single * 2:
+        raise SystemExit("FAIL: 请求没有并发执行，事件循环可能被阻塞")
+    print("OK: 请求并发执行")
@@ -1,766 +1,1511 @@
-import json
-import secrets
-import traceback
-from urllib.parse import urlencode
-from fastapi import FastAPI, HTTPException, Request, status,Response
-from fastapi.responses import RedirectResponse,HTMLResponse
-
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List, Any
-import os
-import requests
-from dotenv import load_dotenv
-from ulits import clean_onenote_content, llm_generate, extract_full_html, llm_json_parse
-import logging
-class AnalyzeAnswersResponse(BaseModel):
-    overall_suggestions: str
-logger = logging.getLogger(__name__)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # 确保输出到控制台
-        logging.FileHandler('app.log')  # 同时输出到文件
-    ]
-)
-# 允许 Chrome Extension 调用
-
-# 加载环境变量
-load_dotenv()
-ONENOTE_CLIENT_ID = os.getenv("ONENOTE_CLIENT_ID")  # 可通过 OAuth2 获取
-ONENOTE_CLIENT_SECRET = os.getenv("ONENOTE_CLIENT_SECRET")  # 可通过 OAuth2 获取
-ONENOTE_REDIRECT_URI = os.getenv("ONENOTE_REDIRECT_URI")  # 可通过 OAuth2 获取
-
-
-SCOPE = [
-    "https://graph.microsoft.com/Notes.ReadWrite",
-    "https://graph.microsoft.com/User.Read",
-    "offline_access"
-]
-TOKEN_URL = r"https://login.microsoftonline.com/common/oauth2/v2.0/token"
-AUTH_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/authorize?"
-# 初始化 OpenAI 客户端（推荐使用新版 SDK）
-
-app = FastAPI(title="ReadNote OneNote Backend")
-# ⚠️ 安全提示：生产环境应限制 origins，不要用 ["*"]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:8002",
-        "http://127.0.0.1:8002",
-        "chrome-extension://你的扩展ID"  # 例如：chrome-extension://abc123def456
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# 模拟用户 token 存储（生产环境应使用数据库 + session）
-user_sessions = {}  # { session_id: { "access_token": "...", "refresh_token": "...", "user": "..." } }
-
-
-# ----------------------------
-# 模型定义
-# ----------------------------
-class NoteRequest(BaseModel):
-    text: str
-    notebook_id: Optional[str] = None
-    section_id: Optional[str] = None
-    page_id: Optional[str] = None
-    create_new: bool = True
-
-
-class NoteResponse(BaseModel):
-    note: str
-    page_url: Optional[str] = None
-
-
-class OneNoteItem(BaseModel):
-    id: str
-    displayName: str
-
-class OneNotePage(BaseModel):
-    id: str
-    title: str
-    contentUrl: str
-    lastModifiedDateTime: str
-    createdByAppId: Optional[str] = None
-
-
-# 替换现有的 CreatePageRequest 模型
-class CreatePageRequest(BaseModel):
-    section_id: str
-    title: str
-    content: str
-
-    class Config:
-        extra = "allow"  # 允许额外字段
-
-class CreateSectionRequest(BaseModel):
-    displayName: str
-    notebook_id: str
-
-    class Config:
-        extra = "allow"  # 允许额外字段
-class dialogueRequest(BaseModel):
-    user_print: str
-    page_id: str
-
-    class Config:
-        extra = "allow"  # 允许额外字段
-    # 注意：没有 displayName
-# ========== 临时存储（仅用于演示！）==========
-# 生产环境请使用数据库、Redis 或加密 cookie
-
-# ========== 工具函数 ==========
-def get_session_id(request: Request) -> str:
-    """从 cookie 获取或创建 session_id"""
-    session_id = request.cookies.get("session_id")
-    if not session_id:
-        session_id = secrets.token_urlsafe(32)
-    return session_id
-
-# ----------------------------
-# 工具函数
-# ----------------------------
-
-
-
-
-def sync_to_onenote(
-    token: str,
-    note_text: str,
-    section_id: Optional[str] = None,
-    page_id: Optional[str] = None,
-    create_new: bool = True
-    ) -> str:
-    """同步笔记到 OneNote"""
-    if create_new:
-        if not section_id:
-            endpoint = "https://graph.microsoft.com/v1.0/me/onenote/pages"
-        else:
-            endpoint = f"https://graph.microsoft.com/v1.0/me/onenote/sections/{section_id}/pages"
-
-        body = {
-            "title": "AI 生成笔记",
-            "content": f"<p>{note_text}</p>"
-        }
-        resp = onenote_request("POST", endpoint, token, body)
-    else:
-        if not page_id:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="page_id is required when create_new=False"
-            )
-        endpoint = f"https://graph.microsoft.com/v1.0/me/onenote/pages/{page_id}/content"
-        body = [{
-            "target": "body",
-            "action": "append",
-            "content": f"<p>{note_text}</p>"
-        }]
-        resp = onenote_request("PATCH", endpoint, token, body)
-
-    return resp.get("links", {}).get("oneNoteWebUrl", {}).get("href")
-
-
-
-def onenote_request(method: str, url: str, token: str, json_data: Optional[Any] = None) -> dict:
-    """统一处理 OneNote API 请求"""
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    try:
-        if method.upper() == "GET":
-            r = requests.get(url, headers=headers, timeout=10)
-        elif method.upper() == "POST":
-            r = requests.post(url, headers=headers, json=json_data, timeout=10)
-        elif method.upper() == "PATCH":
-            r = requests.patch(url, headers=headers, json=json_data, timeout=10)
-        else:
-            raise ValueError("Unsupported HTTP method")
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            detail=f"OneNote API request failed: {str(e)}"
-        )
-
-    if r.status_code not in (200, 201):
-        raise HTTPException(status_code=r.status_code, detail=r.text)
-
-    return r.json()
-
-
-
-# ----------------------------
-# API 路由
-# ----------------------------
-
-
-@app.get("/")
-def read_root():
-    return {"Hello": "World"}
-
-
-# 模拟：用内存存储 user -> token 映射（生产环境用 DB）
-user_info_store: dict[str, dict] = {}  # token -> user_info
-
-
-
-
-
-@app.get("/login")
-def login(request: Request):
-    """生成授权 URL 并重定向用户到 Microsoft 登录页"""
-    session_id = get_session_id(request)
-    state = secrets.token_urlsafe(16)  # 用于防 CSRF
-    # 临时保存 state（可存 DB，这里用 session_id 关联）
-    user_sessions[session_id] = {"oauth_state": state}
-    redirect_uri = f"{ONENOTE_REDIRECT_URI}?session_id={session_id}"
-
-    params = {
-        "client_id": ONENOTE_CLIENT_ID,
-        "response_type": "code",
-        "redirect_uri": redirect_uri,
-        "scope": " ".join(SCOPE),
-        "response_mode": "query",
-        "state":state
-    }
-
-    auth_url = AUTH_URL + urlencode(params)
-    return {"login_url": auth_url}
-
-
-
-@app.get("/callback")
-def callback(response: Response,request: Request):
-    """接收授权码，换取 access_token，并保存到会话"""
-    session_id = request.query_params.get("session_id")
-    if not session_id or session_id not in user_sessions:
-        raise HTTPException(status_code=400, detail="Invalid session")
-
-    # 验证 state 防 CSRF
-    expected_state = user_sessions[session_id].get("oauth_state")
-    received_state = request.query_params.get("state")
-    if received_state != expected_state:
-        raise HTTPException(status_code=400, detail="Invalid state parameter")
-
-    code = request.query_params.get("code")
-    if not code:
-        raise HTTPException(status_code=400, detail="No code provided")
-    redirect_uri = f"{ONENOTE_REDIRECT_URI}?session_id={session_id}"
-
-    # 换取 token
-    data = {
-        "client_id": ONENOTE_CLIENT_ID,
-        "scope": " ".join(SCOPE),
-        "code": code,
-        "redirect_uri": redirect_uri,
-        "grant_type": "authorization_code",
-        "client_secret": ONENOTE_CLIENT_SECRET,
-    }
-    try:
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        r = requests.post(TOKEN_URL, headers=headers, data=data)
-        r.raise_for_status()
-        token_data = r.json()
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Token exchange failed: {str(e)}")
-    permanent_session_id = secrets.token_urlsafe(32)
-
-    # 存储正式会话（可替换临时 session）
-    user_sessions[permanent_session_id] = {
-        "user_id": session_id,
-        "access_token": token_data["access_token"],
-        "refresh_token": token_data.get("refresh_token"),
-    }
-    # 在 /callback 成功后，可删除临时 session_id
-    if session_id in user_sessions:
-        del user_sessions[session_id]
-    redirect_resp = RedirectResponse(url="/auth/success")
-
-    redirect_resp.set_cookie(
-        key="auth_session",
-        value=permanent_session_id,
-        httponly=True,
-        secure=False,  # 本地开发用 False，生产用 True
-        samesite="lax",
-        max_age=3600  # 1小时
-    )
-    return redirect_resp
-    # # 保存令牌（含 refresh_token），但不获取用户信息
-    # user_sessions[session_id].update({
-    #     "access_token": token_data["access_token"],
-    #     "refresh_token": token_data.get("refresh_token"),
-    #     "expires_in": token_data.get("expires_in"),
-    #     # 注意：不再在这里设置 user
-    # })
-    # 重定向到 profile，由 profile 按需加载用户信息
-    # return JSONResponse({"status": "success"})
-
-@app.get("/auth/success")
-async def auth_success():
-    return HTMLResponse(open("html/success.html",encoding="utf-8").read())
-
-
-@app.get("/profile")
-def profile(request: Request):
-    """显示用户信息和 OneNote 状态（按需获取用户信息）"""
-    # session_id = request.cookies.get("session_id")
-    # session = user_sessions.get(session_id)
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    # 按需获取用户信息（如果尚未缓存）
-    user = session.get("user")
-    if user is None:
-        try:
-            user_resp = requests.get(
-                "https://graph.microsoft.com/v1.0/me",
-                headers={"Authorization": f"Bearer {session['access_token']}"}
-            )
-            if user_resp.status_code == 200:
-                user = user_resp.json()
-                session["user"] = user  # 缓存到会话
-            else:
-                user = {}  # 或保留为 None，前端可处理
-        except Exception:
-            user = {}
-
-    return {
-        "message": "Login successful!",
-        "user": user,
-        "has_access_token": True,  # 此时一定有，因为上面已校验
-    }
-
-
-@app.get("/api/notebooks")
-def get_notebooks(request: Request):
-    """调用 Microsoft Graph 获取 OneNote 笔记本"""
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-
-    headers = {"Authorization": f"Bearer {session['access_token']}"}
-    r = requests.get("https://graph.microsoft.com/v1.0/me/onenote/notebooks", headers=headers)
-    if r.status_code == 401:
-        # Token 可能过期，尝试用 refresh_token 刷新（此处省略，可扩展）
-        raise HTTPException(status_code=401, detail="Token expired")
-    elif r.status_code != 200:
-        raise HTTPException(status_code=r.status_code, detail=r.text)
-    return r.json()["value"]
-
-
-
-@app.get("/api/sections/{notebook_id}", response_model=List[OneNoteItem])
-async def get_sections(notebook_id: str, request: Request):
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    token = session["access_token"]
-    url = f"https://graph.microsoft.com/v1.0/me/onenote/notebooks/{notebook_id}/sections"
-    data = onenote_request("GET", url, token)
-    return data.get("value", [])
-
-
-@app.get("/api/pages/{section_id}", response_model=List[OneNotePage])
-def get_pages(section_id: str, request: Request):
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    token = session["access_token"]
-    # 2. 构造正确 URL（修复空格问题）
-    url = f"https://graph.microsoft.com/v1.0/me/onenote/sections/{section_id}/pages"
-    data = onenote_request("GET", url, token)
-    return data.get("value", [])
-
-# @app.post("/api/note", response_model=NoteResponse)
-# async def create_note(req: NoteRequest, request: Request):
-#     auth_session_id = request.cookies.get("auth_session")
-#     if not auth_session_id or auth_session_id not in user_sessions:
-#         raise HTTPException(status_code=401, detail="Not authenticated")
-#     session = user_sessions[auth_session_id]
-#     if "access_token" not in session:
-#         raise HTTPException(status_code=401, detail="Access token missing")
-#     token = session["access_token"]
-#     # note_text = generate_note_from_llm(req.text)
-#     note_text = "generate_note_from_llm(req.text)"
-#     page_url = sync_to_onenote(
-#         token=token,
-#         note_text=note_text,
-#         section_id=req.section_id,
-#         page_id=req.page_id,
-#         create_new=req.create_new
-#     )
-#     return NoteResponse(note=note_text, page_url=page_url)
-
-
-@app.post("/api/create-section")
-def create_section(section_data:CreateSectionRequest,request: Request) -> dict:
-
-    """
-    在指定的 OneNote 笔记本中创建一个新的分区
-    Returns:
-        创建的分区信息
-
-    Reference:
-        https://learn.microsoft.com/zh-cn/graph/api/notebook-post-sections?view=graph-rest-1.0&tabs=http
-    """
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    token = session["access_token"]
-    section_name = section_data.displayName
-    notebook_id = section_data.notebook_id
-    endpoint = f"https://graph.microsoft.com/v1.0/me/onenote/notebooks/{notebook_id}/sections"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    body = {
-        "displayName": section_name
-    }
-    try:
-        response = requests.post(endpoint, headers=headers, json=body, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            detail=f"Failed to create section: {str(e)}"
-        )
-
-
-
-# 替换现有的 create_page_endpoint 函数
-@app.post("/api/create-page")
-async def create_page_endpoint(page_data: CreatePageRequest, request: Request):
-    """
-    创建新页面的API端点
-
-    Args:
-        section_id: 分区 ID
-        title: 页面标题
-        content: 页面内容
-    """
-    # 首先检查认证
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    token = session["access_token"]
-
-    # 从 Pydantic 模型中获取数据
-    section_id = page_data.section_id
-    page_title = page_data.title
-    page_content = page_data.content
-    # 验证必要参数
-    if not section_id:
-        raise HTTPException(status_code=400, detail="Section ID is required")
-    if not page_title:
-        raise HTTPException(status_code=400, detail="Page title is required")
-    if not page_content:
-        raise HTTPException(status_code=400, detail="Page content is required")
-    try:
-        result = create_page(token, section_id, page_title, page_content)
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-# # 在需要输出日志的地方
-# logger.info("这是日志信息")
-# logger.error("这是错误信息")
-
-
-def create_page(token: str, section_id: str, page_title: str, page_content: str) -> dict:
-    """
-    在指定的 OneNote 分区中创建一个新的页面
-
-    Args:
-        token: 访问令牌
-        section_id: 分区 ID
-        page_title: 页面标题
-        page_content: 页面内容（HTML格式）
-
-    Returns:
-        创建的页面信息
-
-    Reference:
-        https://learn.microsoft.com/zh-cn/graph/api/section-post-pages?view=graph-rest-1.0&tabs=http
-    """
-    task="generate_page"
-    endpoint = f"https://graph.microsoft.com/v1.0/me/onenote/sections/{section_id}/pages"
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/xhtml+xml"
-    }
-
-    # 构建页面内容（XHTML格式）
-    xhtml_content = llm_generate(task,page_title=page_title,page_content=page_content)
-    xhtml_content=extract_full_html(xhtml_content)
-
-    try:
-        response = requests.post(endpoint, headers=headers, data=xhtml_content.encode('utf-8'), timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            detail=f"Failed to create page: {str(e)}"
-        )
-
-
-
-def get_page_content(token: str, page_id: str) -> str:
-    """
-       获取OneNote页面内容
-       https://learn.microsoft.com/zh-cn/graph/api/page-get?view=graph-rest-1.0&tabs=http
-       """
-    endpoint = f"https://graph.microsoft.com/v1.0/me/onenote/pages/{page_id}/content"
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "text/html"
-    }
-    try:
-        response = requests.get(endpoint, headers=headers, timeout=10)
-        response.raise_for_status()
-        # 返回页面内容
-        # 获取原始HTML内容
-        html_content = response.text
-
-        # 清理HTML内容，提取纯文本
-        clean_content = clean_onenote_content(html_content)
-
-        return clean_content
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            detail=f"Failed to get page content: {str(e)}"
-        )
-
-
-def update_page_content(token: str, page_id: str, html_content: str) -> dict:
-    """
-    更新指定 OneNote 页面的内容
-
-    Args:
-        token: 访问令牌
-        page_id: 要更新的页面 ID
-        html_content: 新的 HTML 内容
-
-    Returns:
-        更新操作的结果
-
-    Reference:
-        https://learn.microsoft.com/zh-cn/graph/api/page-update?view=graph-rest-1.0&tabs=http
-    """
-    endpoint = f"https://graph.microsoft.com/v1.0/me/onenote/pages/{page_id}/content"
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-
-    # 构造更新请求体
-    # 这里使用 'replace' 操作替换整个页面内容
-    body = [{
-        "target": "body",
-        "action": "replace",
-        "content": html_content
-    }]
-
-    try:
-        response = requests.patch(endpoint, headers=headers, json=body, timeout=10)
-        response.raise_for_status()
-
-        # OneNote 更新操作通常返回 204 No Content
-        # 根据文档，成功更新后不返回内容主体
-        if response.status_code == 204:
-            return {"status": "success", "message": "Page updated successfully"}
-        else:
-            # 如果返回了其他状态码，尝试解析 JSON 或返回通用成功消息
-            try:
-                return response.json()
-            except json.JSONDecodeError:
-                return {"status": "success", "message": f"Page updated with status {response.status_code}"}
-
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            detail=f"Failed to update page: {str(e)}"
-        )
-@app.post("/api/page-summary")
-async def generate_page_summary(request: Request, payload: dict):
-    """
-    生成指定页面内容摘要的API端点
-    """
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    token = session["access_token"]
-    page_id = payload.get("page_id")
-    if not page_id:
-        raise HTTPException(status_code=400, detail="Page ID is required")
-
-    try:
-        # 获取页面内容
-        page_content = get_page_content(token, page_id)
-        # 生成摘要
-        xhtml_summary = llm_generate("page_abstract",page_content=page_content)
-
-
-        return {"pagesummary":xhtml_summary}
-    except Exception as e:
-        raise (HTTPException(status_code=500, detail=str(e)))
-@app.post("/api/append-page")
-async def append_page(request: Request, payload: dict):
-    """
-    生成指定页面内容摘要的API端点
-    """
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    token = session["access_token"]
-    page_id = payload.get("page_id")
-    new_content = payload.get("pageContent")
-    if not page_id:
-        logger.error("append not page_id")
-        raise HTTPException(status_code=400, detail="Page ID is required")
-    if not new_content:
-        logger.error("append not new_content")
-        raise HTTPException(status_code=400, detail="Page ID is required")
-
-    try:
-        # 获取页面内容
-        old_note = get_page_content(token, page_id)
-        # 生成摘要
-        new_page = llm_generate("append_page",old_note=old_note,new_content=new_content)
-        xhtml_new_page = extract_full_html(new_page)
-        result=update_page_content(token,page_id,xhtml_new_page)
-        return result
-    except Exception as e:
-        logger.error(traceback.print_exc())
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post("/api/review-questions")
-async def generate_review_questions(request: Request, payload: dict):
-    """
-    生成指定页面内容摘要的API端点
-    """
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    token = session["access_token"]
-    page_id = payload.get("page_id")
-    question_num = payload.get("question_num", 5)
-    if not page_id:
-        raise HTTPException(status_code=400, detail="Page ID is required")
-    try:
-        # 获取页面内容
-
-        page_content = get_page_content(token, page_id)
-        page_content = clean_onenote_content(page_content)
-        review = llm_generate("question_generate", question_num=question_num,page_content=page_content)
-        review=llm_json_parse(review)
-        return {"questions":review}
-    except Exception as e:
-        logger.error(f"generate_review_questions错误: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post("/api/analyze-answers")
-async def analyze_answers(request: Request, payload: dict):
-    """
-    分析用户答题情况并提供学习建议
-    """
-    logger.info(f"/api/analyze-answers处理")
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    token = session["access_token"]
-    try:
-        # 获取并解析答题数据
-        answers_json = payload.get("question_a_answer")
-        page_id = payload.get("page_id")
-        page_content = get_page_content(token, page_id)
-        page_content = clean_onenote_content(page_content)
-        if not answers_json:
-            raise HTTPException(status_code=400, detail="Missing question_a_answer data")
-        # 解析JSON字符串为对象
-        user_answers = json.loads(answers_json)
-        # 调用LLM生成分析报告
-        xhtml_overall_suggestions = llm_generate("answer_analysis", user_answers=user_answers,page_content=page_content)
-        return AnalyzeAnswersResponse(overall_suggestions=xhtml_overall_suggestions)
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=400, detail=f"Invalid JSON format: {str(e)}")
-    except Exception as e:
-        logger.error(f"analyze_answers错误: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post("/api/dialogue")
-async def dialogue(request: Request, payload: dict):
-    """
-    分析用户答题情况并提供学习建议
-    """
-    auth_session_id = request.cookies.get("auth_session")
-    if not auth_session_id or auth_session_id not in user_sessions:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    session = user_sessions[auth_session_id]
-    if "access_token" not in session:
-        raise HTTPException(status_code=401, detail="Access token missing")
-    token = session["access_token"]
-    try:
-        # 获取并解析答题数据
-        user_print = payload.get("user_print")
-        page_id = payload.get("page_id")
-        page_content = get_page_content(token, page_id)
-        page_content = clean_onenote_content(page_content)
-        if not user_print:
-            raise HTTPException(status_code=400, detail="Missing user_print data")
-        # 解析JSON字符串为对象
-        # 调用LLM生成分析报告
-        dialogue = llm_generate("dialogue", user_print=user_print,page_content=page_content)
-        return {"replay":dialogue}
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=400, detail=f"Invalid JSON format: {str(e)}")
-    except Exception as e:
-        logger.error(f"analyze_answers错误: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-
+import asyncio
+import json
+import secrets
+import time
+import traceback
+from contextlib import asynccontextmanager
+from urllib.parse import urlencode
+from fastapi import FastAPI, HTTPException, Request, status,Response
+from fastapi.responses import RedirectResponse,HTMLResponse,StreamingResponse,PlainTextResponse,JSONResponse
+
+from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
+from typing import Optional, List, Any
+import os
+import httpx
+from dotenv import load_dotenv
+from ulits import clean_onenote_content, llm_generate, llm_generate_stream, extract_full_html, extract_html_fragment, llm_timeout
+from graph_client import graph_client, GraphToken
+from cache import page_cache, hierarchy_cache, TTLCache
+from session_store import create_session_store, SESSION_TTL, LOGIN_STATE_TTL
+from token_manager import TokenManager
+from chunking import condense_page_content, estimate_tokens, PAGE_TOKEN_BUDGET
+from llm_cache import llm_cache
+from prompt import prompt_sizes
+from llm_scheduler import llm_scheduler, llm_priority, BATCH
+from jobs import job_queue
+from question_bank import question_bank
+from dialogue_memory import dialogue_memory
+from review_questions import generate_questions
+from answer_grading import is_gradable, grade_answers, start_analysis, render_report, grading_results
+from page_assets import asset_fetcher, extract_images, attach_assets, multipart_files
+from retrieval import retrieval_index, format_passages, RETRIEVAL_TOP_K
+from metrics import span, start_request_timing, request_duration, server_timing_header, render_prometheus
+import logging
+class AnalyzeAnswersResponse(BaseModel):
+    overall_suggestions: str
+    results: List[dict] = []
+logger = logging.getLogger(__name__)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(),  # 确保输出到控制台
+        logging.FileHandler('app.log')  # 同时输出到文件
+    ]
+)
+# 允许 Chrome Extension 调用
+
+# 加载环境变量
+load_dotenv()
+ONENOTE_CLIENT_ID = os.getenv("ONENOTE_CLIENT_ID")  # 可通过 OAuth2 获取
+ONENOTE_CLIENT_SECRET = os.getenv("ONENOTE_CLIENT_SECRET")  # 可通过 OAuth2 获取
+ONENOTE_REDIRECT_URI = os.getenv("ONENOTE_REDIRECT_URI")  # 可通过 OAuth2 获取
+
+
+SCOPE = [
+    "https://graph.microsoft.com/Notes.ReadWrite",
+    "https://graph.microsoft.com/User.Read",
+    "offline_access"
+]
+TOKEN_URL = r"https://login.microsoftonline.com/common/oauth2/v2.0/token"
+AUTH_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/authorize?"
+APPEND_MODE = os.getenv("APPEND_MODE", "replace")  # /api/append-page 默认模式：replace / incremental
+SECTION_QUIZ_CONCURRENCY = int(os.getenv("SECTION_QUIZ_CONCURRENCY", "10"))  # 分区出题时同时进行的 LLM 调用数
+SECTION_QUIZ_MAX_PAGES = int(os.getenv("SECTION_QUIZ_MAX_PAGES", "50"))  # 分区出题最多覆盖的页面数
+RETRIEVAL_AUTO_INDEX = os.getenv("RETRIEVAL_AUTO_INDEX", "0") == "1"  # 读取页面时顺带更新检索索引（默认关闭）
+JOB_LLM_TIMEOUT = float(os.getenv("JOB_LLM_TIMEOUT", "180"))  # 后台任务中单次 LLM 调用超时（秒）
+# 初始化 OpenAI 客户端（推荐使用新版 SDK）
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动后台任务 worker
+    job_queue.start()
+    yield
+    await job_queue.stop()
+    # 关闭共享的 Graph 连接池
+    await graph_client.aclose()
+    await asset_fetcher.aclose()
+
+
+app = FastAPI(title="ReadNote OneNote Backend", lifespan=lifespan)
+# ⚠️ 安全提示：生产环境应限制 origins，不要用 ["*"]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[
+        "http://localhost:8002",
+        "http://127.0.0.1:8002",
+        "chrome-extension://你的扩展ID"  # 例如：chrome-extension://abc123def456
+    ],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """统计请求总耗时与各阶段耗时，并通过 Server-Timing 响应头返回"""
+    timings = start_request_timing()
+    start = time.perf_counter()
+    response = await call_next(request)
+    total = time.perf_counter() - start
+    route = request.scope.get("route")
+    request_duration.observe(total, method=request.method, path=getattr(route, "path", "unmatched"),
+                             status=response.status_code)
+    response.headers["Server-Timing"] = server_timing_header(timings, total)
+    return response
+
+
+# 用户会话存储，后端由 SESSION_BACKEND 选择（memory / sqlite / redis）
+user_sessions = create_session_store()  # { session_id: { "access_token": "...", "refresh_token": "...", "expires_at": ..., "user": "..." } }
+token_manager = TokenManager(user_sessions, TOKEN_URL, ONENOTE_CLIENT_ID, ONENOTE_CLIENT_SECRET, SCOPE)
+
+
+# ----------------------------
+# 模型定义
+# ----------------------------
+class NoteRequest(BaseModel):
+    text: str
+    notebook_id: Optional[str] = None
+    section_id: Optional[str] = None
+    page_id: Optional[str] = None
+    create_new: bool = True
+
+
+class NoteResponse(BaseModel):
+    note: str
+    page_url: Optional[str] = None
+
+
+class OneNoteItem(BaseModel):
+    id: str
+    displayName: str
+
+class OneNotePage(BaseModel):
+    id: str
+    title: str
+    contentUrl: str
+    lastModifiedDateTime: str
+    createdByAppId: Optional[str] = None
+
+
+# 替换现有的 CreatePageRequest 模型
+class CreatePageRequest(BaseModel):
+    section_id: str
+    title: str
+    content: str
+    images: Optional[List[str]] = None  # 额外的图片地址（http(s) 或 data URI），content 中的 <img> 也会一并上传
+
+    class Config:
+        extra = "allow"  # 允许额外字段
+
+class CreateSectionRequest(BaseModel):
+    displayName: str
+    notebook_id: str
+
+    class Config:
+        extra = "allow"  # 允许额外字段
+class dialogueRequest(BaseModel):
+    user_print: str
+    page_id: str
+
+    class Config:
+        extra = "allow"  # 允许额外字段
+    # 注意：没有 displayName
+# ========== 临时存储（仅用于演示！）==========
+# 生产环境请使用数据库、Redis 或加密 cookie
+
+# ========== 工具函数 ==========
+def get_session_id(request: Request) -> str:
+    """从 cookie 获取或创建 session_id"""
+    session_id = request.cookies.get("session_id")
+    if not session_id:
+        session_id = secrets.token_urlsafe(32)
+    return session_id
+
+
+async def get_auth_session(request: Request) -> tuple[str, dict]:
+    """从 auth_session cookie 读取已登录会话，未登录时抛出 401；令牌即将过期时先主动刷新"""
+    auth_session_id = request.cookies.get("auth_session")
+    session = await user_sessions.get(auth_session_id) if auth_session_id else None
+    if session is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if "access_token" not in session:
+        raise HTTPException(status_code=401, detail="Access token missing")
+    session = await token_manager.ensure_fresh(auth_session_id, session)
+    return auth_session_id, session
+
+# ----------------------------
+# 工具函数
+# ----------------------------
+
+
+
+
+async def sync_to_onenote(
+    token: GraphToken,
+    note_text: str,
+    section_id: Optional[str] = None,
+    page_id: Optional[str] = None,
+    create_new: bool = True
+    ) -> str:
+    """同步笔记到 OneNote"""
+    if create_new:
+        if not section_id:
+            endpoint = "/me/onenote/pages"
+        else:
+            endpoint = f"/me/onenote/sections/{section_id}/pages"
+
+        body = {
+            "title": "AI 生成笔记",
+            "content": f"<p>{note_text}</p>"
+        }
+        resp = await onenote_request("POST", endpoint, token, body)
+    else:
+        if not page_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="page_id is required when create_new=False"
+            )
+        endpoint = f"/me/onenote/pages/{page_id}/content"
+        body = [{
+            "target": "body",
+            "action": "append",
+            "content": f"<p>{note_text}</p>"
+        }]
+        resp = await onenote_request("PATCH", endpoint, token, body)
+
+    return resp.get("links", {}).get("oneNoteWebUrl", {}).get("href")
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """格式化一条 Server-Sent Events 消息"""
+    message = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    if event:
+        message = f"event: {event}\n" + message
+    return message
+
+
+async def stream_llm_events(task: str, on_complete=None, **params):
+    """
+    将 llm_generate_stream 的增量文本包装为 SSE 事件流
+    首 token 延迟（ttft）与总耗时分开统计，记录日志并在结束事件中返回给客户端
+    on_complete(完整文本) 在生成成功后、done 事件之前调用
+    """
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+    try:
+        async for delta in llm_generate_stream(task, **params):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+    except HTTPException as e:
+        logger.error(f"{task} 流式生成失败: {e.detail}")
+        yield sse_event({"detail": e.detail}, event="error")
+        return
+    if on_complete is not None:
+        await on_complete("".join(parts))
+    total = time.perf_counter() - start
+    ttft_ms = round((ttft if ttft is not None else total) * 1000, 1)
+    total_ms = round(total * 1000, 1)
+    logger.info(f"{task} 流式生成完成: ttft={ttft_ms}ms total={total_ms}ms")
+    yield sse_event({"ttft_ms": ttft_ms, "total_ms": total_ms}, event="done")
+
+
+def sse_response(task: str, on_complete=None, **params) -> StreamingResponse:
+    return StreamingResponse(
+        stream_llm_events(task, on_complete, **params),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+
+async def onenote_request(method: str, url: str, token: GraphToken, json_data: Optional[Any] = None) -> dict:
+    """统一处理 OneNote API 请求"""
+    if method.upper() not in ("GET", "POST", "PATCH"):
+        raise ValueError("Unsupported HTTP method")
+    try:
+        r = await graph_client.request(method, url, token, json=json_data)
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"OneNote API request failed: {str(e)}"
+        )
+
+    if r.status_code in (429, 503):
+        # graph_client 已按 Retry-After 重试仍被限流，把等待时间透传给客户端
+        raise HTTPException(status_code=r.status_code, detail=r.text,
+                            headers={"Retry-After": r.headers.get("Retry-After", "1")})
+    if r.status_code not in (200, 201):
+        raise HTTPException(status_code=r.status_code, detail=r.text)
+
+    return r.json()
+
+
+async def onenote_list(url: str, token: GraphToken) -> list:
+    """
+    获取 OneNote 列表接口的全部结果，自动跟随 @odata.nextLink 分页
+    """
+    items = []
+    next_url: Optional[str] = url
+    while next_url:
+        data = await onenote_request("GET", next_url, token)
+        items.extend(data.get("value", []))
+        next_url = data.get("@odata.nextLink")
+    return items
+
+
+async def cached_onenote_list(user_key: str, kind: str, parent_id: Optional[str], url: str, token: GraphToken) -> list:
+    """
+    带缓存的层级列表（笔记本 / 分区 / 页面），按用户缓存 HIERARCHY_CACHE_TTL 秒
+    创建分区、页面时通过 hierarchy_cache.pop 失效对应列表
+    """
+    key = (user_key, kind, parent_id)
+    items = hierarchy_cache.get(key)
+    if items is None:
+        items = await onenote_list(url, token)
+        hierarchy_cache.set(key, items)
+    return items
+
+
+async def cached_onenote_lists(user_key: str, kind: str, urls: dict, token: GraphToken) -> dict:
+    """
+    cached_onenote_list 的批量版本：urls 为 {parent_id: url}，缓存未命中的列表首页通过 $batch 一起获取，
+    有后续分页时再跟随 @odata.nextLink；批处理中失败的列表退回单独请求，以便抛出具体错误
+    """
+    results, misses = {}, []
+    for parent_id, url in urls.items():
+        items = hierarchy_cache.get((user_key, kind, parent_id))
+        if items is None:
+            misses.append(parent_id)
+        else:
+            results[parent_id] = items
+    responses = await graph_client.batch([("GET", urls[parent_id], None) for parent_id in misses], token,
+                                         user_key) if misses else []
+
+    async def complete(parent_id: str, response: httpx.Response) -> list:
+        if response.status_code != 200:
+            return await cached_onenote_list(user_key, kind, parent_id, urls[parent_id], token)
+        data = response.json()
+        items = data.get("value", [])
+        if data.get("@odata.nextLink"):
+            items += await onenote_list(data["@odata.nextLink"], token)
+        hierarchy_cache.set((user_key, kind, parent_id), items)
+        return items
+
+    completed = await asyncio.gather(*(complete(p, r) for p, r in zip(misses, responses)))
+    results.update(zip(misses, completed))
+    return results
+
+
+def section_pages_url(section_id: str) -> str:
+    # 只取列表需要的字段，每页取满 100 条并在服务端跟随分页
+    return (f"/me/onenote/sections/{section_id}/pages"
+            f"?$select=id,title,contentUrl,lastModifiedDateTime,createdByAppId&$top=100")
+
+
+async def list_section_pages(user_key: str, section_id: str, token: GraphToken) -> list:
+    """获取分区下的全部页面（带缓存），并登记页面最新版本，供页面内容缓存校验"""
+    pages = await cached_onenote_list(user_key, "pages", section_id, section_pages_url(section_id), token)
+    for page in pages:
+        page_cache.observe(user_key, page.get("id"), page.get("lastModifiedDateTime"))
+    return pages
+
+
+async def list_sections_pages(user_key: str, section_ids: list, token: GraphToken) -> dict:
+    """批量获取多个分区的页面列表，返回 {section_id: pages}"""
+    lists = await cached_onenote_lists(user_key, "pages", {sid: section_pages_url(sid) for sid in section_ids}, token)
+    for pages in lists.values():
+        for page in pages:
+            page_cache.observe(user_key, page.get("id"), page.get("lastModifiedDateTime"))
+    return lists
+
+
+async def page_review_questions(token: GraphToken, page: dict, user_key: str, question_num: int,
+                                llm_limit: asyncio.Semaphore) -> dict:
+    """
+    为分区中的单个页面出题；失败时返回 error 而不是抛出，避免一个页面拖垮整个分区
+    读取页面受用户级 Graph 并发上限约束，LLM 调用受本次请求的并发上限约束
+    """
+    result = {"page_id": page.get("id"), "title": page.get("title"), "questions": []}
+    # 批量出题的 LLM 调用让位于对话等交互请求（本函数在独立任务中执行，不影响调用方）
+    llm_priority.set(BATCH)
+    try:
+        async with graph_client.user_limit(user_key):
+            page_content = await get_page_content(token, page["id"], user_key)
+        if not page_content.strip():
+            return result
+        # 页面列表已登记版本，题库命中时无需调用 LLM
+        async with llm_limit:
+            result["questions"] = await sample_page_questions(token, page["id"], user_key, int(question_num))
+    except HTTPException as e:
+        result["error"] = str(e.detail)
+    except Exception as e:
+        logger.error(f"页面 {page.get('id')} 出题失败: {str(e)}")
+        result["error"] = str(e)
+    return result
+
+
+async def section_quiz_tasks(request: Request, payload: dict) -> list:
+    """校验参数并为分区内每个页面启动出题任务（并发执行）"""
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    section_id = payload.get("section_id")
+    if not section_id:
+        raise HTTPException(status_code=400, detail="Section ID is required")
+    question_num = payload.get("question_num", 3)
+    try:
+        max_pages = int(payload.get("max_pages") or SECTION_QUIZ_MAX_PAGES)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="max_pages must be a positive integer")
+    if max_pages < 1:
+        raise HTTPException(status_code=400, detail="max_pages must be a positive integer")
+    max_pages = min(max_pages, SECTION_QUIZ_MAX_PAGES)
+    pages = (await list_section_pages(auth_session_id, section_id, token))[:max_pages]
+    # 用 $batch 一次取回所有页面内容写入缓存，每个页面的任务随后直接命中缓存
+    await get_pages_content(token, [page["id"] for page in pages], auth_session_id)
+    llm_limit = asyncio.Semaphore(SECTION_QUIZ_CONCURRENCY)
+    return [
+        asyncio.create_task(page_review_questions(token, page, auth_session_id, question_num, llm_limit))
+        for page in pages
+    ]
+
+
+def tag_questions(result: dict) -> list:
+    """给题目标注来源页面，便于合并后仍能回到原页面"""
+    return [
+        {**q, "page_id": result["page_id"], "page_title": result["title"]} if isinstance(q, dict) else q
+        for q in result["questions"]
+    ]
+
+
+
+async def page_version(token: GraphToken, page_id: str, user_key: str) -> Optional[str]:
+    """页面的 lastModifiedDateTime：优先使用页面列表登记的版本，否则单独查询页面元数据"""
+    version = page_cache.version(user_key, page_id)
+    if version is None:
+        try:
+            data = await onenote_request("GET", f"/me/onenote/pages/{page_id}?$select=id,lastModifiedDateTime", token)
+        except HTTPException as e:
+            # 元数据查询失败不影响出题，调用方退回直接生成
+            logger.warning(f"获取页面 {page_id} 版本失败: {e.detail}")
+            return None
+        page_cache.observe(user_key, page_id, data.get("lastModifiedDateTime"))
+        # 刚写回的页面在 Graph 同步前可能仍返回旧版本，此时不登记，按版本未知处理
+        version = page_cache.version(user_key, page_id)
+    return version
+
+
+def question_generator(token: GraphToken, page_id: str, user_key: str):
+    """为题库生成指定页面的题目；已有题目时使用 question_generate_more 避免重复"""
+    async def generate(question_num: int, existing: list) -> list:
+        page_content = await get_page_content(token, page_id, user_key)
+        page_content = await condense_page_content(page_content)
+        return await generate_questions(question_num, page_content, existing)
+    return generate
+
+
+async def sample_page_questions(token: GraphToken, page_id: str, user_key: str, question_num: int) -> list:
+    """从题库抽题；无法确定页面版本时退回直接生成"""
+    generate = question_generator(token, page_id, user_key)
+    version = await page_version(token, page_id, user_key)
+    if not version:
+        return await generate(question_num, [])
+    return await question_bank.sample(page_id, version, question_num, generate)
+
+
+_index_owners = TTLCache(maxsize=4096, ttl=3600)  # 会话 ID -> 查询 Graph 用户 ID 的任务
+_index_tasks: set = set()  # 进行中的后台索引任务，保留引用避免被回收
+
+
+async def _fetch_index_owner(token: GraphToken) -> str:
+    user = getattr(token, "session", {}).get("user") or {}
+    if user.get("id"):
+        return user["id"]
+    data = await onenote_request("GET", "/me?$select=id", token)
+    return data["id"]
+
+
+async def index_owner(token: GraphToken, user_key: str) -> str:
+    """
+    检索索引按 Graph 用户 ID（/me 的 id）区分用户，重新登录后仍使用同一份索引
+    同一会话并发查询时只请求一次 /me，结果按会话缓存
+    """
+    task = _index_owners.get(user_key)
+    if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+        task = asyncio.ensure_future(_fetch_index_owner(token))
+        _index_owners.set(user_key, task)
+    return await asyncio.shield(task)
+
+
+async def index_page(index_key: str, page_id: str, version: Optional[str], text: str, title: Optional[str] = None):
+    """把页面纯文本写入检索索引；索引失败只记录日志，不影响读取页面"""
+    try:
+        await retrieval_index.add_page(index_key, page_id, version, text, title)
+    except Exception as e:
+        logger.error(f"索引页面 {page_id} 失败: {str(e)}")
+
+
+def index_in_background(token: GraphToken, user_key: str, page_id: str, text: str):
+    """
+    读取页面后在后台更新检索索引，不占用请求
+    页面版本未知时跳过：无法判断索引是否已是最新，否则每次读取都会重新索引
+    """
+    version = page_cache.version(user_key, page_id)
+    if version is None:
+        return
+
+    async def run():
+        await index_page(await index_owner(token, user_key), page_id, version, text)
+
+    task = asyncio.create_task(run())
+    _index_tasks.add(task)
+    task.add_done_callback(_index_done)
+
+
+def _index_done(task: asyncio.Task):
+    _index_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"后台索引页面失败: {task.exception()}")
+
+
+async def build_user_index(token: GraphToken, user_key: str, notebook_id: Optional[str] = None) -> dict:
+    """
+    增量构建用户笔记的检索索引：遍历笔记本 / 分区 / 页面列表，只读取版本有变化的页面
+    未指定 notebook_id 时为全量构建，并清理已删除页面的索引
+    """
+    notebooks = await cached_onenote_list(user_key, "notebooks", None, "/me/onenote/notebooks", token)
+    if notebook_id:
+        notebooks = [nb for nb in notebooks if nb.get("id") == notebook_id]
+    # 各笔记本的分区列表、各分区的页面列表分别用 $batch 合并请求
+    sections = await cached_onenote_lists(user_key, "sections", {
+        nb["id"]: f"/me/onenote/notebooks/{nb['id']}/sections?$select=id,displayName" for nb in notebooks
+    }, token)
+    section_ids = [sec["id"] for group in sections.values() for sec in group]
+    section_pages = await list_sections_pages(user_key, section_ids, token)
+    pages = [page for group in section_pages.values() for page in group]
+
+    index_key = await index_owner(token, user_key)
+    changed = [page for page in pages
+               if await retrieval_index.indexed_version(index_key, page["id"]) != page.get("lastModifiedDateTime")]
+    contents = await get_pages_content(token, [page["id"] for page in changed], user_key, auto_index=False)
+
+    async def index_one(page: dict) -> bool:
+        text = contents.get(page["id"])
+        if text is None:
+            # 批处理中失败的页面单独获取
+            async with graph_client.user_limit(user_key):
+                text = await get_page_content(token, page["id"], user_key)
+        await index_page(index_key, page["id"], page.get("lastModifiedDateTime"), text, page.get("title"))
+        return True
+
+    results = await asyncio.gather(*(index_one(page) for page in changed), return_exceptions=True)
+    failed = [page["id"] for page, r in zip(changed, results) if isinstance(r, Exception)]
+    removed = 0 if notebook_id else await retrieval_index.prune(index_key, {page["id"] for page in pages})
+    return {
+        "pages": len(pages),
+        "indexed": sum(1 for r in results if r is True),
+        "removed": removed,
+        "failed": failed,
+    }
+
+
+async def dialogue_context(token: GraphToken, user_key: str, page_id: Optional[str], user_print: str,
+                           scope: str = "page", conversation: Optional[dict] = None,
+                           memory_key: Optional[str] = None) -> str:
+    """
+    对话使用的笔记内容
+    scope=page：当前页面，超出预算时优先在页面内检索相关段落，索引缺失时再走 LLM 压缩
+    scope=all：在用户全部已索引笔记中检索最相关的段落
+    多轮对话（传入 conversation / memory_key）时，页面内容或压缩结果保存在对话中，页面版本不变时后续轮次直接复用；
+    按需求检索的段落每轮重新检索
+    """
+    if scope == "all":
+        passages = await retrieval_index.search(await index_owner(token, user_key), user_print, RETRIEVAL_TOP_K)
+        if passages:
+            return format_passages(passages)
+        if not page_id:
+            return "无相关笔记"
+    if not page_id:
+        raise HTTPException(status_code=400, detail="Page ID is required")
+    if conversation is not None:
+        context = dialogue_memory.cached_context(conversation, page_cache.version(user_key, page_id))
+        if context is not None:
+            return context
+    page_content = await get_page_content(token, page_id, user_key)
+    if estimate_tokens(page_content) <= PAGE_TOKEN_BUDGET:
+        context = page_content
+    else:
+        passages = await retrieval_index.search(await index_owner(token, user_key), user_print, RETRIEVAL_TOP_K,
+                                                page_id=page_id)
+        if passages:
+            return format_passages(passages)
+        # 超长页面：单轮对话只摘录与需求相关的片段，多轮对话压缩整页一次供后续轮次复用
+        context = await condense_page_content(page_content, focus=None if memory_key else user_print)
+    if memory_key:
+        await dialogue_memory.set_context(memory_key, context, page_cache.version(user_key, page_id))
+    return context
+
+
+async def load_conversation(user_key: str, payload: dict) -> tuple[str, dict]:
+    """按 (会话, 页面 / 检索范围) 取出对话状态；payload.reset 为真时先清空"""
+    memory_key = dialogue_memory.key(user_key, payload.get("page_id"), payload.get("scope", "page"))
+    if payload.get("reset"):
+        await dialogue_memory.reset(memory_key)
+    return memory_key, await dialogue_memory.load(memory_key)
+
+
+# ----------------------------
+# API 路由
+# ----------------------------
+
+
+@app.get("/")
+def read_root():
+    return {"Hello": "World"}
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus 文本格式的指标（各阶段耗时直方图、请求耗时、LLM token 用量、缓存命中）"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/cache-stats")
+def cache_stats():
+    """LLM 响应缓存命中统计、LLM 调度器、后台任务队列状态与各提示词模板的估算 token 数"""
+    return {"llm": llm_cache.stats(), "llm_scheduler": llm_scheduler.stats(), "jobs": job_queue.stats(),
+            "prompts": prompt_sizes()}
+
+
+# 模拟：用内存存储 user -> token 映射（生产环境用 DB）
+user_info_store: dict[str, dict] = {}  # token -> user_info
+
+
+
+
+
+@app.get("/login")
+async def login(request: Request):
+    """生成授权 URL 并重定向用户到 Microsoft 登录页"""
+    session_id = get_session_id(request)
+    state = secrets.token_urlsafe(16)  # 用于防 CSRF
+    # 临时保存 state（可存 DB，这里用 session_id 关联）
+    await user_sessions.set(session_id, {"oauth_state": state}, ttl=LOGIN_STATE_TTL)
+    redirect_uri = f"{ONENOTE_REDIRECT_URI}?session_id={session_id}"
+
+    params = {
+        "client_id": ONENOTE_CLIENT_ID,
+        "response_type": "code",
+        "redirect_uri": redirect_uri,
+        "scope": " ".join(SCOPE),
+        "response_mode": "query",
+        "state":state
+    }
+
+    auth_url = AUTH_URL + urlencode(params)
+    return {"login_url": auth_url}
+
+
+
+@app.get("/callback")
+async def callback(response: Response,request: Request):
+    """接收授权码，换取 access_token，并保存到会话"""
+    session_id = request.query_params.get("session_id")
+    login_session = await user_sessions.get(session_id) if session_id else None
+    if login_session is None:
+        raise HTTPException(status_code=400, detail="Invalid session")
+
+    # 验证 state 防 CSRF
+    expected_state = login_session.get("oauth_state")
+    received_state = request.query_params.get("state")
+    if received_state != expected_state:
+        raise HTTPException(status_code=400, detail="Invalid state parameter")
+
+    code = request.query_params.get("code")
+    if not code:
+        raise HTTPException(status_code=400, detail="No code provided")
+    redirect_uri = f"{ONENOTE_REDIRECT_URI}?session_id={session_id}"
+
+    # 换取 token
+    data = {
+        "client_id": ONENOTE_CLIENT_ID,
+        "scope": " ".join(SCOPE),
+        "code": code,
+        "redirect_uri": redirect_uri,
+        "grant_type": "authorization_code",
+        "client_secret": ONENOTE_CLIENT_SECRET,
+    }
+    try:
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        r = await graph_client.post(TOKEN_URL, headers=headers, data=data)
+        r.raise_for_status()
+        token_data = r.json()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Token exchange failed: {str(e)}")
+    permanent_session_id = secrets.token_urlsafe(32)
+
+    # 存储正式会话（可替换临时 session）
+    await user_sessions.set(permanent_session_id, token_manager.apply_token_response(
+        {"user_id": session_id}, token_data
+    ))
+    # 在 /callback 成功后，可删除临时 session_id
+    await user_sessions.delete(session_id)
+    redirect_resp = RedirectResponse(url="/auth/success")
+
+    redirect_resp.set_cookie(
+        key="auth_session",
+        value=permanent_session_id,
+        httponly=True,
+        secure=False,  # 本地开发用 False，生产用 True
+        samesite="lax",
+        max_age=int(SESSION_TTL)  # 与服务端会话有效期一致
+    )
+    return redirect_resp
+    # # 保存令牌（含 refresh_token），但不获取用户信息
+    # user_sessions[session_id].update({
+    #     "access_token": token_data["access_token"],
+    #     "refresh_token": token_data.get("refresh_token"),
+    #     "expires_in": token_data.get("expires_in"),
+    #     # 注意：不再在这里设置 user
+    # })
+    # 重定向到 profile，由 profile 按需加载用户信息
+    # return JSONResponse({"status": "success"})
+
+@app.get("/auth/success")
+async def auth_success():
+    return HTMLResponse(open("html/success.html",encoding="utf-8").read())
+
+
+@app.get("/profile")
+async def profile(request: Request):
+    """显示用户信息和 OneNote 状态（按需获取用户信息）"""
+    # session_id = request.cookies.get("session_id")
+    # session = user_sessions.get(session_id)
+    auth_session_id, session = await get_auth_session(request)
+    # 按需获取用户信息（如果尚未缓存）
+    user = session.get("user")
+    if user is None:
+        try:
+            credential = token_manager.credential(auth_session_id, session)
+            user_resp = await graph_client.get("/me", credential)
+            if user_resp.status_code == 200:
+                user = user_resp.json()
+                session = credential.session  # 可能已在请求中刷新过令牌
+                session["user"] = user  # 缓存到会话
+                await user_sessions.set(auth_session_id, session)
+            else:
+                user = {}  # 或保留为 None，前端可处理
+        except Exception:
+            user = {}
+
+    return {
+        "message": "Login successful!",
+        "user": user,
+        "has_access_token": True,  # 此时一定有，因为上面已校验
+    }
+
+
+@app.get("/api/notebooks")
+async def get_notebooks(request: Request):
+    """调用 Microsoft Graph 获取 OneNote 笔记本"""
+    auth_session_id, session = await get_auth_session(request)
+
+    token = token_manager.credential(auth_session_id, session)
+    try:
+        return await cached_onenote_list(auth_session_id, "notebooks", None, "/me/onenote/notebooks", token)
+    except HTTPException as e:
+        if e.status_code == 401:
+            # graph_client 已尝试用 refresh_token 刷新并重试，仍为 401 说明需要重新登录
+            raise HTTPException(status_code=401, detail="Token expired")
+        raise
+
+
+
+@app.get("/api/sections/{notebook_id}", response_model=List[OneNoteItem])
+async def get_sections(notebook_id: str, request: Request):
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    url = f"/me/onenote/notebooks/{notebook_id}/sections?$select=id,displayName"
+    return await cached_onenote_list(auth_session_id, "sections", notebook_id, url, token)
+
+
+@app.get("/api/pages/{section_id}", response_model=List[OneNotePage])
+async def get_pages(section_id: str, request: Request):
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    return await list_section_pages(auth_session_id, section_id, token)
+
+# @app.post("/api/note", response_model=NoteResponse)
+# async def create_note(req: NoteRequest, request: Request):
+#     auth_session_id = request.cookies.get("auth_session")
+#     if not auth_session_id or auth_session_id not in user_sessions:
+#         raise HTTPException(status_code=401, detail="Not authenticated")
+#     session = user_sessions[auth_session_id]
+#     if "access_token" not in session:
+#         raise HTTPException(status_code=401, detail="Access token missing")
+#     token = session["access_token"]
+#     # note_text = generate_note_from_llm(req.text)
+#     note_text = "generate_note_from_llm(req.text)"
+#     page_url = sync_to_onenote(
+#         token=token,
+#         note_text=note_text,
+#         section_id=req.section_id,
+#         page_id=req.page_id,
+#         create_new=req.create_new
+#     )
+#     return NoteResponse(note=note_text, page_url=page_url)
+
+
+@app.post("/api/create-section")
+async def create_section(section_data:CreateSectionRequest,request: Request) -> dict:
+
+    """
+    在指定的 OneNote 笔记本中创建一个新的分区
+    Returns:
+        创建的分区信息
+
+    Reference:
+        https://learn.microsoft.com/zh-cn/graph/api/notebook-post-sections?view=graph-rest-1.0&tabs=http
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    section_name = section_data.displayName
+    notebook_id = section_data.notebook_id
+    endpoint = f"/me/onenote/notebooks/{notebook_id}/sections"
+    body = {
+        "displayName": section_name
+    }
+    try:
+        response = await graph_client.post(endpoint, token, json=body)
+        response.raise_for_status()
+        hierarchy_cache.pop((auth_session_id, "sections", notebook_id))
+        return response.json()
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to create section: {str(e)}"
+        )
+
+
+
+# 替换现有的 create_page_endpoint 函数
+@app.post("/api/create-page")
+async def create_page_endpoint(page_data: CreatePageRequest, request: Request):
+    """
+    创建新页面的API端点
+
+    Args:
+        section_id: 分区 ID
+        title: 页面标题
+        content: 页面内容
+    """
+    # 首先检查认证
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+
+    validate_create_page(page_data)
+    try:
+        return await create_page_and_invalidate(token, auth_session_id, page_data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def validate_create_page(page_data: CreatePageRequest):
+    # 验证必要参数
+    if not page_data.section_id:
+        raise HTTPException(status_code=400, detail="Section ID is required")
+    if not page_data.title:
+        raise HTTPException(status_code=400, detail="Page title is required")
+    if not page_data.content:
+        raise HTTPException(status_code=400, detail="Page content is required")
+
+
+async def create_page_and_invalidate(token: GraphToken, user_key: str, page_data: CreatePageRequest) -> dict:
+    """创建页面并失效该分区的页面列表缓存"""
+    result = await create_page(token, page_data.section_id, page_data.title, page_data.content, page_data.images)
+    hierarchy_cache.pop((user_key, "pages", page_data.section_id))
+    return result
+
+
+# # 在需要输出日志的地方
+# logger.info("这是日志信息")
+# logger.error("这是错误信息")
+
+
+async def create_page(token: GraphToken, section_id: str, page_title: str, page_content: str,
+                      images: Optional[list] = None) -> dict:
+    """
+    在指定的 OneNote 分区中创建一个新的页面
+    页面含图片时，图片在生成 HTML 的同时并发下载，以多部件请求（multipart/form-data）上传，
+    页面 HTML 通过 src="name:partN" 引用，不再把图片以 data URI 内联在 HTML 中
+
+    Args:
+        token: 访问令牌
+        section_id: 分区 ID
+        page_title: 页面标题
+        page_content: 页面内容（HTML格式）
+        images: 额外的图片地址
+
+    Returns:
+        创建的页面信息
+
+    Reference:
+        https://learn.microsoft.com/zh-cn/graph/api/section-post-pages?view=graph-rest-1.0&tabs=http
+        https://learn.microsoft.com/zh-cn/graph/onenote-images-files
+    """
+    task="generate_page"
+    endpoint = f"/me/onenote/sections/{section_id}/pages"
+
+    # 图片换成短占位符后再交给模型，下载与生成并行
+    page_content, sources = extract_images(page_content, images)
+    fetch = asyncio.create_task(asset_fetcher.fetch(sources)) if sources else None
+
+    # 构建页面内容（XHTML格式）
+    try:
+        xhtml_content = await llm_generate(task,page_title=page_title,page_content=page_content)
+    except BaseException:
+        if fetch is not None:
+            fetch.cancel()
+        raise
+    with span("html_extract"):
+        xhtml_content=extract_full_html(xhtml_content)
+
+    parts = []
+    if fetch is not None:
+        xhtml_content, parts = attach_assets(xhtml_content, sources, await fetch)
+
+    try:
+        if parts:
+            response = await graph_client.post(endpoint, token, files=multipart_files(xhtml_content, parts))
+        else:
+            headers = {
+                "Content-Type": "application/xhtml+xml"
+            }
+            response = await graph_client.post(endpoint, token, headers=headers, content=xhtml_content.encode('utf-8'))
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to create page: {str(e)}"
+        )
+
+
+
+async def get_page_content(token: GraphToken, page_id: str, user_key: Optional[str] = None) -> str:
+    """
+       获取OneNote页面内容
+       传入 user_key 时优先读取页面内容缓存（按 lastModifiedDateTime 校验），未命中再请求 Graph
+       https://learn.microsoft.com/zh-cn/graph/api/page-get?view=graph-rest-1.0&tabs=http
+       """
+    if user_key:
+        cached = page_cache.get(user_key, page_id)
+        if cached is not None:
+            return cached
+    endpoint = f"/me/onenote/pages/{page_id}/content"
+
+    headers = {
+        "Accept": "text/html"
+    }
+    try:
+        response = await graph_client.get(endpoint, token, headers=headers)
+        response.raise_for_status()
+        # 返回页面内容
+        # 获取原始HTML内容
+        return store_page_content(token, user_key, page_id, response.text)
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to get page content: {str(e)}"
+        )
+
+
+def store_page_content(token: GraphToken, user_key: Optional[str], page_id: str, html_content: str,
+                       auto_index: bool = True) -> str:
+    """清洗页面 HTML，写入页面内容缓存，并在后台更新检索索引"""
+    # 清理HTML内容，提取纯文本
+    with span("html_clean"):
+        clean_content = clean_onenote_content(html_content)
+    if user_key:
+        page_cache.set(user_key, page_id, clean_content)
+        if RETRIEVAL_AUTO_INDEX and auto_index:
+            index_in_background(token, user_key, page_id, clean_content)
+    return clean_content
+
+
+async def get_pages_content(token: GraphToken, page_ids: list, user_key: str, auto_index: bool = True) -> dict:
+    """
+    批量获取多个页面的纯文本：缓存未命中的页面通过 Graph $batch 每 20 个合并为一次往返
+    返回 {page_id: 纯文本}；获取失败的页面不在结果中，调用方可用 get_page_content 单独获取
+    auto_index=False 时不在后台更新检索索引（构建索引时由调用方自行写入）
+    """
+    contents, misses = {}, []
+    for page_id in dict.fromkeys(page_ids):
+        cached = page_cache.get(user_key, page_id)
+        if cached is not None:
+            contents[page_id] = cached
+        else:
+            misses.append(page_id)
+    if not misses:
+        return contents
+    try:
+        responses = await graph_client.batch(
+            [("GET", f"/me/onenote/pages/{page_id}/content", {"Accept": "text/html"}) for page_id in misses], token,
+            user_key,
+        )
+    except httpx.HTTPError as e:
+        logger.warning(f"批量获取页面失败: {str(e)}")
+        return contents
+    for page_id, response in zip(misses, responses):
+        if response.status_code == 200:
+            contents[page_id] = store_page_content(token, user_key, page_id, response.text, auto_index)
+    return contents
+
+
+async def update_page_content(token: GraphToken, page_id: str, html_content: str, user_key: Optional[str] = None,
+                              action: str = "replace") -> dict:
+    """
+    更新指定 OneNote 页面的内容
+
+    Args:
+        token: 访问令牌
+        page_id: 要更新的页面 ID
+        html_content: 新的 HTML 内容
+        user_key: 用户缓存键，写入后使该页面的内容缓存失效
+        action: "replace" 替换整个页面正文，"append" 追加到正文末尾
+
+    Returns:
+        更新操作的结果
+
+    Reference:
+        https://learn.microsoft.com/zh-cn/graph/api/page-update?view=graph-rest-1.0&tabs=http
+    """
+    endpoint = f"/me/onenote/pages/{page_id}/content"
+
+    # 构造更新请求体
+    body = [{
+        "target": "body",
+        "action": action,
+        "content": html_content
+    }]
+
+    try:
+        response = await graph_client.patch(endpoint, token, json=body)
+        response.raise_for_status()
+        if user_key:
+            page_cache.invalidate(user_key, page_id)
+
+        # OneNote 更新操作通常返回 204 No Content
+        # 根据文档，成功更新后不返回内容主体
+        if response.status_code == 204:
+            return {"status": "success", "message": "Page updated successfully"}
+        else:
+            # 如果返回了其他状态码，尝试解析 JSON 或返回通用成功消息
+            try:
+                return response.json()
+            except json.JSONDecodeError:
+                return {"status": "success", "message": f"Page updated with status {response.status_code}"}
+
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to update page: {str(e)}"
+        )
+@app.post("/api/page-summary")
+async def generate_page_summary(request: Request, payload: dict):
+    """
+    生成指定页面内容摘要的API端点
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    page_id = payload.get("page_id")
+    if not page_id:
+        raise HTTPException(status_code=400, detail="Page ID is required")
+
+    try:
+        # 获取页面内容
+        page_content = await get_page_content(token, page_id, auth_session_id)
+        # 超长页面先分块并发压缩（map），再由摘要提示词合并（reduce）
+        page_content = await condense_page_content(page_content)
+        # 生成摘要
+        xhtml_summary = await llm_generate("page_abstract",page_content=page_content)
+
+
+        return {"pagesummary":xhtml_summary}
+    except Exception as e:
+        raise (HTTPException(status_code=500, detail=str(e)))
+@app.post("/api/append-page")
+async def append_page(request: Request, payload: dict):
+    """
+    把新内容整合进指定页面的API端点
+
+    mode:
+        replace: 旧笔记与新内容一起交给 LLM 重写，再替换整个页面（成本随页面增长）
+        incremental: 只把新内容（可选附带旧笔记摘要 include_summary）交给 LLM，
+                     生成的片段以 Graph append 操作追加到页面末尾（成本与页面大小无关）
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    validate_append_page(payload)
+    try:
+        return await append_to_page(token, auth_session_id, payload)
+    except Exception as e:
+        logger.error(traceback.print_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def validate_append_page(payload: dict):
+    if not payload.get("page_id"):
+        logger.error("append not page_id")
+        raise HTTPException(status_code=400, detail="Page ID is required")
+    if not payload.get("pageContent"):
+        logger.error("append not new_content")
+        raise HTTPException(status_code=400, detail="Page ID is required")
+    mode = payload.get("mode") or APPEND_MODE
+    if mode not in ("replace", "incremental"):
+        raise HTTPException(status_code=400, detail=f"Unsupported append mode: {mode}")
+
+
+async def append_to_page(token: GraphToken, user_key: str, payload: dict) -> dict:
+    """按 mode 把新内容整合进页面（参数已由 validate_append_page 校验）"""
+    page_id = payload["page_id"]
+    new_content = payload["pageContent"]
+    mode = payload.get("mode") or APPEND_MODE
+    if mode == "incremental":
+        old_summary = "无"
+        if payload.get("include_summary"):
+            old_note = await get_page_content(token, page_id, user_key)
+            old_summary = await llm_generate("page_abstract", page_content=await condense_page_content(old_note))
+        fragment = await llm_generate("append_incremental", old_summary=old_summary, new_content=new_content)
+        return await update_page_content(token, page_id, extract_html_fragment(fragment), user_key,
+                                         action="append")
+    # 获取页面内容
+    old_note = await get_page_content(token, page_id, user_key)
+    # 生成摘要
+    new_page = await llm_generate("append_page",old_note=old_note,new_content=new_content)
+    with span("html_extract"):
+        xhtml_new_page = extract_full_html(new_page)
+    return await update_page_content(token,page_id,xhtml_new_page,user_key)
+
+
+@app.post("/api/review-questions")
+async def generate_review_questions(request: Request, payload: dict):
+    """
+    生成指定页面内容摘要的API端点
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    page_id = payload.get("page_id")
+    question_num = payload.get("question_num", 5)
+    if not page_id:
+        raise HTTPException(status_code=400, detail="Page ID is required")
+    try:
+        # 获取页面内容
+
+        # 从按页面版本保存的题库中抽题，只有题库为空时才需要等待 LLM
+        review = await sample_page_questions(token, page_id, auth_session_id, int(question_num))
+        return {"questions":review}
+    except Exception as e:
+        logger.error(f"generate_review_questions错误: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/question-bank/prefetch")
+async def prefetch_questions(request: Request, payload: dict):
+    """
+    预热页面题库：题库为空时在后台生成题目并立即返回，用户点击复习时即可直接抽题
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    page_id = payload.get("page_id")
+    if not page_id:
+        raise HTTPException(status_code=400, detail="Page ID is required")
+    version = await page_version(token, page_id, auth_session_id)
+    if not version:
+        return {"page_id": page_id, "bank": None}
+    await question_bank.prefetch(page_id, version, question_generator(token, page_id, auth_session_id))
+    return {"page_id": page_id, "version": version, "bank": await question_bank.stats(page_id, version)}
+
+
+@app.post("/api/section-review-questions")
+async def generate_section_review_questions(request: Request, payload: dict):
+    """
+    为整个分区出题：并发读取分区内的页面并并行生成题目，返回合并后的题目与各页面结果
+    参数：section_id，question_num（每页题数，默认 3），max_pages（可选）
+    """
+    tasks = await section_quiz_tasks(request, payload)
+    results = await asyncio.gather(*tasks)
+    questions = [q for result in results for q in tag_questions(result)]
+    return {"questions": questions, "pages": results}
+
+
+async def answer_page_content(token: GraphToken, page_id: str, user_key: str, graded: list) -> str:
+    """只有需要模型分析的题目时才读取页面内容"""
+    if all(entry["method"] != "llm" for entry in graded):
+        return ""
+    return await get_page_content(token, page_id, user_key)
+
+
+async def answer_analysis_events(graded: list, page_content: str):
+    """
+    流式答题分析：先推送 grading 事件（逐题判定结果），再按题目顺序推送每题的分析，
+    本地判定正确的题目立即推送，其余在对应的模型调用完成后推送；最后推送整体建议与 done 事件
+    """
+    start = time.perf_counter()
+    ttft = None
+    items, summary = start_analysis(graded, page_content)
+    try:
+        yield sse_event({"results": grading_results(graded)}, event="grading")
+        yield sse_event({"delta": '<div class="question-analysis">\n<h3>逐题分析</h3>\n'})
+        for item in items:
+            text = await item
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            yield sse_event({"delta": text + "\n"})
+        yield sse_event({"delta": await summary + "\n</div>"})
+    finally:
+        # 客户端断开时取消尚未完成的分析
+        for task in [*items, summary]:
+            task.cancel()
+    total = time.perf_counter() - start
+    ttft_ms = round((ttft if ttft is not None else total) * 1000, 1)
+    yield sse_event({"ttft_ms": ttft_ms, "total_ms": round(total * 1000, 1)}, event="done")
+
+
+@app.post("/api/analyze-answers")
+async def analyze_answers(request: Request, payload: dict):
+    """
+    分析用户答题情况并提供学习建议
+    """
+    logger.info(f"/api/analyze-answers处理")
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    try:
+        # 获取并解析答题数据
+        answers_json = payload.get("question_a_answer")
+        page_id = payload.get("page_id")
+        if not answers_json:
+            raise HTTPException(status_code=400, detail="Missing question_a_answer data")
+        # 解析JSON字符串为对象
+        user_answers = json.loads(answers_json)
+        if not is_gradable(user_answers):
+            # 无法逐题判定的格式：整体交给模型分析
+            page_content = await get_page_content(token, page_id, auth_session_id)
+            xhtml_overall_suggestions = await llm_generate("answer_analysis", user_answers=user_answers,page_content=page_content)
+            return AnalyzeAnswersResponse(overall_suggestions=xhtml_overall_suggestions)
+        # 先本地判定客观题，只有答错或开放题才并发调用LLM逐题分析
+        graded = grade_answers(user_answers)
+        page_content = await answer_page_content(token, page_id, auth_session_id, graded)
+        items, summary = start_analysis(graded, page_content)
+        report = render_report(await asyncio.gather(*items), await summary)
+        return AnalyzeAnswersResponse(overall_suggestions=report, results=grading_results(graded))
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON format: {str(e)}")
+    except Exception as e:
+        logger.error(f"analyze_answers错误: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/dialogue")
+async def dialogue(request: Request, payload: dict):
+    """
+    分析用户答题情况并提供学习建议
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    try:
+        # 获取并解析答题数据
+        user_print = payload.get("user_print")
+        page_id = payload.get("page_id")
+        if not user_print:
+            raise HTTPException(status_code=400, detail="Missing user_print data")
+        memory_key, conversation = await load_conversation(auth_session_id, payload)
+        # scope=all 时在全部笔记中检索相关段落，否则使用当前页面
+        page_content = await dialogue_context(token, auth_session_id, page_id, user_print,
+                                              payload.get("scope", "page"), conversation, memory_key)
+        # 解析JSON字符串为对象
+        # 调用LLM生成分析报告
+        dialogue = await llm_generate("dialogue", user_print=user_print,page_content=page_content,
+                                      history=dialogue_memory.format_history(conversation))
+        await dialogue_memory.append(memory_key, user_print, dialogue)
+        return {"replay":dialogue}
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON format: {str(e)}")
+    except Exception as e:
+        logger.error(f"analyze_answers错误: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ----------------------------
+# 流式 API 路由（SSE）
+# ----------------------------
+@app.post("/api/page-summary/stream")
+async def generate_page_summary_stream(request: Request, payload: dict):
+    """
+    流式生成页面摘要：data 事件携带增量文本，done 事件携带 ttft_ms / total_ms
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    page_id = payload.get("page_id")
+    if not page_id:
+        raise HTTPException(status_code=400, detail="Page ID is required")
+    page_content = await get_page_content(token, page_id, auth_session_id)
+    page_content = await condense_page_content(page_content)
+    return sse_response("page_abstract", page_content=page_content)
+
+
+@app.post("/api/section-review-questions/stream")
+async def generate_section_review_questions_stream(request: Request, payload: dict):
+    """
+    流式分区出题：每个页面完成即推送一条 page 事件（先完成先推送），
+    全部完成后 done 事件携带页面数、题目数与总耗时
+    """
+    tasks = await section_quiz_tasks(request, payload)
+
+    async def events():
+        start = time.perf_counter()
+        question_count = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                questions = tag_questions(result)
+                question_count += len(questions)
+                yield sse_event({**result, "questions": questions}, event="page")
+        finally:
+            # 客户端断开时取消尚未完成的页面
+            for task in tasks:
+                task.cancel()
+        total_ms = round((time.perf_counter() - start) * 1000, 1)
+        yield sse_event({"pages": len(tasks), "questions": question_count, "total_ms": total_ms}, event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/api/analyze-answers/stream")
+async def analyze_answers_stream(request: Request, payload: dict):
+    """
+    流式分析用户答题情况
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    answers_json = payload.get("question_a_answer")
+    page_id = payload.get("page_id")
+    if not answers_json:
+        raise HTTPException(status_code=400, detail="Missing question_a_answer data")
+    try:
+        user_answers = json.loads(answers_json)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON format: {str(e)}")
+    if not is_gradable(user_answers):
+        page_content = await get_page_content(token, page_id, auth_session_id)
+        return sse_response("answer_analysis", user_answers=user_answers, page_content=page_content)
+    graded = grade_answers(user_answers)
+    page_content = await answer_page_content(token, page_id, auth_session_id, graded)
+    return StreamingResponse(answer_analysis_events(graded, page_content), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/api/dialogue/stream")
+async def dialogue_stream(request: Request, payload: dict):
+    """
+    流式对话
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    user_print = payload.get("user_print")
+    page_id = payload.get("page_id")
+    if not user_print:
+        raise HTTPException(status_code=400, detail="Missing user_print data")
+    memory_key, conversation = await load_conversation(auth_session_id, payload)
+    page_content = await dialogue_context(token, auth_session_id, page_id, user_print,
+                                          payload.get("scope", "page"), conversation, memory_key)
+
+    async def remember(reply: str):
+        await dialogue_memory.append(memory_key, user_print, reply)
+
+    return sse_response("dialogue", on_complete=remember, user_print=user_print, page_content=page_content,
+                        history=dialogue_memory.format_history(conversation))
+
+
+@app.get("/api/dialogue/history")
+async def dialogue_history(request: Request, page_id: Optional[str] = None, scope: str = "page"):
+    """
+    当前会话在指定页面（或 scope=all）上的服务端对话状态：滚动摘要、原文保留的轮次与 token 数
+    """
+    auth_session_id, _ = await get_auth_session(request)
+    memory_key = dialogue_memory.key(auth_session_id, page_id, scope)
+    conversation = await dialogue_memory.load(memory_key)
+    return {
+        "summary": conversation["summary"],
+        "turns": conversation["turns"],
+        **await dialogue_memory.stats(memory_key),
+    }
+
+
+@app.delete("/api/dialogue/history")
+async def clear_dialogue_history(request: Request, page_id: Optional[str] = None, scope: str = "page"):
+    """清空服务端对话状态，下一轮从头开始"""
+    auth_session_id, _ = await get_auth_session(request)
+    await dialogue_memory.reset(dialogue_memory.key(auth_session_id, page_id, scope))
+    return {"status": "success", "message": "Dialogue history cleared"}
+
+
+# ----------------------------
+# 检索索引 API 路由
+# ----------------------------
+@app.post("/api/index/build")
+async def build_index(request: Request, payload: Optional[dict] = None):
+    """
+    在后台增量构建检索索引（只读取有变化的页面），返回 job_id；
+    可选 notebook_id 只索引一个笔记本
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    notebook_id = (payload or {}).get("notebook_id")
+    return await submit_job("build_index", auth_session_id, lambda: build_user_index(token, auth_session_id, notebook_id))
+
+
+@app.get("/api/index/status")
+async def index_status(request: Request):
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    return await retrieval_index.stats(await index_owner(token, auth_session_id))
+
+
+@app.post("/api/index/search")
+async def search_index(request: Request, payload: dict):
+    """在已索引的笔记中检索，返回最相关的段落（query，可选 top_k / page_id）"""
+    auth_session_id, session = await get_auth_session(request)
+    query = payload.get("query")
+    if not query:
+        raise HTTPException(status_code=400, detail="Missing query")
+    token = token_manager.credential(auth_session_id, session)
+    top_k = min(int(payload.get("top_k") or RETRIEVAL_TOP_K), 50)
+    index_key = await index_owner(token, auth_session_id)
+    return {"passages": await retrieval_index.search(index_key, query, top_k, payload.get("page_id"))}
+
+
+# ----------------------------
+# 后台任务 API 路由
+# ----------------------------
+async def submit_job(kind: str, owner: str, func) -> JSONResponse:
+    """提交后台任务并立即返回 202 与任务 ID；队列已满时由 job_queue 抛出 503"""
+    async def run():
+        # 后台任务不占用请求，允许更长的生成时间，LLM 调用让位于交互请求
+        llm_timeout.set(JOB_LLM_TIMEOUT)
+        llm_priority.set(BATCH)
+        return await func()
+
+    job = await job_queue.submit(kind, owner, run)
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"},
+    )
+
+
+@app.post("/api/jobs/create-page")
+async def create_page_job(page_data: CreatePageRequest, request: Request):
+    """
+    后台创建页面：参数同 /api/create-page，立即返回 job_id，
+    通过 GET /api/jobs/{job_id} 轮询或 GET /api/jobs/{job_id}/stream 订阅结果
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    validate_create_page(page_data)
+    return await submit_job("create_page", auth_session_id,
+                      lambda: create_page_and_invalidate(token, auth_session_id, page_data))
+
+
+@app.post("/api/jobs/append-page")
+async def append_page_job(request: Request, payload: dict):
+    """
+    后台整合页面：参数同 /api/append-page，立即返回 job_id
+    """
+    auth_session_id, session = await get_auth_session(request)
+    token = token_manager.credential(auth_session_id, session)
+    validate_append_page(payload)
+    return await submit_job("append_page", auth_session_id, lambda: append_to_page(token, auth_session_id, payload))
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """查询任务状态：queued / running / succeeded（result）/ failed（error）"""
+    auth_session_id, _ = await get_auth_session(request)
+    return await job_queue.get(job_id, auth_session_id)
+
+
+@app.get("/api/jobs/{job_id}/stream")
+async def stream_job(job_id: str, request: Request):
+    """
+    以 SSE 推送任务状态：每次状态变化发送一条 status 事件，任务结束后关闭连接
+    """
+    auth_session_id, _ = await get_auth_session(request)
+    # 任务不存在时在开始推送前返回 404
+    await job_queue.get(job_id, auth_session_id)
+
+    async def events():
+        async for state in job_queue.watch(job_id, auth_session_id):
+            if state is None:
+                # 心跳，防止代理断开空闲连接
+                yield ": keep-alive\n\n"
+            else:
+                yield sse_event(state, event="status")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,134 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# 默认直方图桶（秒），覆盖毫秒级的 HTML 清洗到数十秒的 LLM 调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+class Counter:
+    """Prometheus 计数器，按标签组合分别累加"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Prometheus 直方图，按标签组合分别统计桶计数、总和与次数"""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # labels -> [bucket_counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+stage_duration = Histogram("readnote_stage_duration_seconds", "各处理阶段耗时（Graph 读写 / HTML 清洗 / LLM / HTML 提取）")
+request_duration = Histogram("readnote_http_request_duration_seconds", "HTTP 请求总耗时")
+llm_prompt_tokens = Counter("readnote_llm_prompt_tokens_total", "LLM 提示词 token 数（来自 usage 字段）")
+llm_completion_tokens = Counter("readnote_llm_completion_tokens_total", "LLM 生成 token 数（来自 usage 字段）")
+llm_cached_prompt_tokens = Counter("readnote_llm_cached_prompt_tokens_total", "命中服务端前缀缓存的提示词 token 数（来自 usage 字段）")
+llm_cache_requests = Counter("readnote_llm_cache_requests_total", "LLM 响应缓存查询次数（result=hit/miss）")
+jobs_total = Counter("readnote_jobs_total", "后台任务数（status=queued/succeeded/failed/rejected）")
+graph_throttled = Counter("readnote_graph_throttled_total", "Graph 返回 429 / 503 的次数")
+graph_retries = Counter("readnote_graph_retries_total", "因 429 / 503 重试 Graph 请求的次数")
+graph_rate_limited = Counter("readnote_graph_rate_limited_total", "被本地令牌桶延迟发送的 Graph 请求数（scope=user/global）")
+llm_coalesced = Counter("readnote_llm_coalesced_total", "合并到进行中的相同 LLM 调用的请求数")
+llm_fallbacks = Counter("readnote_llm_fallbacks_total", "主模型限流或出错后改用备用模型的次数")
+answer_grading = Counter("readnote_answer_grading_total", "答题判定方式（result=exact/choice/set/fuzzy 为本地判定正确，llm 为交由模型分析）")
+question_validation = Counter("readnote_question_validation_total", "生成题目的校验结果（result=valid/repaired/dropped/topped_up）")
+
+REGISTRY = [stage_duration, request_duration, llm_prompt_tokens, llm_completion_tokens, llm_cached_prompt_tokens,
+            llm_cache_requests, jobs_total, graph_throttled, graph_retries, graph_rate_limited, llm_coalesced,
+            llm_fallbacks, question_validation, answer_grading]
+
+# 当前请求内各阶段累计耗时，供 Server-Timing 响应头使用
+_request_timings: ContextVar[Optional[dict]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timing() -> dict:
+    timings: dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """记录一个阶段的耗时：写入直方图，并累加到当前请求的 Server-Timing"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=stage, **labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def record_llm_usage(task: str, usage) -> None:
+    """从 OpenAI 响应的 usage 字段累计 token 数"""
+    if usage is None:
+        return
+    llm_prompt_tokens.inc(getattr(usage, "prompt_tokens", 0) or 0, task=task)
+    llm_completion_tokens.inc(getattr(usage, "completion_tokens", 0) or 0, task=task)
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None:
+        llm_cached_prompt_tokens.inc(getattr(details, "cached_tokens", 0) or 0, task=task)
+
+
+def server_timing_header(timings: dict, total: float) -> str:
+    parts = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def render_prometheus(extra: Optional[list] = None) -> str:
+    lines = []
+    for metric in REGISTRY + list(extra or []):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
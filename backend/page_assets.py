@@ -0,0 +1,289 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import ipaddress
+import logging
+import os
+import re
+import socket
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import unquote_to_bytes
+
+import httpx
+from dotenv import load_dotenv
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# 加载环境变量
+load_dotenv()
+ASSET_FETCH_CONCURRENCY = int(os.getenv("ASSET_FETCH_CONCURRENCY", "4"))  # 同时下载的图片数
+ASSET_FETCH_TIMEOUT = float(os.getenv("ASSET_FETCH_TIMEOUT", "10"))  # 单张图片下载超时（秒）
+ASSET_MAX_BYTES = int(os.getenv("ASSET_MAX_BYTES", str(4 * 1024 * 1024)))  # 单张图片大小上限
+ASSET_TOTAL_BYTES = int(os.getenv("ASSET_TOTAL_BYTES", str(25 * 1024 * 1024)))  # 单个页面所有图片的大小上限
+ASSET_MAX_COUNT = int(os.getenv("ASSET_MAX_COUNT", "30"))  # 单个页面最多上传的图片数
+ASSET_MAX_REDIRECTS = int(os.getenv("ASSET_MAX_REDIRECTS", "3"))  # 下载图片时最多跟随的重定向次数
+
+PLACEHOLDER_PREFIX = "readnote-img-"
+# src 前不能是字母、数字或连字符，避免匹配 data-src 等懒加载属性
+_IMG_SRC = re.compile(r'(<img\b[^>]*?(?<![\w-])src\s*=\s*)(["\'])(.*?)\2', re.IGNORECASE | re.DOTALL)
+_IMG_TAG = re.compile(r'<img\b[^>]*?(?<![\w-])src\s*=\s*(["\'])(.*?)\1[^>]*>', re.IGNORECASE | re.DOTALL)
+_DATA_URI = re.compile(r'^data:([^;,]*)((?:;[^;,]*)*?)(;base64)?,(.*)$', re.IGNORECASE | re.DOTALL)
+
+
+@dataclass
+class Asset:
+    name: str  # multipart 中的部件名，页面 HTML 通过 src="name:<name>" 引用
+    content_type: str
+    data: bytes
+
+
+def _placeholder(index: int) -> str:
+    return f"{PLACEHOLDER_PREFIX}{index}"
+
+
+def extract_images(content: str, images: Optional[list] = None) -> tuple[str, list]:
+    """
+    把内容中 <img> 的 src 换成短占位符（同一地址共用一个），images 中额外的图片追加在末尾
+    提示词中不再出现 data URI 与长链接；返回 (替换后的内容, 占位符序号对应的原始地址)
+    """
+    sources: list[str] = []
+    index_of: dict[str, int] = {}
+
+    def register(src: str) -> str:
+        src = src.strip()
+        if src not in index_of:
+            index_of[src] = len(sources)
+            sources.append(src)
+        return _placeholder(index_of[src])
+
+    def replace(match: re.Match) -> str:
+        src = match.group(3)
+        if not src.lower().startswith(("http://", "https://", "data:image/")):
+            return match.group(0)
+        return f"{match.group(1)}{match.group(2)}{register(src)}{match.group(2)}"
+
+    content = _IMG_SRC.sub(replace, content)
+    extra = [src for src in images or [] if src and src.strip() not in index_of]
+    if extra:
+        content += "\n" + "\n".join(f'<img src="{register(src)}" />' for src in extra)
+    return content, sources
+
+
+def _decode_data_uri(src: str) -> Optional[tuple[str, bytes]]:
+    match = _DATA_URI.match(src)
+    if not match:
+        return None
+    content_type = match.group(1) or "text/plain"
+    try:
+        if match.group(3):
+            data = base64.b64decode(match.group(4), validate=False)
+        else:
+            data = unquote_to_bytes(match.group(4))
+    except (binascii.Error, ValueError):
+        return None
+    return content_type, data
+
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def _resolve_public_host(host: str, port: int) -> Optional[str]:
+    """
+    解析主机名，所有地址都是公网地址时返回其中一个用于连接，否则返回 None
+    图片地址来自用户提交的网页内容，不能让服务端替用户访问内网、本机或云元数据地址
+    """
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError):
+        return None
+    addresses = [info[4][0] for info in infos]
+    try:
+        if not addresses or not all(_is_public_address(address) for address in addresses):
+            return None
+    except ValueError:
+        return None
+    return addresses[0]
+
+
+class AssetFetcher:
+    """
+    页面图片下载器：共享连接池，按 ASSET_FETCH_CONCURRENCY 并发下载，
+    单张超过 ASSET_MAX_BYTES 时中止下载；data URI 直接解码，不发请求
+    只下载解析到公网地址的图片，重定向由本类逐跳跟随并重新校验
+    """
+
+    def __init__(self, concurrency: int = ASSET_FETCH_CONCURRENCY, timeout: float = ASSET_FETCH_TIMEOUT,
+                 max_bytes: int = ASSET_MAX_BYTES):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """懒加载底层连接池（需在事件循环内首次创建）"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=False)
+        return self._client
+
+    async def _pinned_request(self, url: httpx.URL) -> Optional[httpx.Request]:
+        """
+        校验目标地址并构造请求；请求直接连接校验过的 IP，避免再次解析时得到内网地址（DNS rebinding），
+        Host 头与 TLS SNI 仍使用原主机名
+        """
+        if url.scheme not in ("http", "https") or not url.host:
+            return None
+        address = await _resolve_public_host(url.host, url.port or (443 if url.scheme == "https" else 80))
+        if address is None:
+            logger.warning(f"拒绝下载非公网地址的图片 {str(url)[:200]}")
+            return None
+        return self.client.build_request("GET", url.copy_with(host=address),
+                                         headers={"Host": url.netloc.decode("ascii")},
+                                         extensions={"sni_hostname": url.host})
+
+    async def _download(self, url: str) -> Optional[tuple[str, bytes]]:
+        target = httpx.URL(url)
+        for _ in range(ASSET_MAX_REDIRECTS + 1):
+            request = await self._pinned_request(target)
+            if request is None:
+                return None
+            response = await self.client.send(request, stream=True)
+            try:
+                if not response.is_redirect:
+                    return await self._read(response)
+                # 重定向地址相对于原始 URL 解析，下一跳重新校验
+                target = target.join(response.headers["Location"])
+            finally:
+                await response.aclose()
+        return None
+
+    async def _read(self, response: httpx.Response) -> Optional[tuple[str, bytes]]:
+        if response.status_code != 200:
+            return None
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        if int(response.headers.get("Content-Length") or 0) > self.max_bytes:
+            return None
+        chunks, size = [], 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > self.max_bytes:
+                return None
+            chunks.append(chunk)
+        return content_type, b"".join(chunks)
+
+    async def _load(self, src: str, limit: asyncio.Semaphore) -> Optional[tuple[str, bytes]]:
+        if src.lower().startswith("data:"):
+            loaded = _decode_data_uri(src)
+        else:
+            try:
+                async with limit:
+                    loaded = await self._download(src)
+            except (httpx.HTTPError, httpx.InvalidURL) as e:
+                logger.warning(f"下载图片失败 {src[:200]}: {str(e)}")
+                return None
+        if loaded is None or not loaded[0].startswith("image/") or len(loaded[1]) > self.max_bytes:
+            return None
+        return loaded
+
+    async def fetch(self, sources: list) -> list:
+        """
+        并发获取 sources 中的图片，返回与 sources 对应的 Asset 列表（失败或超限为 None）
+        内容相同的图片只上传一份；超出 ASSET_MAX_COUNT / ASSET_TOTAL_BYTES 的部分同样为 None
+        """
+        limit = asyncio.Semaphore(self.concurrency)
+        with span("asset_fetch"):
+            loaded = await asyncio.gather(*(self._load(src, limit) for src in sources))
+        assets: list[Optional[Asset]] = []
+        by_digest: dict[str, Asset] = {}
+        total = 0
+        for item in loaded:
+            if item is None:
+                assets.append(None)
+                continue
+            content_type, data = item
+            digest = hashlib.sha256(data).hexdigest()
+            asset = by_digest.get(digest)
+            if asset is None:
+                if len(by_digest) >= ASSET_MAX_COUNT or total + len(data) > ASSET_TOTAL_BYTES:
+                    assets.append(None)
+                    continue
+                asset = Asset(name=f"part{len(by_digest) + 1}", content_type=content_type, data=data)
+                by_digest[digest] = asset
+                total += len(data)
+            assets.append(asset)
+        return assets
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+def attach_assets(xhtml: str, sources: list, assets: list) -> tuple[str, list]:
+    """
+    把页面 HTML 中的占位符换成 name:partN 引用，返回 (页面 HTML, 需要上传的 Asset 列表)
+    下载失败的网络图片保留原链接交给 Graph 自行获取，失败的 data URI 图片直接去掉；
+    模型遗漏的图片追加到页面末尾，避免丢失内容
+    """
+    referenced = set()
+
+    def target(index: int) -> Optional[str]:
+        asset = assets[index]
+        if asset is not None:
+            return f"name:{asset.name}"
+        src = sources[index]
+        return src if src.lower().startswith(("http://", "https://")) else None
+
+    def replace(match: re.Match) -> str:
+        src = match.group(2)
+        if not src.startswith(PLACEHOLDER_PREFIX):
+            return match.group(0)
+        try:
+            index = int(src[len(PLACEHOLDER_PREFIX):])
+        except ValueError:
+            return ""
+        if index >= len(sources):
+            return ""
+        referenced.add(index)
+        new_src = target(index)
+        return match.group(0).replace(src, new_src, 1) if new_src else ""
+
+    xhtml = _IMG_TAG.sub(replace, xhtml)
+    used = {target(i) for i in referenced}
+    missing = []
+    for i in range(len(sources)):
+        src = target(i)
+        # 内容相同的图片只追加一次
+        if i not in referenced and src and src not in used:
+            used.add(src)
+            missing.append(f'<img src="{src}" />')
+    if missing:
+        block = "\n".join(f"<p>{tag}</p>" for tag in missing)
+        if re.search(r"</body>", xhtml, re.IGNORECASE):
+            xhtml = re.sub(r"</body>", lambda _: block + "\n</body>", xhtml, count=1, flags=re.IGNORECASE)
+        else:
+            xhtml += "\n" + block
+    parts, seen = [], set()
+    for asset in assets:
+        if asset is not None and asset.name not in seen and f"name:{asset.name}" in xhtml:
+            seen.add(asset.name)
+            parts.append(asset)
+    return xhtml, parts
+
+
+def multipart_files(xhtml: str, parts: list) -> list:
+    """Graph 多部件创建页面的请求体：Presentation 部件为页面 HTML，其余为二进制图片"""
+    files = [("Presentation", (None, xhtml.encode("utf-8"), "application/xhtml+xml"))]
+    files.extend((asset.name, (asset.name, asset.data, asset.content_type)) for asset in parts)
+    return files
+
+
+asset_fetcher = AssetFetcher()
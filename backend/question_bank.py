@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import random
+import re
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+
+from cache import TTLCache
+from llm_scheduler import llm_priority, BATCH, INTERACTIVE
+from session_store import MemorySessionStore, SQLiteSessionStore
+
+logger = logging.getLogger(__name__)
+
+# 加载环境变量
+load_dotenv()
+QUESTION_BANK_DB_PATH = os.getenv("QUESTION_BANK_DB_PATH", "")  # 为空时只保存在内存；设置后题库持久化到 SQLite 文件
+QUESTION_BANK_TTL = float(os.getenv("QUESTION_BANK_TTL", "2592000"))  # 题库有效期（秒），默认 30 天
+QUESTION_BANK_BATCH = int(os.getenv("QUESTION_BANK_BATCH", "10"))  # 每次生成的题目数
+QUESTION_BANK_MAX = int(os.getenv("QUESTION_BANK_MAX", "40"))  # 单个页面版本最多保存的题目数
+QUESTION_BANK_REFILL_THRESHOLD = int(os.getenv("QUESTION_BANK_REFILL_THRESHOLD", "5"))  # 未出过的题少于此数时后台补题
+
+# generate(题目数, 已有题目) -> 新题目列表
+QuestionGenerator = Callable[[int, list], Awaitable[list]]
+
+
+def _question_text(question) -> str:
+    text = question.get("question", "") if isinstance(question, dict) else str(question)
+    return re.sub(r"\s+", "", text)
+
+
+class QuestionBank:
+    """
+    按 (页面 ID, lastModifiedDateTime) 保存的复习题库
+
+    页面版本首次出题时生成一批题目并持久化（SQLite），之后每次按出题次数从少到多抽取；
+    没出过的题不足 QUESTION_BANK_REFILL_THRESHOLD 道时在后台补充新题，直到 QUESTION_BANK_MAX。
+    页面被修改后版本变化，自然使用新的题库。
+    """
+
+    def __init__(self, db_path: str = QUESTION_BANK_DB_PATH, ttl: float = QUESTION_BANK_TTL,
+                 batch: int = QUESTION_BANK_BATCH, max_size: int = QUESTION_BANK_MAX,
+                 refill_threshold: int = QUESTION_BANK_REFILL_THRESHOLD):
+        self.batch = batch
+        self.max_size = max_size
+        self.refill_threshold = refill_threshold
+        if db_path:
+            self._store = SQLiteSessionStore(db_path, ttl, table="question_bank")
+        else:
+            self._store = MemorySessionStore(ttl=ttl)
+        self._locks = TTLCache(maxsize=4096, ttl=3600)
+        self._fills: dict[str, asyncio.Task] = {}  # 进行中的生成任务，同一页面版本只生成一次
+        self._tasks: set[asyncio.Task] = set()  # 后台任务的强引用，避免运行中被事件循环回收
+
+    @staticmethod
+    def key(page_id: str, version: str) -> str:
+        return f"{page_id}@{version}"
+
+    def _lock(self, key: str) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks.set(key, lock)
+        return lock
+
+    async def _fill(self, key: str, generate: QuestionGenerator, count: int):
+        """生成新题并去重合并进题库"""
+        entry = await self._store.get(key) or {"questions": [], "served": []}
+        new_questions = await generate(count, [q.get("question", "") for q in entry["questions"]
+                                               if isinstance(q, dict)])
+        async with self._lock(key):
+            # 生成期间可能有抽题写入了出题次数，重新读取后再合并
+            entry = await self._store.get(key) or {"questions": [], "served": []}
+            seen = {_question_text(q) for q in entry["questions"]}
+            added = 0
+            for question in new_questions:
+                text = _question_text(question)
+                if not text or text in seen or len(entry["questions"]) >= self.max_size:
+                    continue
+                seen.add(text)
+                entry["questions"].append(question)
+                entry["served"].append(0)
+                added += 1
+            # 连续生成不出新题说明页面内容已经出尽，之后不再补题
+            entry["fruitless"] = 0 if added else entry.get("fruitless", 0) + 1
+            await self._store.set(key, entry)
+        return entry
+
+    async def fill(self, key: str, generate: QuestionGenerator, count: int) -> dict:
+        """同一页面版本同时只有一个生成任务，其他调用方等待同一个结果"""
+        task = self._fills.get(key)
+        if task is None:
+            task = self._spawn(self._fill(key, generate, count))
+            self._fills[key] = task
+            task.add_done_callback(lambda _: self._fills.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _refill(self, key: str, generate: QuestionGenerator, priority: int):
+        llm_priority.set(priority)
+        return await self.fill(key, generate, self.batch)
+
+    def refill_in_background(self, key: str, generate: QuestionGenerator, priority: int = BATCH):
+        """
+        在后台补题；默认按批量优先级调用 LLM，不与用户正在等待的请求争抢
+        生成任务在 fill 中共享，先启动者的优先级决定整个任务的优先级
+        """
+        if key in self._fills:
+            return
+        task = self._spawn(self._refill(key, generate, priority))
+        task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"题库后台补题失败: {task.exception()}")
+
+    async def sample(self, page_id: str, version: str, question_num: int, generate: QuestionGenerator) -> list:
+        """从题库中抽取 question_num 道题，题库为空时先同步生成，题目不足时返回已有的全部题目"""
+        key = self.key(page_id, version)
+        entry = await self._store.get(key)
+        if entry is None or not entry["questions"]:
+            entry = await self.fill(key, generate, max(self.batch, question_num))
+
+        async with self._lock(key):
+            entry = await self._store.get(key) or entry
+            served = entry["served"]
+            # 优先抽出题次数最少的题目，次数相同时随机
+            order = sorted(range(len(entry["questions"])), key=lambda i: (served[i], random.random()))
+            picked = order[:question_num]
+            for i in picked:
+                served[i] += 1
+            await self._store.set(key, entry)
+
+        unseen = sum(1 for count in served if count == 0)
+        if (unseen < max(self.refill_threshold, question_num) and len(entry["questions"]) < self.max_size
+                and entry.get("fruitless", 0) < 2):
+            self.refill_in_background(key, generate)
+        return [entry["questions"][i] for i in picked]
+
+    async def prefetch(self, page_id: str, version: str, generate: QuestionGenerator):
+        """
+        题库为空时在后台生成，供用户开始复习时预热
+        用户随后的抽题会等待同一个生成任务，因此按交互优先级调用 LLM
+        """
+        key = self.key(page_id, version)
+        if await self._store.get(key) is None:
+            self.refill_in_background(key, generate, INTERACTIVE)
+
+    async def stats(self, page_id: str, version: str) -> Optional[dict]:
+        entry = await self._store.get(self.key(page_id, version))
+        if entry is None:
+            return None
+        return {
+            "questions": len(entry["questions"]),
+            "unseen": sum(1 for count in entry["served"] if count == 0),
+            "refilling": self.key(page_id, version) in self._fills,
+        }
+
+
+question_bank = QuestionBank()
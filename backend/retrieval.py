@@ -0,0 +1,179 @@
+import asyncio
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from chunking import split_into_chunks
+from tokens import tokenize
+
+# 加载环境变量
+load_dotenv()
+RETRIEVAL_DB_PATH = os.getenv("RETRIEVAL_DB_PATH", "")  # 为空时索引只保存在内存；设置后写入 SQLite 文件
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))  # 每次检索返回的段落数
+PASSAGE_TOKENS = int(os.getenv("PASSAGE_TOKENS", "400"))  # 每个段落的 token 上限
+RETRIEVAL_TTL = float(os.getenv("RETRIEVAL_TTL", "2592000"))  # 超过该时间未更新的页面在重建时清理（秒）
+MAX_QUERY_TERMS = 64
+
+
+class RetrievalIndex:
+    """
+    基于 SQLite FTS5 的本地全文索引，按用户检索笔记段落，bm25 排序
+
+    页面清洗后的纯文本按 PASSAGE_TOKENS 切成段落入库；入库前自行分词（中日韩二元组 + 英文单词），
+    FTS5 只按空格切分，因此不依赖 SQLite 的中文分词支持。
+    每个页面记录已索引的 lastModifiedDateTime，版本未变化的页面不会重复索引。
+    path 为空时使用内存数据库：所有线程共享一个连接，逐个执行。
+    """
+
+    def __init__(self, path: str = RETRIEVAL_DB_PATH, passage_tokens: int = PASSAGE_TOKENS):
+        self.passage_tokens = passage_tokens
+        self._path = path
+        self._local = threading.local()
+        self._memory = None if path else sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = contextlib.nullcontext() if path else threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS indexed_pages "
+            "(user_key TEXT NOT NULL, page_id TEXT NOT NULL, version TEXT, title TEXT, indexed_at REAL NOT NULL, "
+            "PRIMARY KEY (user_key, page_id))"
+        )
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5"
+            "(terms, user_key UNINDEXED, page_id UNINDEXED, text UNINDEXED)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._memory is not None:
+            return self._memory
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _indexed_version(self, user_key: str, page_id: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT version FROM indexed_pages WHERE user_key = ? AND page_id = ?", (user_key, page_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _add_page(self, user_key: str, page_id: str, version: Optional[str], text: str,
+                  title: Optional[str] = None):
+        """索引（或重新索引）一个页面；版本未变化时只更新标题"""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT version FROM indexed_pages WHERE user_key = ? AND page_id = ?", (user_key, page_id)
+        ).fetchone()
+        if row is not None and version is not None and row[0] == version:
+            if title:
+                conn.execute("UPDATE indexed_pages SET title = ? WHERE user_key = ? AND page_id = ?",
+                             (title, user_key, page_id))
+                conn.commit()
+            return
+        conn.execute("DELETE FROM passages WHERE user_key = ? AND page_id = ?", (user_key, page_id))
+        rows = [
+            (" ".join(tokenize(passage)), user_key, page_id, passage)
+            for passage in split_into_chunks(text, self.passage_tokens) if passage.strip()
+        ]
+        conn.executemany("INSERT INTO passages (terms, user_key, page_id, text) VALUES (?, ?, ?, ?)", rows)
+        conn.execute(
+            "INSERT INTO indexed_pages (user_key, page_id, version, title, indexed_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (user_key, page_id) DO UPDATE SET version = excluded.version, "
+            "title = COALESCE(excluded.title, indexed_pages.title), indexed_at = excluded.indexed_at",
+            (user_key, page_id, version, title, time.time()),
+        )
+        conn.commit()
+
+    def _remove_page(self, user_key: str, page_id: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM passages WHERE user_key = ? AND page_id = ?", (user_key, page_id))
+        conn.execute("DELETE FROM indexed_pages WHERE user_key = ? AND page_id = ?", (user_key, page_id))
+        conn.commit()
+
+    def _prune(self, user_key: str, keep_page_ids: set, ttl: float = RETRIEVAL_TTL):
+        """全量重建后清理已删除的页面，以及长时间未更新的用户索引"""
+        conn = self._conn()
+        stale = [
+            page_id for (page_id,) in conn.execute(
+                "SELECT page_id FROM indexed_pages WHERE user_key = ?", (user_key,)
+            ) if page_id not in keep_page_ids
+        ]
+        for page_id in stale:
+            self._remove_page(user_key, page_id)
+        expired = conn.execute(
+            "SELECT user_key, page_id FROM indexed_pages WHERE indexed_at < ?", (time.time() - ttl,)
+        ).fetchall()
+        for expired_user, page_id in expired:
+            self._remove_page(expired_user, page_id)
+        return len(stale)
+
+    def _search(self, user_key: str, query: str, top_k: int = RETRIEVAL_TOP_K,
+                page_id: Optional[str] = None) -> list[dict]:
+        """按 bm25 返回与 query 最相关的段落；page_id 不为空时只在该页面内检索"""
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        sql = ("SELECT p.page_id, i.title, p.text, bm25(passages) AS score FROM passages p "
+               "LEFT JOIN indexed_pages i ON i.user_key = p.user_key AND i.page_id = p.page_id "
+               "WHERE passages MATCH ? AND p.user_key = ?")
+        params = [match, user_key]
+        if page_id:
+            sql += " AND p.page_id = ?"
+            params.append(page_id)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(top_k)
+        rows = self._conn().execute(sql, params).fetchall()
+        return [{"page_id": pid, "title": title, "text": text, "score": round(-score, 6)}
+                for pid, title, text, score in rows]
+
+    def _stats(self, user_key: str) -> dict:
+        conn = self._conn()
+        pages = conn.execute("SELECT COUNT(*) FROM indexed_pages WHERE user_key = ?", (user_key,)).fetchone()[0]
+        passages = conn.execute("SELECT COUNT(*) FROM passages WHERE user_key = ?", (user_key,)).fetchone()[0]
+        return {"pages": pages, "passages": passages}
+
+    def _locked(self, func, *args):
+        with self._lock:
+            return func(*args)
+
+    # sqlite3 是同步调用，分词也占用 CPU，全部放到线程池中执行（文件数据库每个线程一个连接，
+    # 内存数据库共用一个连接并加锁），不阻塞事件循环
+    async def _run(self, func, *args):
+        return await asyncio.to_thread(self._locked, func, *args)
+
+    async def indexed_version(self, user_key: str, page_id: str) -> Optional[str]:
+        return await self._run(self._indexed_version, user_key, page_id)
+
+    async def add_page(self, user_key: str, page_id: str, version: Optional[str], text: str,
+                       title: Optional[str] = None):
+        await self._run(self._add_page, user_key, page_id, version, text, title)
+
+    async def remove_page(self, user_key: str, page_id: str):
+        await self._run(self._remove_page, user_key, page_id)
+
+    async def prune(self, user_key: str, keep_page_ids: set, ttl: float = RETRIEVAL_TTL) -> int:
+        return await self._run(self._prune, user_key, keep_page_ids, ttl)
+
+    async def search(self, user_key: str, query: str, top_k: int = RETRIEVAL_TOP_K,
+                     page_id: Optional[str] = None) -> list[dict]:
+        return await self._run(self._search, user_key, query, top_k, page_id)
+
+    async def stats(self, user_key: str) -> dict:
+        return await self._run(self._stats, user_key)
+
+
+def format_passages(passages: list[dict]) -> str:
+    """把检索结果拼成提示词中的笔记内容，标注来源页面"""
+    return "\n\n".join(f"【{p['title'] or p['page_id']}】\n{p['text']}" for p in passages)
+
+
+retrieval_index = RetrievalIndex()
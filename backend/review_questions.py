@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from metrics import question_validation
+from ulits import llm_generate, llm_json_parse
+
+logger = logging.getLogger(__name__)
+
+# 加载环境变量
+load_dotenv()
+# 出题的结构化输出方式：json_schema（默认）/ json_object / text（只靠提示词约束，解析后校验）
+QUESTION_OUTPUT_MODE = os.getenv("QUESTION_OUTPUT_MODE", "json_schema")
+QUESTION_REPAIR_MAX_CHARS = 2000  # 交给模型修复的单道题原文长度上限
+
+
+class ReviewQuestion(BaseModel):
+    """一道复习题；多余字段忽略，题目与答案不能为空，数字答案（如 100）转为字符串"""
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True, coerce_numbers_to_str=True)
+
+    question: str = Field(min_length=1)
+    answer: str = Field(min_length=1)
+    explanation: str = ""
+
+
+_QUESTION_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "answer": {"type": "string"},
+        "explanation": {"type": "string"},
+    },
+    "required": ["question", "answer", "explanation"],
+    "additionalProperties": False,
+}
+# strict 模式要求根节点为对象，题目列表放在 questions 字段中
+QUESTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {"questions": {"type": "array", "items": _QUESTION_ITEM_SCHEMA}},
+    "required": ["questions"],
+    "additionalProperties": False,
+}
+
+
+def response_format(name: str, schema: dict) -> Optional[dict]:
+    if QUESTION_OUTPUT_MODE == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+    if QUESTION_OUTPUT_MODE == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def parse_items(content: str) -> list:
+    """从模型输出中取出题目列表：结构化输出为 {"questions": [...]}，文本输出退回 llm_json_parse"""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        try:
+            data = llm_json_parse(content)
+        except ValueError:
+            return []
+    if isinstance(data, dict):
+        data = data["questions"] if isinstance(data.get("questions"), list) else [data]
+    if not isinstance(data, list):
+        return [data] if data else []
+    return data
+
+
+def validate_questions(items: list) -> tuple[list, list]:
+    """逐题校验，返回 (合格的题目, 不合格的原始条目)"""
+    valid, invalid = [], []
+    for item in items:
+        try:
+            valid.append(ReviewQuestion.model_validate(item).model_dump())
+        except ValidationError:
+            invalid.append(item)
+    return valid, invalid
+
+
+async def repair_question(item) -> Optional[dict]:
+    """只把格式不合格的单道题交给模型修复，不附带页面内容，输入与输出都很小"""
+    if not item:
+        return None
+    raw = item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+    try:
+        content = await llm_generate("question_repair", response_format=response_format("review_question", _QUESTION_ITEM_SCHEMA),
+                                     item=raw[:QUESTION_REPAIR_MAX_CHARS])
+    except HTTPException as e:
+        logger.warning(f"修复题目失败: {e.detail}")
+        return None
+    valid, _ = validate_questions(parse_items(content)[:1])
+    return valid[0] if valid else None
+
+
+async def generate_questions(question_num: int, page_content: str, existing: Optional[list] = None) -> list:
+    """
+    生成复习题：结构化输出 + 逐题校验
+    不合格的题目单独修复；修复后仍不足时只补生成缺少的数量（一次），不重新生成整组
+    """
+    async def request(count: int, known: list) -> list:
+        if known:
+            content = await llm_generate("question_generate_more", response_format=response_format("review_questions", QUESTIONS_SCHEMA),
+                                         question_num=count, existing_questions="\n".join(f"- {q}" for q in known),
+                                         page_content=page_content)
+        else:
+            content = await llm_generate("question_generate", response_format=response_format("review_questions", QUESTIONS_SCHEMA),
+                                         question_num=count, page_content=page_content)
+        return parse_items(content)
+
+    existing = list(existing or [])
+    valid, invalid = validate_questions(await request(question_num, existing))
+    question_validation.inc(len(valid), result="valid")
+    if invalid:
+        repaired = await asyncio.gather(*(repair_question(item) for item in invalid))
+        fixed = [q for q in repaired if q]
+        question_validation.inc(len(fixed), result="repaired")
+        question_validation.inc(len(invalid) - len(fixed), result="dropped")
+        valid += fixed
+    missing = question_num - len(valid)
+    if missing > 0 and (invalid or not valid):
+        # 输出有缺陷导致题数不足时补题一次；模型正常输出但题数偏少时不额外调用
+        extra, _ = validate_questions(await request(missing, existing + [q["question"] for q in valid]))
+        question_validation.inc(len(extra), result="topped_up")
+        valid += extra[:missing]
+    return valid
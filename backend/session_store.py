@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from cache import TTLCache
+
+# 加载环境变量
+load_dotenv()
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory / sqlite / redis
+SESSION_TTL = float(os.getenv("SESSION_TTL", "604800"))  # 登录会话有效期（秒），令牌可自动刷新，默认 7 天
+LOGIN_STATE_TTL = float(os.getenv("LOGIN_STATE_TTL", "600"))  # /login 临时 state 有效期（秒）
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))  # 内存后端条目上限
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemorySessionStore:
+    """
+    进程内会话存储：LRU + TTL，内存占用有上限
+    仅适用于单 worker；返回副本，修改会话后需调用 set 写回
+    """
+
+    def __init__(self, maxsize: int = SESSION_MAX_ENTRIES, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize, ttl)
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        data = self._cache.get(session_id)
+        return dict(data) if data is not None else None
+
+    async def set(self, session_id: str, data: dict, ttl: Optional[float] = None):
+        self._cache.set(session_id, dict(data), ttl)
+
+    async def delete(self, session_id: str):
+        self._cache.pop(session_id)
+
+
+class SQLiteSessionStore:
+    """
+    基于 SQLite（WAL 模式）的共享会话存储，同一台机器上的多个 worker 共用一个数据库文件
+    过期条目在读取时忽略，并在写入时定期批量清理；数据库操作在线程池中执行（每个线程一个连接）
+    """
+
+    PURGE_EVERY = 100  # 每写入多少次清理一次过期条目
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL, table: str = "sessions"):
+        self.ttl = ttl
+        self.table = table
+        self._local = threading.local()
+        self._path = path
+        self._writes = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            "(id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, session_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            f"SELECT data FROM {self.table} WHERE id = ? AND expires_at > ?",
+            (session_id, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, session_id: str, data: dict, ttl: Optional[float]):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        conn = self._conn()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (id, data, expires_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data, ensure_ascii=False), expires_at),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+
+    def _delete(self, session_id: str):
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (session_id,))
+        conn.commit()
+
+    # sqlite3 是同步调用，多 worker 写入竞争时可能等待锁（最长 timeout 秒），放到线程池中执行，不阻塞事件循环
+    async def get(self, session_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, session_id)
+
+    async def set(self, session_id: str, data: dict, ttl: Optional[float] = None):
+        await asyncio.to_thread(self._set, session_id, data, ttl)
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._delete, session_id)
+
+
+class RedisSessionStore:
+    """
+    基于 Redis 协议的共享会话存储（可替换为任何兼容 Redis 协议的服务），过期由服务端 TTL 负责
+    需要安装可选依赖 redis
+    """
+
+    def __init__(self, url: str = REDIS_URL, ttl: float = SESSION_TTL, prefix: str = "session:"):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("SESSION_BACKEND=redis 需要安装 redis 包") from e
+        self.ttl = ttl
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url, decode_responses=True)
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        raw = await self._redis.get(self.prefix + session_id)
+        return json.loads(raw) if raw else None
+
+    async def set(self, session_id: str, data: dict, ttl: Optional[float] = None):
+        await self._redis.set(
+            self.prefix + session_id,
+            json.dumps(data, ensure_ascii=False),
+            ex=max(1, int(self.ttl if ttl is None else ttl)),
+        )
+
+    async def delete(self, session_id: str):
+        await self._redis.delete(self.prefix + session_id)
+
+
+def create_session_store(backend: str = SESSION_BACKEND, ttl: float = SESSION_TTL, name: str = "sessions"):
+    """根据配置创建会话存储后端；name 区分同一后端中的不同数据（SQLite 表名 / Redis 键前缀）"""
+    if backend == "memory":
+        return MemorySessionStore(ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteSessionStore(ttl=ttl, table=name)
+    if backend == "redis":
+        return RedisSessionStore(ttl=ttl, prefix="session:" if name == "sessions" else f"{name}:")
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
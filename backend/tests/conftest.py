@@ -0,0 +1,11 @@
+"""
+单元测试（在 backend 目录下运行）：
+    python -m pytest tests
+
+后端模块是平铺在 backend 目录下的脚本式模块，这里把 backend 加入 sys.path，
+从仓库根目录运行 pytest 也能导入。异步代码在测试中用 asyncio.run 驱动，不依赖额外的插件。
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
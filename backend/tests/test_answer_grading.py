@@ -0,0 +1,46 @@
+import pytest
+
+from answer_grading import grade_answer, normalize_answer
+from bench.check_grading import CASES
+
+
+@pytest.mark.parametrize("question,user_answer,correct_answer,expected", CASES)
+def test_grade_answer_cases(question, user_answer, correct_answer, expected):
+    assert grade_answer(question, user_answer, correct_answer) == expected
+
+
+@pytest.mark.parametrize("user_answer,correct_answer", [
+    ("12", "1/2"), ("31", "3:1"), ("1230", "12:30"), ("C", "C#"), ("f(x)", "f'(x)"),
+    ("ab", "a*b"), ("50", "50%"), ("init", "__init__"), ("5", "-5"), ("15", "1.5"),
+])
+def test_symbols_are_kept_for_exact_match(user_answer, correct_answer):
+    assert normalize_answer(user_answer) != normalize_answer(correct_answer)
+
+
+def test_normalize_ignores_case_width_whitespace_and_trailing_punctuation():
+    assert normalize_answer("答案：ＡＢＣ  def。") == normalize_answer("abc def") == "abcdef"
+
+
+def test_set_match_requires_explicit_delimiters():
+    assert grade_answer("列举", "乙、甲", "甲、乙") == "set"
+    assert grade_answer("Which city?", "York New", "New York") is None
+    # 和 / 与 出现在词语内部时不能当作分隔符
+    assert grade_answer("谁参与了？", "者参与", "参与者") is None
+
+
+def test_fuzzy_only_for_latin_typos():
+    assert grade_answer("spell", "recieve", "receive") == "fuzzy"
+    assert grade_answer("spell", "principle", "principal") is None
+    assert grade_answer("复杂度", "O(n2)", "O(n^2)") is None
+    assert grade_answer("朝代", "公元221年", "公元前221年") is None
+
+
+def test_importing_grader_creates_no_files(tmp_path, monkeypatch):
+    import importlib
+    import sys
+
+    monkeypatch.chdir(tmp_path)
+    for name in ("answer_grading", "tokens"):
+        sys.modules.pop(name, None)
+    importlib.import_module("answer_grading")
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,85 @@
+import pytest
+
+import cache
+from cache import PageContentCache, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_ttl_cache_expires_entries(clock):
+    c = TTLCache(maxsize=4, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2, ttl=30)
+    clock[0] += 11
+    assert c.get("a") is None
+    assert c.get("b") == 2
+    assert "a" not in c
+
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    c = TTLCache(maxsize=2, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert len(c) == 2
+
+
+def test_page_cache_observe_drops_stale_entry():
+    pages = PageContentCache(maxsize=8, ttl=60)
+    pages.set("u", "p", "old text", version="v1")
+    pages.observe("u", "p", "v1")
+    assert pages.get("u", "p") == "old text"
+    pages.observe("u", "p", "v2")
+    assert pages.get("u", "p") is None
+    assert pages.version("u", "p") == "v2"
+
+
+def test_page_cache_observe_ignores_empty_version():
+    pages = PageContentCache(maxsize=8, ttl=60)
+    pages.set("u", "p", "text", version="v1")
+    pages.observe("u", "p", None)
+    assert pages.get("u", "p") == "text"
+
+
+def test_page_cache_set_uses_observed_version():
+    pages = PageContentCache(maxsize=8, ttl=60)
+    pages.observe("u", "p", "v1")
+    pages.set("u", "p", "text")
+    assert pages.get("u", "p") == "text"
+    pages.observe("u", "p", "v2")
+    assert pages.get("u", "p") is None
+
+
+def test_page_cache_is_per_user():
+    pages = PageContentCache(maxsize=8, ttl=60)
+    pages.set("alice", "p", "a", version="v1")
+    pages.observe("bob", "p", "v2")
+    assert pages.get("alice", "p") == "a"
+    assert pages.get("bob", "p") is None
+
+
+def test_invalidate_refuses_pre_write_version_from_stale_listing():
+    pages = PageContentCache(maxsize=8, ttl=60)
+    pages.observe("u", "p", "v1")
+    pages.set("u", "p", "before write", version="v1")
+    pages.invalidate("u", "p")
+    assert pages.get("u", "p") is None
+    assert pages.version("u", "p") is None
+
+    # 写回后重新抓取的内容还没有版本号；缓存的页面列表仍报告写之前的 v1
+    pages.set("u", "p", "after write")
+    pages.observe("u", "p", "v1")
+    assert pages.get("u", "p") == "after write"
+    assert pages.version("u", "p") is None
+
+    # 列表同步到新版本后照常登记
+    pages.observe("u", "p", "v2")
+    assert pages.version("u", "p") == "v2"
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import httpx
+
+from graph_client import GraphClient, TokenBucket, retry_after_seconds
+
+BASE_URL = "https://graph.test/v1.0"
+
+
+def make_client(handler, **kwargs) -> GraphClient:
+    kwargs.setdefault("rate", 0)
+    kwargs.setdefault("user_rate", 0)
+    client = GraphClient(base_url=BASE_URL, **kwargs)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+class FakeToken:
+    def __init__(self):
+        self.access_token = "old"
+        self.session_id = "session"
+        self.refreshes = 0
+
+    async def refresh(self) -> str:
+        self.refreshes += 1
+        self.access_token = f"new{self.refreshes}"
+        return self.access_token
+
+
+def test_retry_after_seconds_parses_seconds_and_http_date():
+    def response(value):
+        return httpx.Response(429, headers={"Retry-After": value} if value else {})
+
+    assert retry_after_seconds(response("3")) == 3
+    assert retry_after_seconds(response(None)) is None
+    assert retry_after_seconds(response("not a date")) is None
+    assert 5 < retry_after_seconds(response(formatdate(time.time() + 10, usegmt=True))) <= 10
+    assert retry_after_seconds(response(formatdate(time.time() - 10, usegmt=True))) == 0
+
+
+def test_token_bucket_waits_when_empty():
+    async def main():
+        bucket = TokenBucket(rate=100, capacity=2)
+        waits = [await bucket.acquire() for _ in range(3)]
+        return waits
+
+    waits = asyncio.run(main())
+    assert waits[:2] == [0, 0]
+    assert 0 < waits[2] <= 0.02
+
+
+def test_token_bucket_pause_delays_acquire():
+    async def main():
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.pause(0.05)
+        return await bucket.acquire()
+
+    assert asyncio.run(main()) > 0.03
+
+
+def test_request_retries_429_with_retry_after():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"ok": True})
+
+    async def main():
+        client = make_client(handler, max_retries=3)
+        try:
+            return await client.get("/me/onenote/notebooks", "token")
+        finally:
+            await client.aclose()
+
+    response = asyncio.run(main())
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+def test_request_gives_up_after_max_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503, headers={"Retry-After": "0"})
+
+    async def main():
+        client = make_client(handler, max_retries=2)
+        try:
+            return await client.get("/me", "token")
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(main()).status_code == 503
+    assert len(calls) == 3
+
+
+def test_401_refreshes_token_once_even_after_throttling():
+    seen = []
+
+    def handler(request):
+        auth = request.headers["Authorization"]
+        seen.append(auth)
+        if auth == "Bearer old":
+            return httpx.Response(429, headers={"Retry-After": "0"}) if len(seen) == 1 else httpx.Response(401)
+        return httpx.Response(401)
+
+    async def main():
+        client = make_client(handler, max_retries=3)
+        token = FakeToken()
+        try:
+            response = await client.get("/me", token)
+        finally:
+            await client.aclose()
+        return response, token
+
+    response, token = asyncio.run(main())
+    assert response.status_code == 401
+    assert token.refreshes == 1
+    assert seen == ["Bearer old", "Bearer old", "Bearer new1"]
+
+
+def test_batch_keeps_item_order_and_retries_throttled_items():
+    bodies = []
+    throttled = set()
+
+    def handler(request):
+        body = httpx.Response(200, content=request.content).json()
+        bodies.append(body)
+        responses = []
+        for item in body["requests"]:
+            if item["url"] == "/pages/1" and item["url"] not in throttled:
+                throttled.add(item["url"])
+                responses.append({"id": item["id"], "status": 429, "headers": {"Retry-After": "0"}})
+            else:
+                responses.append({"id": item["id"], "status": 200,
+                                  "headers": {"Content-Type": "application/json"}, "body": {"url": item["url"]}})
+        return httpx.Response(200, json={"responses": list(reversed(responses))})
+
+    async def main():
+        client = make_client(handler)
+        items = [("GET", f"{BASE_URL}/pages/{i}", None) for i in range(25)]
+        try:
+            return await client.batch(items, "token", user_key="u")
+        finally:
+            await client.aclose()
+
+    responses = asyncio.run(main())
+    assert [r.json()["url"] for r in responses] == [f"/pages/{i}" for i in range(25)]
+    # 25 个请求拆成 20 + 5 两个批次，被限流的 1 个单独重试
+    assert sorted(len(b["requests"]) for b in bodies) == [1, 5, 20]
+
+
+def test_user_limit_is_shared_per_user():
+    async def main():
+        client = GraphClient(base_url=BASE_URL, user_concurrency=2)
+        return client.user_limit("a"), client.user_limit("a"), client.user_limit("b")
+
+    a1, a2, b = asyncio.run(main())
+    assert a1 is a2
+    assert a1 is not b
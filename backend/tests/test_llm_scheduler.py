@@ -0,0 +1,92 @@
+import asyncio
+
+from llm_scheduler import BATCH, INTERACTIVE, LLMScheduler
+
+
+def test_same_key_calls_are_coalesced():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def main():
+        scheduler = LLMScheduler(max_inflight=4)
+        results = await asyncio.gather(*(scheduler.run("same", call) for _ in range(5)))
+        other = await scheduler.run("other", call)
+        return results, other, scheduler.stats()
+
+    results, other, stats = asyncio.run(main())
+    assert results == ["answer"] * 5 and other == "answer"
+    assert len(calls) == 2
+    assert stats["coalescing"] == 0 and stats["inflight"] == 0
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    async def call():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        scheduler = LLMScheduler(max_inflight=1)
+        first = asyncio.create_task(scheduler.run("k", call))
+        second = asyncio.create_task(scheduler.run("k", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "answer"
+
+
+def test_interactive_waiters_go_before_batch():
+    order = []
+
+    async def worker(scheduler, name, priority):
+        async with scheduler.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        scheduler = LLMScheduler(max_inflight=1)
+        holder = asyncio.create_task(worker(scheduler, "holder", INTERACTIVE))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(worker(scheduler, f"batch{i}", BATCH)) for i in range(2)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(worker(scheduler, "chat", INTERACTIVE)))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 3
+        await asyncio.gather(holder, *tasks)
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert order == ["holder", "chat", "batch0", "batch1"]
+    assert stats["inflight"] == 0 and stats["queued"] == 0
+
+
+def test_cancelled_waiter_releases_its_slot():
+    async def main():
+        scheduler = LLMScheduler(max_inflight=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot(INTERACTIVE):
+                await release.wait()
+
+        async def wait_for_slot():
+            async with scheduler.slot(BATCH):
+                return "ran"
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(wait_for_slot())
+        waiting = asyncio.create_task(wait_for_slot())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        release.set()
+        await holder
+        return await asyncio.wait_for(waiting, 1), scheduler.stats()
+
+    result, stats = asyncio.run(main())
+    assert result == "ran"
+    assert stats["inflight"] == 0
@@ -0,0 +1,122 @@
+import asyncio
+
+from question_bank import QuestionBank
+
+
+class FakeGenerator:
+    """按调用次数编号生成题目，记录每次调用的参数"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.calls = []
+        self._next = 0
+
+    async def __call__(self, count: int, existing: list) -> list:
+        self.calls.append((count, list(existing)))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        questions = [{"question": f"问题{self._next + i}", "answer": "答案"} for i in range(count)]
+        self._next += count
+        return questions
+
+
+async def _drain(bank: QuestionBank):
+    while bank._tasks:
+        await asyncio.gather(*bank._tasks, return_exceptions=True)
+
+
+def test_sample_generates_once_then_serves_from_bank():
+    async def main():
+        bank = QuestionBank(batch=10, max_size=10, refill_threshold=0)
+        generate = FakeGenerator()
+        first = await bank.sample("p", "v1", 3, generate)
+        second = await bank.sample("p", "v1", 3, generate)
+        await _drain(bank)
+        return generate, first, second
+
+    generate, first, second = asyncio.run(main())
+    assert len(generate.calls) == 1
+    assert generate.calls[0][0] == 10
+    assert len(first) == len(second) == 3
+    # 优先抽出题次数最少的题目，第二次不会重复第一次的题
+    assert not {q["question"] for q in first} & {q["question"] for q in second}
+
+
+def test_concurrent_samples_share_one_generation():
+    async def main():
+        bank = QuestionBank(batch=5, max_size=5, refill_threshold=0)
+        generate = FakeGenerator(delay=0.05)
+        results = await asyncio.gather(*(bank.sample("p", "v1", 2, generate) for _ in range(5)))
+        await _drain(bank)
+        return generate, results
+
+    generate, results = asyncio.run(main())
+    assert len(generate.calls) == 1
+    assert all(len(r) == 2 for r in results)
+
+
+def test_sample_returns_all_questions_when_bank_is_small():
+    async def main():
+        bank = QuestionBank(batch=3, max_size=3, refill_threshold=0)
+        return await bank.sample("p", "v1", 5, FakeGenerator())
+
+    # 首次生成 max(batch, question_num) 道，超过 max_size 的部分丢弃
+    assert len(asyncio.run(main())) == 3
+
+
+def test_refills_in_background_when_unseen_runs_low():
+    async def main():
+        bank = QuestionBank(batch=4, max_size=8, refill_threshold=2)
+        generate = FakeGenerator()
+        await bank.sample("p", "v1", 3, generate)
+        await _drain(bank)
+        stats = await bank.stats("p", "v1")
+        return generate, stats
+
+    generate, stats = asyncio.run(main())
+    assert len(generate.calls) == 2
+    # 补题时把已有题目交给生成器用于去重
+    assert len(generate.calls[1][1]) == 4
+    assert stats == {"questions": 8, "unseen": 5, "refilling": False}
+
+
+def test_duplicate_questions_are_not_added_and_refill_stops():
+    async def same_questions(count, existing):
+        return [{"question": f"问题 {i}", "answer": "答案"} for i in range(count)]
+
+    async def main():
+        bank = QuestionBank(batch=2, max_size=10, refill_threshold=5)
+        for _ in range(4):
+            await bank.sample("p", "v1", 1, same_questions)
+            await _drain(bank)
+        return bank, await bank.stats("p", "v1")
+
+    bank, stats = asyncio.run(main())
+    assert stats["questions"] == 2
+    entry = asyncio.run(bank._store.get(bank.key("p", "v1")))
+    assert entry["fruitless"] == 2
+
+
+def test_versions_have_separate_banks():
+    async def main():
+        bank = QuestionBank(batch=2, max_size=2, refill_threshold=0)
+        generate = FakeGenerator()
+        await bank.sample("p", "v1", 1, generate)
+        await bank.sample("p", "v2", 1, generate)
+        return generate
+
+    assert len(asyncio.run(main()).calls) == 2
+
+
+def test_sqlite_store_persists_between_instances(tmp_path):
+    path = str(tmp_path / "bank.db")
+
+    async def main():
+        generate = FakeGenerator()
+        await QuestionBank(db_path=path, batch=3, max_size=3, refill_threshold=0).sample("p", "v1", 1, generate)
+        stats = await QuestionBank(db_path=path).stats("p", "v1")
+        return generate, stats
+
+    generate, stats = asyncio.run(main())
+    assert len(generate.calls) == 1
+    assert stats["questions"] == 3 and stats["unseen"] == 2
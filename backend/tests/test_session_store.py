@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from session_store import MemorySessionStore, SQLiteSessionStore, create_session_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore(maxsize=8, ttl=60)
+    return SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=60)
+
+
+def test_set_get_delete(store):
+    async def main():
+        await store.set("s", {"access_token": "a"})
+        got = await store.get("s")
+        await store.delete("s")
+        return got, await store.get("s"), await store.get("missing")
+
+    assert asyncio.run(main()) == ({"access_token": "a"}, None, None)
+
+
+def test_returned_session_is_a_copy(store):
+    async def main():
+        await store.set("s", {"access_token": "a"})
+        session = await store.get("s")
+        session["access_token"] = "changed"
+        return await store.get("s")
+
+    assert asyncio.run(main()) == {"access_token": "a"}
+
+
+def test_expired_sessions_are_ignored(store):
+    async def main():
+        await store.set("s", {"access_token": "a"}, ttl=0.01)
+        await asyncio.sleep(0.05)
+        return await store.get("s")
+
+    assert asyncio.run(main()) is None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "sessions.db")
+
+    async def main():
+        await SQLiteSessionStore(path, ttl=60).set("s", {"access_token": "a"})
+        return await SQLiteSessionStore(path, ttl=60).get("s")
+
+    assert asyncio.run(main()) == {"access_token": "a"}
+
+
+def test_create_session_store_rejects_unknown_backend():
+    assert isinstance(create_session_store("memory"), MemorySessionStore)
+    with pytest.raises(ValueError):
+        create_session_store("nope")
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import token_manager
+from session_store import MemorySessionStore
+from token_manager import TokenManager
+
+
+@pytest.fixture
+def token_endpoint(monkeypatch):
+    """替换 token 端点，记录刷新请求"""
+    calls = []
+
+    async def post(url, headers=None, data=None, **kwargs):
+        calls.append(data)
+        await asyncio.sleep(0.02)
+        if data["refresh_token"] == "revoked":
+            return httpx.Response(400, json={"error": "invalid_grant"})
+        return httpx.Response(200, json={"access_token": f"access{len(calls)}",
+                                         "refresh_token": f"refresh{len(calls)}", "expires_in": 3600})
+
+    monkeypatch.setattr(token_manager.graph_client, "post", post)
+    return calls
+
+
+def make_manager(store):
+    return TokenManager(store, "https://login.test/token", "client", "secret", ["Notes.Read"], skew=300)
+
+
+def test_concurrent_refreshes_share_one_request(token_endpoint):
+    async def main():
+        store = MemorySessionStore(ttl=60)
+        await store.set("s", {"access_token": "old", "refresh_token": "r0"})
+        manager = make_manager(store)
+        sessions = await asyncio.gather(*(manager.refresh("s", "old") for _ in range(5)))
+        return sessions, await store.get("s")
+
+    sessions, stored = asyncio.run(main())
+    assert len(token_endpoint) == 1
+    assert {s["access_token"] for s in sessions} == {"access1"}
+    assert stored["refresh_token"] == "refresh1"
+
+
+def test_refresh_with_already_replaced_token_skips_request(token_endpoint):
+    async def main():
+        store = MemorySessionStore(ttl=60)
+        await store.set("s", {"access_token": "new", "refresh_token": "r", "expires_at": time.time() + 3600})
+        return await make_manager(store).refresh("s", "old")
+
+    assert asyncio.run(main())["access_token"] == "new"
+    assert token_endpoint == []
+
+
+def test_ensure_fresh_refreshes_only_expiring_tokens(token_endpoint):
+    async def main():
+        store = MemorySessionStore(ttl=60)
+        manager = make_manager(store)
+        fresh = {"access_token": "a", "refresh_token": "r", "expires_at": time.time() + 3600}
+        expiring = {"access_token": "b", "refresh_token": "r", "expires_at": time.time() + 60}
+        await store.set("expiring", expiring)
+        return await manager.ensure_fresh("fresh", fresh), await manager.ensure_fresh("expiring", expiring)
+
+    fresh, refreshed = asyncio.run(main())
+    assert fresh["access_token"] == "a"
+    assert refreshed["access_token"] == "access1"
+    assert len(token_endpoint) == 1
+
+
+def test_failed_refresh_raises_401(token_endpoint):
+    async def main():
+        store = MemorySessionStore(ttl=60)
+        await store.set("s", {"access_token": "old", "refresh_token": "revoked"})
+        await make_manager(store).refresh("s", "old")
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main())
+    assert exc.value.status_code == 401
+
+
+def test_unknown_session_raises_401(token_endpoint):
+    async def main():
+        await make_manager(MemorySessionStore(ttl=60)).refresh("missing", "old")
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main())
+    assert exc.value.status_code == 401
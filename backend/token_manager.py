@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from graph_client import graph_client
+
+logger = logging.getLogger(__name__)
+
+# 加载环境变量
+load_dotenv()
+TOKEN_REFRESH_SKEW = float(os.getenv("TOKEN_REFRESH_SKEW", "300"))  # 过期前多少秒主动刷新
+
+
+class SessionToken:
+    """
+    绑定到某个会话的访问令牌，交给 graph_client 使用
+    Graph 返回 401 时，graph_client 会调用 refresh() 换取新令牌后重试一次
+    """
+
+    def __init__(self, manager: "TokenManager", session_id: str, session: dict):
+        self.manager = manager
+        self.session_id = session_id
+        self.session = session
+
+    @property
+    def access_token(self) -> str:
+        return self.session["access_token"]
+
+    async def refresh(self) -> str:
+        self.session = await self.manager.refresh(self.session_id, self.access_token)
+        return self.access_token
+
+
+class TokenManager:
+    """
+    使用 refresh_token 自动续期访问令牌
+
+    - 主动刷新：令牌距离过期不足 TOKEN_REFRESH_SKEW 秒时，在请求前刷新
+    - 被动刷新：Graph 返回 401 时刷新并重试
+    同一会话的并发刷新在进程内合并为一次 token 端点调用（single-flight）；
+    多 worker 时各进程至多各刷新一次，新令牌通过共享会话存储互相可见。
+    """
+
+    def __init__(self, store, token_url: str, client_id: str, client_secret: str, scope: list,
+                 skew: float = TOKEN_REFRESH_SKEW):
+        self.store = store
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.skew = skew
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def apply_token_response(session: dict, token_data: dict) -> dict:
+        """把 token 端点返回的数据写入会话"""
+        session["access_token"] = token_data["access_token"]
+        if token_data.get("refresh_token"):
+            session["refresh_token"] = token_data["refresh_token"]
+        expires_in = token_data.get("expires_in")
+        session["expires_at"] = time.time() + float(expires_in) if expires_in else None
+        return session
+
+    def is_expiring(self, session: dict) -> bool:
+        expires_at = session.get("expires_at")
+        return bool(expires_at) and expires_at - self.skew <= time.time()
+
+    def credential(self, session_id: str, session: dict) -> SessionToken:
+        return SessionToken(self, session_id, session)
+
+    async def ensure_fresh(self, session_id: str, session: dict) -> dict:
+        """请求前的主动刷新；令牌仍有效时原样返回会话"""
+        if self.is_expiring(session) and session.get("refresh_token"):
+            return await self.refresh(session_id, session["access_token"])
+        return session
+
+    async def refresh(self, session_id: str, stale_token: str) -> dict:
+        """
+        刷新会话令牌；stale_token 为调用方手里已失效的令牌
+        若会话中的令牌已被其他请求换新，则直接返回最新会话
+        """
+        task = self._inflight.get(session_id)
+        if task is None:
+            session = await self.store.get(session_id)
+            if session is None:
+                raise HTTPException(status_code=401, detail="Not authenticated")
+            task = self._inflight.get(session_id)
+            if task is None:
+                if session.get("access_token") != stale_token and not self.is_expiring(session):
+                    return session
+                task = asyncio.ensure_future(self._refresh(session_id, session))
+                self._inflight[session_id] = task
+                task.add_done_callback(lambda _: self._inflight.pop(session_id, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, session_id: str, session: dict) -> dict:
+        refresh_token: Optional[str] = session.get("refresh_token")
+        if not refresh_token:
+            raise HTTPException(status_code=401, detail="Token expired")
+        data = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "scope": " ".join(self.scope),
+            "refresh_token": refresh_token,
+            "grant_type": "refresh_token",
+        }
+        try:
+            r = await graph_client.post(
+                self.token_url,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                data=data,
+            )
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"Token refresh failed: {str(e)}")
+        if r.status_code != 200:
+            logger.warning(f"刷新令牌失败 session={session_id[:8]} status={r.status_code}")
+            raise HTTPException(status_code=401, detail="Token expired")
+        session = self.apply_token_response(session, r.json())
+        await self.store.set(session_id, session)
+        logger.info(f"已刷新访问令牌 session={session_id[:8]}")
+        return session
@@ -1,120 +1,328 @@
-import json
-import os
-import re
-
-from bs4 import BeautifulSoup
-from fastapi import HTTPException,status
-from json_repair import json_repair
-from openai import OpenAI
-
-from prompt import prompt_template
-from dotenv import load_dotenv
-
-# 允许 Chrome Extension 调用
-
-# 加载环境变量
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-BASE_URL = os.getenv("BASE_URL")  # 可通过 OAuth2 获取
-MODEL = os.getenv("MODEL")  # 可通过 OAuth2 获取
-openai_client = OpenAI(api_key=OPENAI_API_KEY,base_url=BASE_URL)
-
-def llm_generate(task,**params):
-    now_prompt=prompt_template[task]
-    now_prompt=now_prompt.format(**params)
-    #调用LLM进行响应
-    try:
-        response = openai_client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "user", "content": now_prompt}
-            ],
-            temperature=0.7,
-            timeout=30
-        )
-        return response.choices[0].message.content or ""
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"OpenAI error: {str(e)}"
-        )
-
-
-def clean_onenote_content(html_content: str) -> str:
-    """
-    清理OneNote页面HTML内容，提取纯文本内容用于AI分析
-    """
-    # 使用BeautifulSoup解析HTML
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # 移除不需要的标签和内容
-    # 移除样式和脚本标签
-    for tag in soup(["style", "script", "meta", "link"]):
-        tag.decompose()
-
-    # 提取文本内容
-    text = soup.get_text()
-
-    # 清理多余空白字符
-    text = re.sub(r'\n\s*\n', '\n\n', text)  # 合并多个空行
-    text = re.sub(r'[ \t]+', ' ', text)  # 合并多个空格
-    text = text.strip()
-
-    return text
-def llm_json_parse(content):
-    pattern = r"```json(.*?)```"
-    # 使用 findall 获取所有匹配项，并使用 re.DOTALL 标志
-    matches = re.findall(pattern, content, re.DOTALL)
-    # 解析 JSON 字符串
-    if matches:
-        content = matches[0]
-    content = json.loads(json_repair.repair_json(content, ensure_ascii=False))
-    return content
-
-def extract_full_html(text: str) -> str:
-    """
-    从输入文本中提取第一个完整的 HTML 文档（从 <!DOCTYPE html> 或 <html> 开始，到 </html> 结束）。
-
-    返回：
-        - 提取出的完整 HTML 字符串
-        - 如果未找到，返回空字符串
-    """
-    # 尝试匹配标准 HTML 文档（支持带或不带 DOCTYPE）
-    pattern = r'(<!DOCTYPE html\s*>?\s*<html[^>]*>.*?</html>)'
-    match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
-    if match:
-        return match.group(1).strip()
-
-    # 2. 如果没有 DOCTYPE，尝试匹配 <html>...</html>
-    pattern2 = r'(<html[^>]*>.*?</html>)'
-    match2 = re.search(pattern2, text, re.DOTALL | re.IGNORECASE)
-    if match2:
-        return match2.group(1).strip()
-
-    # 3. 如果没有 <html>，尝试匹配 <body>...</body>
-    pattern3 = r'(<body>.*?</body>)'
-    match3 = re.search(pattern3, text, re.DOTALL | re.IGNORECASE)
-    if match3:
-        return match3.group(1).strip()
-
-    # 4. 都不匹配，返回原文本
-    return text
-if __name__=="__main__":
-    result=llm_generate("question_generate", question_num=5,page_content="ssss")
-    html="""
-    ```html
-<!DOCTYPE html>
-<html>
-  <head>
-    <title>page_title</title>
-    <meta name="created" content="创建时间" />
-  </head>
-  <body>
-    笔记内容
-  </body>
-</html>
-```
-    """
-    # result=extract_full_html(html)
-    print(result)
-    #
+import json
+import logging
+import os
+import re
+from contextvars import ContextVar
+
+from bs4 import BeautifulSoup
+from fastapi import HTTPException,status
+from json_repair import json_repair
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, BadRequestError, InternalServerError, RateLimitError
+
+try:
+    from lxml import etree  # 可选依赖，用于加速 HTML 清洗
+except ImportError:
+    etree = None
+
+from prompt import prompt_template
+from llm_cache import llm_cache, cache_key
+from llm_scheduler import llm_scheduler
+from metrics import span, record_llm_usage, llm_fallbacks
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# 允许 Chrome Extension 调用
+
+# 加载环境变量
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+BASE_URL = os.getenv("BASE_URL")  # 可通过 OAuth2 获取
+MODEL = os.getenv("MODEL")  # 可通过 OAuth2 获取
+# 可选：较快 / 较便宜的模型，用于提示词较短的任务；为空时全部使用 MODEL
+FAST_MODEL = os.getenv("FAST_MODEL", "")
+FAST_MODEL_TASKS = {t.strip() for t in os.getenv(
+    "FAST_MODEL_TASKS", "chunk_summary,page_abstract,dialogue,answer_analysis,answer_item_analysis,answer_summary").split(",") if t.strip()}
+FAST_MODEL_MAX_CHARS = int(os.getenv("FAST_MODEL_MAX_CHARS", "6000"))  # 提示词不超过该长度才使用 FAST_MODEL
+# 可选：主模型被限流或不可用时改用的备用模型
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL", "")
+# 流式调用时请求 usage 统计（stream_options.include_usage），不支持该参数的服务可设为 0
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "1") == "1"
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # 单次 LLM 调用超时（秒）
+# HTML 清洗引擎：lxml（默认，未安装时自动回退）或 bs4
+HTML_CLEAN_ENGINE = os.getenv("HTML_CLEAN_ENGINE", "lxml")
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY,base_url=BASE_URL)
+# 当前上下文的 LLM 超时；后台任务不占用请求，可调大
+llm_timeout: ContextVar[float] = ContextVar("llm_timeout", default=LLM_TIMEOUT)
+_FALLBACK_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+# 拒绝 response_format 参数的模型；之后对这些模型只靠提示词约束输出格式
+_response_format_unsupported: set[str] = set()
+
+
+def route_model(task: str, prompt: str) -> str:
+    """短任务（FAST_MODEL_TASKS 中且提示词不超过 FAST_MODEL_MAX_CHARS）路由到 FAST_MODEL，其余使用 MODEL"""
+    if FAST_MODEL and task in FAST_MODEL_TASKS and len(prompt) <= FAST_MODEL_MAX_CHARS:
+        return FAST_MODEL
+    return MODEL
+
+
+def _should_fallback(model: str, error: Exception) -> bool:
+    # 只在限流、超时、连接失败与服务端错误时切换备用模型，参数错误等直接抛出
+    return bool(FALLBACK_MODEL) and model != FALLBACK_MODEL and isinstance(error, _FALLBACK_ERRORS)
+
+
+def build_messages(task: str, **params) -> tuple[list, str]:
+    """按模板生成消息（固定 system 前缀 + 用户消息），同时返回用于缓存键与模型路由的完整提示词文本"""
+    messages = prompt_template[task].messages(**params)
+    return messages, "\n\n".join(m["content"] for m in messages)
+
+
+async def _chat_completion(task: str, model: str, messages: list, **kwargs):
+    """调用 chat.completions；主模型被限流或不可用时改用 FALLBACK_MODEL 重试一次"""
+    try:
+        return await openai_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            timeout=llm_timeout.get(),
+            **kwargs
+        )
+    except Exception as e:
+        if not _should_fallback(model, e):
+            raise
+        logger.warning(f"模型 {model} 调用失败（{type(e).__name__}），改用 {FALLBACK_MODEL}")
+        llm_fallbacks.inc(task=task)
+        return await _chat_completion(task, FALLBACK_MODEL, messages, **kwargs)
+
+
+async def llm_generate(task, response_format=None, **params):
+    """
+    调用 LLM 生成完整回复
+    response_format 为结构化输出参数（如 JSON schema）；服务不支持时自动去掉该参数重试，并对该模型不再发送
+    """
+    messages, now_prompt = build_messages(task, **params)
+    model = route_model(task, now_prompt)
+    if model in _response_format_unsupported:
+        response_format = None
+    # 输出格式不同的请求不共用缓存与合并结果
+    key_prompt = now_prompt
+    if response_format:
+        key_prompt += "\n" + json.dumps(response_format, sort_keys=True, ensure_ascii=False)
+    # 可缓存的任务先查响应缓存
+    use_cache = llm_cache.enabled(task)
+    if use_cache:
+        cached = await llm_cache.get(task, model, key_prompt)
+        if cached is not None:
+            return cached
+
+    async def call() -> str:
+        with span("llm", task=task):
+            if not response_format:
+                response = await _chat_completion(task, model, messages)
+            else:
+                try:
+                    response = await _chat_completion(task, model, messages, response_format=response_format)
+                except BadRequestError as e:
+                    logger.warning(f"模型 {model} 拒绝 response_format（{str(e)[:200]}），去掉该参数重试")
+                    response = await _chat_completion(task, model, messages)
+                    _response_format_unsupported.add(model)
+        record_llm_usage(task, response.usage)
+        return response.choices[0].message.content or ""
+
+    #调用LLM进行响应：受并发上限与优先级约束，相同的进行中请求只调用一次
+    try:
+        content = await llm_scheduler.run(cache_key(task, model, key_prompt), call)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"OpenAI error: {str(e)}"
+        )
+    if use_cache:
+        await llm_cache.set(task, model, key_prompt, content)
+    return content
+
+
+async def llm_generate_stream(task,**params):
+    """
+    llm_generate 的流式版本：逐段产出模型返回的增量文本
+    输出期间一直占用调度器的调用名额；流式请求不做合并
+    """
+    messages, now_prompt = build_messages(task, **params)
+    model = route_model(task, now_prompt)
+    # 缓存命中时一次性返回完整内容
+    use_cache = llm_cache.enabled(task)
+    if use_cache:
+        cached = await llm_cache.get(task, model, now_prompt)
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    extra = {"stream_options": {"include_usage": True}} if LLM_STREAM_USAGE else {}
+    try:
+        async with llm_scheduler.slot():
+            with span("llm_stream", task=task):
+                stream = await _chat_completion(task, model, messages, stream=True, **extra)
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        record_llm_usage(task, chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"OpenAI error: {str(e)}"
+        )
+    if use_cache:
+        await llm_cache.set(task, model, now_prompt, "".join(parts))
+
+
+def _normalize_text(text: str) -> str:
+    # 清理多余空白字符
+    text = text.replace('\r\n', '\n').replace('\r', '\n')  # 统一换行符
+    text = re.sub(r'\n\s*\n', '\n\n', text)  # 合并多个空行
+    text = re.sub(r'[ \t]+', ' ', text)  # 合并多个空格
+    return text.strip()
+
+
+def _clean_with_bs4(html_content: str) -> str:
+    # 使用BeautifulSoup解析HTML
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    # 移除不需要的标签和内容
+    # 移除样式和脚本标签
+    for tag in soup(["style", "script", "meta", "link"]):
+        tag.decompose()
+
+    # 提取文本内容
+    return _normalize_text(soup.get_text())
+
+
+# 以下常量复刻 BeautifulSoup(html.parser) + get_text() 的行为，保证两种引擎输出一致
+_ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+_DROPPED_TAGS = {"style", "script", "meta", "link"}  # 整体移除（保留尾随文本）
+_SKIPPED_TEXT_TAGS = {"rt", "rp", "template"}  # bs4 的 get_text() 默认不输出这些标签内的文本
+_PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}  # bs4 不折叠这些标签内的空白
+_XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>')
+# lxml 与 html.parser 解析结果不同的结构，遇到时交给 bs4 处理：
+# CDATA、textarea，以及 </html> 之后还有内容（lxml 会丢弃，注释与空白除外）
+_LXML_UNSAFE = re.compile(r'<!\[CDATA\[|<textarea|</html\s*>(?!\s*(?:<!--.*?-->\s*)*$)', re.IGNORECASE | re.DOTALL)
+_LXML_PARSER = etree.HTMLParser() if etree is not None else None
+
+
+def _bs4_string(data: str, preserve: bool) -> str:
+    """bs4 会把只含 ASCII 空白的字符串折叠为一个换行（含换行时）或一个空格"""
+    if preserve or data.strip(_ASCII_SPACES):
+        return data
+    return "\n" if "\n" in data else " "
+
+
+def _clean_with_lxml(html_content: str) -> str:
+    # 带编码声明的 str 会被 lxml 拒绝；bs4 把它当作处理指令忽略，这里直接去掉
+    html_content = _XML_DECLARATION.sub("", html_content, count=1)
+    root = etree.fromstring(html_content, _LXML_PARSER)
+    if root is None:
+        return ""
+
+    parts = []
+    # 栈中记录 (是否跳过文本, 是否保留空白)，元素的 text 属于自身，tail 属于父元素
+    stack = [(False, False)]
+    for event, el in etree.iterwalk(root, events=("start", "end", "comment", "pi")):
+        if event == "start":
+            skip, preserve = stack[-1]
+            tag = el.tag if isinstance(el.tag, str) else ""
+            skip = skip or tag in _DROPPED_TAGS or tag in _SKIPPED_TEXT_TAGS
+            preserve = preserve or tag in _PRESERVE_WHITESPACE_TAGS
+            stack.append((skip, preserve))
+            if el.text and not skip:
+                parts.append(_bs4_string(el.text, preserve))
+            continue
+        if event == "end":
+            stack.pop()
+        # end 事件与注释、处理指令都只输出尾随文本
+        skip, preserve = stack[-1]
+        if el.tail and not skip:
+            parts.append(_bs4_string(el.tail, preserve))
+    return _normalize_text("".join(parts))
+
+
+def clean_onenote_content(html_content: str) -> str:
+    """
+    清理OneNote页面HTML内容，提取纯文本内容用于AI分析
+
+    默认使用 lxml（C 实现，大页面约快一个数量级），输出与 BeautifulSoup 版本一致；
+    lxml 不可用、解析失败、遇到 CDATA / textarea 或 </html> 之后还有内容时回退到 BeautifulSoup。
+    """
+    if etree is not None and HTML_CLEAN_ENGINE == "lxml" and not _LXML_UNSAFE.search(html_content):
+        try:
+            return _clean_with_lxml(html_content)
+        except (ValueError, etree.LxmlError):
+            pass
+    return _clean_with_bs4(html_content)
+
+
+def llm_json_parse(content):
+    pattern = r"```json(.*?)```"
+    # 使用 findall 获取所有匹配项，并使用 re.DOTALL 标志
+    matches = re.findall(pattern, content, re.DOTALL)
+    # 解析 JSON 字符串
+    if matches:
+        content = matches[0]
+    content = json.loads(json_repair.repair_json(content, ensure_ascii=False))
+    return content
+
+def extract_full_html(text: str) -> str:
+    """
+    从输入文本中提取第一个完整的 HTML 文档（从 <!DOCTYPE html> 或 <html> 开始，到 </html> 结束）。
+
+    返回：
+        - 提取出的完整 HTML 字符串
+        - 如果未找到，返回空字符串
+    """
+    # 尝试匹配标准 HTML 文档（支持带或不带 DOCTYPE）
+    pattern = r'(<!DOCTYPE html\s*>?\s*<html[^>]*>.*?</html>)'
+    match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
+    if match:
+        return match.group(1).strip()
+
+    # 2. 如果没有 DOCTYPE，尝试匹配 <html>...</html>
+    pattern2 = r'(<html[^>]*>.*?</html>)'
+    match2 = re.search(pattern2, text, re.DOTALL | re.IGNORECASE)
+    if match2:
+        return match2.group(1).strip()
+
+    # 3. 如果没有 <html>，尝试匹配 <body>...</body>
+    pattern3 = r'(<body>.*?</body>)'
+    match3 = re.search(pattern3, text, re.DOTALL | re.IGNORECASE)
+    if match3:
+        return match3.group(1).strip()
+
+    # 4. 都不匹配，返回原文本
+    return text
+def extract_html_fragment(text: str) -> str:
+    """
+    从模型输出中提取可追加的 HTML 片段：去掉 Markdown 代码块标记，
+    若输出了完整文档则只保留 <body> 内部内容
+    """
+    match = re.search(r"```(?:html)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    if match:
+        text = match.group(1)
+    body = re.search(r"<body[^>]*>(.*?)</body>", text, re.DOTALL | re.IGNORECASE)
+    if body:
+        text = body.group(1)
+    return text.strip()
+
+
+if __name__=="__main__":
+    import asyncio
+    result=asyncio.run(llm_generate("question_generate", question_num=5,page_content="ssss"))
+    html="""
+    ```html
+<!DOCTYPE html>
+<html>
+  <head>
+    <title>page_title</title>
+    <meta name="created" content="创建时间" />
+  </head>
+  <body>
+    笔记内容
+  </body>
+</html>
+```
+    """
+    # result=extract_full_html(html)
+    print(result)
+    #